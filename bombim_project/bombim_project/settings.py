@@ -1,4 +1,5 @@
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -31,10 +32,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'main.middleware.StaticFilesMiddleware',
+    'main.metrics.MetricsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'main.profiler.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -67,10 +71,99 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Транзакция сразу берет блокировку записи: проверка и сохранение внутри
+        # atomic() (пересечения занятий в админке - conflicts.check_schedule,
+        # места на занятии - book_class и admission.process_batch) не перемежаются
+        # с другими пишущими транзакциями.
+        # Цена: так начинается любой atomic(), в том числе только читающий, -
+        # он ждет и держит блокировку записи всей базы до конца транзакции.
+        # Поэтому чтение без записи не оборачиваем в atomic(); чтения вне
+        # транзакции (autocommit) блокировку не берут.
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        # Тестовая база в файле: потоки в тестах на одновременность открывают свои соединения
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
 
+# Cache
+# Общий для всех воркеров кэш - Redis, если задан REDIS_URL; иначе кэш в памяти процесса
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+
+# Очередь записи (main.admission) хранит билеты в кэше: без Redis она работает только
+# в одном процессе (runserver). В остальных случаях занятия в режиме открытия
+# записывают напрямую
+ADMISSION_SINGLE_PROCESS = os.environ.get('ADMISSION_SINGLE_PROCESS', '1' if DEBUG else '') == '1'
+
+
+# Метрики (/metrics): общий каталог для воркеров gunicorn и токен для Prometheus
+METRICS_DIR = os.environ.get('METRICS_DIR')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+
+# Профили запросов по X-Profile: 1 (main.profiler)
+PROFILER_DIR = os.environ.get('PROFILER_DIR', BASE_DIR / 'profiles')
+
+
+# Email (напоминания о занятиях, см. send_reminders)
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS') == '1'
+DEFAULT_FROM_EMAIL = 'Bombim <info@bombim.ru>'
+
+
+# Абонементы (main.passes): True - без абонемента с остатком записаться нельзя
+CLASS_PASS_REQUIRED = os.environ.get('CLASS_PASS_REQUIRED') == '1'
+
+
+# Сколько секунд хранить ответы на запросы с Idempotency-Key (main.idempotency)
+IDEMPOTENCY_TTL = int(os.environ.get('IDEMPOTENCY_TTL', str(60 * 60 * 24)))
+
+# Сколько секунд действует код клиента для отметки на ресепшене (main.checkin)
+CHECKIN_TOKEN_MAX_AGE = int(os.environ.get('CHECKIN_TOKEN_MAX_AGE', str(60 * 60 * 24)))
+
+
+# Outbox событий (main.outbox): потребители не читают события моложе этого числа секунд,
+# значение должно быть больше самой длинной транзакции записи
+OUTBOX_SETTLE_SECONDS = int(os.environ.get('OUTBOX_SETTLE_SECONDS', '2'))
+
+# refresh_stats (main.stats) читает изменения с таким запасом до прошлого водяного знака:
+# транзакция, начатая до пересчета и зафиксированная после, не теряется
+STATS_WATERMARK_OVERLAP = int(os.environ.get('STATS_WATERMARK_OVERLAP', '60'))
+
+
+# Лимиты запросов на пользователя (или IP) для main.throttling: 'количество/s|m|h|d'.
+# Единственный источник лимитов: endpoint, которого здесь нет, не ограничивается
+THROTTLE_RATES = {
+    'book': '20/m',
+    'cancel': '20/m',
+    'login': '10/m',
+    'signup': '5/m',
+    'profile': '10/h',  # профилирование запросов персоналом (main.profiler)
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -90,6 +183,18 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Хэширование паролей: PBKDF2 с настраиваемым числом итераций (main.hashers).
+# Число итераций выбирается по bench_hashers - это основная нагрузка на CPU при регистрации и входе
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', 1_000_000))
+PASSWORD_HASHERS = [
+    'main.hashers.ConfiguredPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.2/topics/i18n/
 
@@ -104,6 +209,17 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
+STATIC_ROOT = BASE_DIR / 'staticfiles'  # сюда собирает collectstatic
+
+# Хэшированные имена + .gz копии; отдаются main.middleware.StaticFilesMiddleware
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'main.storage.CompressedManifestStaticFilesStorage',
+    },
+}
 
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
@@ -115,6 +231,9 @@ MEDIA_ROOT = BASE_DIR / 'media'
 AUTH_USER_MODEL = 'main.User'
 
 # Authentication settings
+# Пользователь и сессия читаются из кэша; в БД сессия пишется только при изменении
+AUTHENTICATION_BACKENDS = ['main.backends.CachedModelBackend']
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
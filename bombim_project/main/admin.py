@@ -1,9 +1,16 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
 from django import forms
 from django.core.exceptions import ValidationError
+from django.shortcuts import redirect, render
+from django.urls import path
 from datetime import datetime, time, timedelta
-from .models import User, DanceStyle, Trainer, Schedule, Booking
+from .models import (
+    User, DanceStyle, Trainer, TrainerAvailability, Room, Schedule, Booking, ClassPass, PassLedger, DailyClassStats,
+)
+from .importers import IMPORTERS, open_csv
+from .stats import report, group_labels
+from . import conflicts, search
 
 
 class ScheduleAdminForm(forms.ModelForm):
@@ -37,26 +44,64 @@ class ScheduleAdminForm(forms.ModelForm):
             if duration > timedelta(hours=5):
                 raise ValidationError("Занятие не может быть длиннее 5 часов")
 
-        # Проверка на пересечение занятий у преподавателя
+        # Пересечения у преподавателя и в зале - один запрос по индексу.
+        # Админка проверяет и сохраняет форму в одной транзакции, а
+        # check_schedule блокирует преподавателя и зал до ее конца
         if date and start_time and end_time and trainer:
-            conflicting_schedules = Schedule.objects.filter(
+            candidate = Schedule(
+                pk=self.instance.pk,
                 date=date,
+                start_time=start_time,
+                end_time=end_time,
                 trainer=trainer,
-                is_active=True
-            ).exclude(id=self.instance.id if self.instance else None)
-
-            for schedule in conflicting_schedules:
-                if (start_time < schedule.end_time and end_time > schedule.start_time):
-                    raise ValidationError(
-                        f"У преподавателя {trainer} уже есть занятие в это время: "
-                        f"{schedule.start_time}-{schedule.end_time}"
-                    )
+                room=cleaned_data.get('room'),
+            )
+            conflict = conflicts.check_schedule(candidate)
+            if conflict is not None:
+                raise ValidationError(conflicts.describe(candidate, conflict))
 
         return cleaned_data
 
 
+class CsvImportForm(forms.Form):
+    csv_file = forms.FileField(label='CSV файл')
+    dry_run = forms.BooleanField(label='Только проверить', required=False)
+
+
+class CsvImportMixin:
+    """Добавляет в список объектов страницу загрузки CSV (см. main.importers)"""
+    import_kind = None
+    change_list_template = 'admin/main/change_list_import.html'
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+        return [
+            path('import-csv/', self.admin_site.admin_view(self.import_csv_view), name='%s_%s_import_csv' % info),
+        ] + super().get_urls()
+
+    def import_csv_view(self, request):
+        form = CsvImportForm(request.POST or None, request.FILES or None)
+        result = None
+        if request.method == 'POST' and form.is_valid():
+            importer = IMPORTERS[self.import_kind](dry_run=form.cleaned_data['dry_run'])
+            result = importer.run(open_csv(form.cleaned_data['csv_file'].file))
+            if result.ok and not form.cleaned_data['dry_run']:
+                self.message_user(request, f'Импортировано записей: {result.created}', messages.SUCCESS)
+                return redirect('..')
+
+        return render(request, 'admin/main/import_csv.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': f'Импорт из CSV: {self.model._meta.verbose_name_plural}',
+            'form': form,
+            'result': result,
+            'columns': IMPORTERS[self.import_kind].required_columns,
+        })
+
+
 # Настройка отображения пользователей
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(CsvImportMixin, UserAdmin):
+    import_kind = 'clients'
     list_display = ('username', 'email', 'first_name', 'last_name', 'phone', 'role', 'is_staff')
     list_filter = ('role', 'is_staff', 'is_superuser')
     search_fields = ('username', 'email', 'first_name', 'last_name', 'phone')
@@ -72,15 +117,40 @@ class CustomUserAdmin(UserAdmin):
     )
 
 
+# Окна доступности для автоматического расписания (main.timetable)
+class TrainerAvailabilityInline(admin.TabularInline):
+    model = TrainerAvailability
+    extra = 0
+
+
+# Поиск в списке по полнотекстовому индексу вместо LIKE по нескольким полям
+class IndexedSearchMixin:
+    search_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        # Телефонов в индексе нет - цифры ищем обычным способом
+        if any(ch.isdigit() for ch in search_term):
+            return super().get_search_results(request, queryset, search_term)
+        ids = search.matching_ids(self.search_kind, search_term)
+        if ids is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=ids), False
+
+
 # Настройка отображения направлений танцев
-class DanceStyleAdmin(admin.ModelAdmin):
-    list_display = ('name',)
+class DanceStyleAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    search_kind = 'style'
+    list_display = ('name', 'weekly_classes')
+    list_editable = ('weekly_classes',)
     search_fields = ('name',)
     list_per_page = 20
 
 
 # Настройка отображения преподавателей
-class TrainerAdmin(admin.ModelAdmin):
+class TrainerAdmin(IndexedSearchMixin, CsvImportMixin, admin.ModelAdmin):
+    import_kind = 'trainers'
+    search_kind = 'trainer'
+    inlines = [TrainerAvailabilityInline]
     list_display = ('get_full_name', 'get_styles', 'get_phone')
     list_filter = ('styles',)
     search_fields = ('user__first_name', 'user__last_name', 'user__phone')
@@ -101,10 +171,12 @@ class TrainerAdmin(admin.ModelAdmin):
 
 
 # Настройка отображения расписания
-class ScheduleAdmin(admin.ModelAdmin):
+class ScheduleAdmin(CsvImportMixin, admin.ModelAdmin):
+    import_kind = 'schedule'
     form = ScheduleAdminForm
-    list_display = ('date', 'day_of_week_display', 'start_time', 'end_time', 'dance_style', 'trainer', 'max_participants', 'is_active')
-    list_filter = ('date', 'dance_style', 'trainer', 'is_active')
+    list_display = ('date', 'day_of_week_display', 'start_time', 'end_time', 'dance_style', 'trainer', 'room', 'max_participants', 'is_active', 'opening_mode')
+    list_filter = ('date', 'dance_style', 'trainer', 'room', 'is_active', 'opening_mode')
+    list_select_related = ('dance_style', 'trainer__user', 'room')
     search_fields = ('dance_style__name', 'trainer__user__first_name', 'trainer__user__last_name')
     list_editable = ('max_participants', 'is_active')
     list_per_page = 20
@@ -114,22 +186,137 @@ class ScheduleAdmin(admin.ModelAdmin):
         return obj.get_day_of_week_display()
     day_of_week_display.short_description = 'День недели'
 
+class RoomAdmin(admin.ModelAdmin):
+    list_display = ('name', 'capacity')
+    search_fields = ('name',)
+
+
 # Настройка отображения записей
+class EffectiveStatusFilter(admin.SimpleListFilter):
+    """Фильтр по статусу с учетом даты (незакрытая запись на прошедшее занятие - пропуск)"""
+    title = 'статус'
+    parameter_name = 'effective_status'
+
+    def lookups(self, request, model_admin):
+        return Booking.STATUS_CHOICES
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(effective_status=self.value())
+        return queryset
+
+
 class BookingAdmin(admin.ModelAdmin):
-    list_display = ('client', 'schedule_info', 'class_date', 'status')
-    list_filter = ('status', 'schedule__dance_style', 'schedule__trainer')
+    list_display = ('client', 'schedule_info', 'class_date', 'effective_status_display', 'status')
+    list_filter = (EffectiveStatusFilter, 'schedule__dance_style', 'schedule__trainer')
     search_fields = ('client__username', 'client__first_name', 'client__last_name')
     list_editable = ('status',)
     list_per_page = 20
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_effective_status()
+
     def schedule_info(self, obj):
         return f"{obj.schedule.date} {obj.schedule.start_time}-{obj.schedule.end_time} - {obj.schedule.dance_style.name}"
     schedule_info.short_description = 'Занятие'
 
+    def effective_status_display(self, obj):
+        return dict(Booking.STATUS_CHOICES).get(obj.effective_status, obj.effective_status)
+    effective_status_display.short_description = 'Фактический статус'
+    effective_status_display.admin_order_field = 'effective_status'
+
+
+# Журнал абонемента только для просмотра: остаток меняют запись, отмена и покупка
+class PassLedgerInline(admin.TabularInline):
+    model = PassLedger
+    fields = ('created_at', 'reason', 'delta', 'booking_id')
+    readonly_fields = fields
+    ordering = ('-id',)
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+
+class ClassPassAdmin(admin.ModelAdmin):
+    list_display = ('client', 'classes', 'balance', 'expires_at', 'created_at')
+    list_filter = ('classes',)
+    search_fields = ('client__username', 'client__first_name', 'client__last_name')
+    list_select_related = ('client',)
+    raw_id_fields = ('client',)
+    readonly_fields = ('balance',)
+    inlines = [PassLedgerInline]
+
+    def get_readonly_fields(self, request, obj=None):
+        # Размер абонемента фиксируется при покупке
+        return ('classes', 'balance') if obj else ('balance',)
+
+    def save_model(self, request, obj, form, change):
+        if not change:
+            obj.balance = obj.classes
+        super().save_model(request, obj, form, change)
+        if not change:
+            PassLedger.objects.create(class_pass=obj, delta=obj.classes, reason='purchase')
+
+
+# Отчеты по посещаемости - читают только агрегат DailyClassStats
+class DailyClassStatsAdmin(admin.ModelAdmin):
+    GROUPINGS = (
+        ('dance_style', 'Направление'),
+        ('trainer', 'Преподаватель'),
+        ('day_of_week', 'День недели'),
+        ('hour', 'Час начала'),
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        group_by = request.GET.get('group_by', 'dance_style')
+        if group_by not in dict(self.GROUPINGS):
+            group_by = 'dance_style'
+
+        queryset = DailyClassStats.objects.all()
+        date_from = request.GET.get('date_from')
+        date_to = request.GET.get('date_to')
+        try:
+            if date_from:
+                queryset = queryset.filter(date__gte=datetime.strptime(date_from, '%Y-%m-%d').date())
+            if date_to:
+                queryset = queryset.filter(date__lte=datetime.strptime(date_to, '%Y-%m-%d').date())
+        except ValueError:
+            self.message_user(request, 'Даты должны быть в формате ГГГГ-ММ-ДД', messages.ERROR)
+
+        labels = group_labels(group_by)
+        rows = report(queryset, group_by)
+        for row in rows:
+            row['label'] = labels.get(row[group_by], row[group_by])
+
+        return render(request, 'admin/main/class_stats_dashboard.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Посещаемость и заполняемость',
+            'groupings': self.GROUPINGS,
+            'group_by': group_by,
+            'date_from': date_from or '',
+            'date_to': date_to or '',
+            'rows': rows,
+        })
+
 
 # Регистрируем все модели
 admin.site.register(User, CustomUserAdmin)
 admin.site.register(DanceStyle, DanceStyleAdmin)
 admin.site.register(Trainer, TrainerAdmin)
+admin.site.register(Room, RoomAdmin)
 admin.site.register(Schedule, ScheduleAdmin)
-admin.site.register(Booking, BookingAdmin)
\ No newline at end of file
+admin.site.register(Booking, BookingAdmin)
+admin.site.register(ClassPass, ClassPassAdmin)
+admin.site.register(DailyClassStats, DailyClassStatsAdmin)
\ No newline at end of file
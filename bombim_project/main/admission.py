@@ -0,0 +1,261 @@
+"""Очередь записи на занятия в режиме открытия (Schedule.opening_mode).
+
+В этом режиме book_class не пишет в базу: заявка получает номер через
+атомарный incr в кэше и сразу возвращает клиенту билет. Единственный
+обработчик (в каждый момент его держит один процесс через блокировку в
+кэше) забирает заявки по порядку номеров и записывает их пачками,
+одна транзакция на пачку. Клиент опрашивает результат по билету.
+
+Билеты, заявки и результаты живут только в кэше, поэтому очередь
+включается, только если кэш общий для всех процессов (Redis) или
+процесс один (settings.ADMISSION_SINGLE_PROCESS, например runserver).
+Иначе book_class записывает напрямую, под блокировкой строки занятия.
+
+Блокировка обработчика продлевается перед каждой пачкой; потерявший ее
+обработчик останавливается, так что одно занятие не разбирают двое.
+Заявка, пропавшая из кэша, получает окончательный результат EXPIRED.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from datetime import datetime
+
+from . import metrics, outbox, passes
+from .models import Schedule, Booking
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+ENTRY_TIMEOUT = 60 * 30
+RESULT_TIMEOUT = 60 * 60
+WORKER_LOCK_KEY = 'admission:worker'
+WORKER_LOCK_TIMEOUT = 10
+IDLE_WAIT = 0.2
+MISSING_GRACE = 5
+
+PENDING = 'pending'
+EXPIRED = 'expired'
+LOCAL_CACHES = ('LocMemCache', 'DummyCache')
+
+_wakeup = threading.Event()
+_worker_started = False
+_worker_guard = threading.Lock()
+_missing_since = {}
+
+
+def _seq_key(schedule_id):
+    return f'admission:{schedule_id}:seq'
+
+
+def _head_key(schedule_id):
+    return f'admission:{schedule_id}:head'
+
+
+def _entry_key(schedule_id, number):
+    return f'admission:{schedule_id}:{number}'
+
+
+def _result_key(ticket):
+    return f'admission:result:{ticket}'
+
+
+def enabled():
+    """Можно ли принимать заявки в очередь: билет должен быть виден любому процессу"""
+    if getattr(settings, 'ADMISSION_SINGLE_PROCESS', False):
+        return True
+    return not settings.CACHES['default']['BACKEND'].endswith(LOCAL_CACHES)
+
+
+def enqueue(schedule_id, user_id):
+    """Ставит заявку в очередь и возвращает билет вида '<schedule_id>-<номер>'"""
+    cache.add(_seq_key(schedule_id), 0, None)
+    number = cache.incr(_seq_key(schedule_id))
+    ticket = f'{schedule_id}-{number}'
+
+    cache.set(_result_key(ticket), {'status': PENDING, 'user_id': user_id}, RESULT_TIMEOUT)
+    cache.set(_entry_key(schedule_id, number), user_id, ENTRY_TIMEOUT)
+
+    if getattr(settings, 'ADMISSION_INPROCESS_WORKER', True):
+        ensure_worker()
+    _wakeup.set()
+    return ticket
+
+
+def get_result(ticket, user_id):
+    """Результат заявки или None, если билет чужой или неизвестен"""
+    result = cache.get(_result_key(ticket))
+    if result is None or result.get('user_id') != user_id:
+        return None
+    return result
+
+
+def _expire(schedule_id, number):
+    """Окончательный результат для заявки, которая пропала из кэша до обработки"""
+    key = _result_key(f'{schedule_id}-{number}')
+    result = cache.get(key)
+    if result is not None and result['status'] == PENDING:
+        metrics.inc('bombim_booking_outcomes_total', outcome='expired')
+        cache.set(key, {'status': EXPIRED, 'user_id': result['user_id'], 'success': False,
+                        'error': 'Заявка потеряна, попробуйте записаться еще раз'}, RESULT_TIMEOUT)
+
+
+def _finish(ticket, user_id, success, text, outcome):
+    metrics.inc('bombim_booking_outcomes_total', outcome=outcome)
+    result = {'status': 'done', 'user_id': user_id, 'success': success}
+    result['message' if success else 'error'] = text
+    return _result_key(ticket), result
+
+
+def process_batch(schedule_id, entries):
+    """
+    Записывает пачку заявок [(номер, user_id), ...] в одной транзакции.
+
+    Места раздаются строго в порядке номеров. Возвращает словарь
+    {ключ результата: результат} для записи в кэш.
+    """
+    results = {}
+    with transaction.atomic():
+        try:
+            schedule = Schedule.objects.select_for_update().get(id=schedule_id)
+        except Schedule.DoesNotExist:
+            for number, user_id in entries:
+                key, value = _finish(f'{schedule_id}-{number}', user_id, False, 'Занятие не найдено', 'not_found')
+                results[key] = value
+            return results
+
+        class_datetime = timezone.make_aware(datetime.combine(schedule.date, schedule.start_time))
+        is_past = class_datetime <= timezone.now()
+        free = schedule.max_participants - schedule.bookings.filter(status='booked').count()
+        booked_users = set(
+            Booking.objects.filter(schedule=schedule, client_id__in=[user_id for _, user_id in entries])
+            .values_list('client_id', flat=True)
+        )
+
+        new_bookings = []
+        for number, user_id in entries:
+            ticket = f'{schedule_id}-{number}'
+            if user_id in booked_users:
+                key, value = _finish(ticket, user_id, False, 'Вы уже записаны на это занятие', 'duplicate')
+            elif is_past:
+                key, value = _finish(ticket, user_id, False, 'Невозможно записаться на прошедшее занятие', 'past')
+            elif free <= 0:
+                key, value = _finish(ticket, user_id, False, 'Нет свободных мест на это занятие', 'full')
+            else:
+                pass_id = passes.charge(user_id)
+                if pass_id is None and passes.required():
+                    key, value = _finish(ticket, user_id, False, 'Нет абонемента с оставшимися занятиями', 'no_pass')
+                else:
+                    new_bookings.append(Booking(
+                        client_id=user_id,
+                        schedule=schedule,
+                        status='booked',
+                        class_date=schedule.date,
+                        class_pass_id=pass_id,
+                    ))
+                    booked_users.add(user_id)
+                    free -= 1
+                    key, value = _finish(ticket, user_id, True, 'Запись успешно оформлена', 'success')
+            results[key] = value
+
+        Booking.objects.bulk_create(new_bookings)
+        outbox.record_bookings('created', new_bookings)
+        passes.record_charges(new_bookings)
+    return results
+
+
+def drain(schedule_id, batch_size=BATCH_SIZE, renew=None):
+    """
+    Обрабатывает все накопившиеся заявки одного занятия. Возвращает их количество.
+
+    renew() вызывается перед каждой пачкой; False - блокировка потеряна, выходим.
+    """
+    processed = 0
+    while True:
+        if renew is not None and not renew():
+            return processed
+        head = cache.get(_head_key(schedule_id), 0)
+        last = min(cache.get(_seq_key(schedule_id), 0), head + batch_size)
+        if last <= head:
+            return processed
+
+        stored = cache.get_many([_entry_key(schedule_id, n) for n in range(head + 1, last + 1)])
+        entries = []
+        upto = head
+        for number in range(head + 1, last + 1):
+            user_id = stored.get(_entry_key(schedule_id, number))
+            if user_id is None:
+                # Номер уже выдан, но заявка еще не записана в кэш - ждем немного,
+                # иначе считаем ее вытесненной и пропускаем
+                first_seen = _missing_since.setdefault((schedule_id, number), time.monotonic())
+                if time.monotonic() - first_seen < MISSING_GRACE:
+                    break
+                _expire(schedule_id, number)
+            else:
+                entries.append((number, user_id))
+            _missing_since.pop((schedule_id, number), None)
+            upto = number
+
+        if upto == head:
+            return processed
+
+        results = process_batch(schedule_id, entries) if entries else {}
+        cache.set_many(results, RESULT_TIMEOUT)
+        cache.set(_head_key(schedule_id), upto, None)
+        cache.delete_many([_entry_key(schedule_id, n) for n in range(head + 1, upto + 1)])
+        processed += len(entries)
+
+
+def drain_all():
+    """Один проход по всем занятиям в режиме открытия под общей блокировкой"""
+    token = f'{os.getpid()}:{threading.get_ident()}'
+    if not cache.add(WORKER_LOCK_KEY, token, WORKER_LOCK_TIMEOUT):
+        return 0
+
+    def renew():
+        # Пачка короче WORKER_LOCK_TIMEOUT, поэтому продления перед каждой достаточно
+        if cache.get(WORKER_LOCK_KEY) != token:
+            logger.warning('Блокировка обработчика очереди записи потеряна')
+            return False
+        return cache.touch(WORKER_LOCK_KEY, WORKER_LOCK_TIMEOUT)
+
+    try:
+        processed = 0
+        for schedule_id in Schedule.objects.filter(opening_mode=True).values_list('id', flat=True):
+            if not renew():
+                break
+            processed += drain(schedule_id, renew=renew)
+        return processed
+    finally:
+        if cache.get(WORKER_LOCK_KEY) == token:
+            cache.delete(WORKER_LOCK_KEY)
+
+
+def run_worker(stop_event=None):
+    """Бесконечный цикл обработчика (поток или команда drain_admissions)"""
+    while stop_event is None or not stop_event.is_set():
+        _wakeup.wait(IDLE_WAIT)
+        _wakeup.clear()
+        try:
+            drain_all()
+        except Exception:
+            logger.exception('Ошибка при обработке очереди записи')
+        finally:
+            close_old_connections()
+
+
+def ensure_worker():
+    """Запускает фоновый поток-обработчик в текущем процессе (один раз)"""
+    global _worker_started
+    if _worker_started:
+        return
+    with _worker_guard:
+        if not _worker_started:
+            threading.Thread(target=run_worker, name='admission-worker', daemon=True).start()
+            _worker_started = True
@@ -1,6 +1,14 @@
 from django.apps import AppConfig
+from django.contrib.auth import password_validation
 
 
 class MainConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'main'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+
+        # Валидаторы паролей создаются при первой регистрации, а CommonPasswordValidator
+        # при этом читает сжатый список из 20 000 паролей - делаем это при запуске воркера
+        password_validation.get_default_password_validators()
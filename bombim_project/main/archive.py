@@ -0,0 +1,103 @@
+"""Перенос старых занятий и записей в архивные таблицы.
+
+Горячие таблицы Schedule и Booking содержат только занятия новее горизонта,
+поэтому запросы расписания и кабинетов не замедляются с годами. Архив
+читается только по запросу (история в профиле, пересчет статистики).
+Перенос идет пачками по возрастанию id, каждая пачка в своей транзакции:
+уже перенесенные строки из горячих таблиц удалены, так что прерванный
+запуск просто продолжается со следующей пачки.
+
+Перенос - не удаление: строки убираются из горячих таблиц без сигналов
+(_raw_delete), поэтому outbox не получает событий 'deleted' (занятия не
+отменялись), а StatsDirtyDate - дат (агрегат считает и архив, цифры
+за эти даты не меняются). Напоминания о записях удаляются вместе с ними.
+"""
+import time
+
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import Schedule, Booking, BookingReminder, ArchivedSchedule, ArchivedBooking
+
+
+SCHEDULE_FIELDS = ('id', 'date', 'day_of_week', 'start_time', 'end_time', 'dance_style_id',
+                   'trainer_id', 'room_id', 'max_participants', 'is_active')
+BOOKING_FIELDS = ('id', 'client_id', 'schedule_id', 'booking_date', 'status', 'class_date', 'class_pass_id')
+
+
+def _raw_delete(queryset):
+    """DELETE без сигналов и каскадов Django"""
+    queryset._raw_delete(queryset.db)
+
+
+def archive_chunk(cutoff, after_id, chunk_size):
+    """
+    Переносит до chunk_size занятий с датой раньше cutoff и id больше after_id.
+
+    Возвращает (последний id пачки или None, занятий, записей).
+    """
+    with transaction.atomic():
+        schedules = list(
+            Schedule.objects.filter(date__lt=cutoff, id__gt=after_id)
+            .order_by('id')
+            .values(*SCHEDULE_FIELDS)[:chunk_size]
+        )
+        if not schedules:
+            return None, 0, 0
+
+        ids = [row['id'] for row in schedules]
+        # В архив попадают прошедшие занятия: незакрытые записи сохраняются как пропуск
+        bookings = list(
+            Booking.objects.filter(schedule_id__in=ids)
+            .with_effective_status(cutoff)
+            .values(*BOOKING_FIELDS, 'effective_status')
+        )
+        for row in bookings:
+            row['status'] = row.pop('effective_status')
+
+        ArchivedSchedule.objects.bulk_create(
+            [ArchivedSchedule(**row) for row in schedules], batch_size=500, ignore_conflicts=True
+        )
+        ArchivedBooking.objects.bulk_create(
+            [ArchivedBooking(**row) for row in bookings], batch_size=500, ignore_conflicts=True
+        )
+        _raw_delete(BookingReminder.objects.filter(booking__schedule_id__in=ids))
+        _raw_delete(Booking.objects.filter(schedule_id__in=ids))
+        _raw_delete(Schedule.objects.filter(id__in=ids))
+    return ids[-1], len(schedules), len(bookings)
+
+
+def archive_before(cutoff, chunk_size=500, pause=0.0, progress=None):
+    """Переносит в архив все занятия раньше cutoff. Возвращает (занятий, записей)"""
+    after_id = 0
+    total_schedules = total_bookings = 0
+    while True:
+        after_id, schedules, bookings = archive_chunk(cutoff, after_id, chunk_size)
+        if after_id is None:
+            return total_schedules, total_bookings
+        total_schedules += schedules
+        total_bookings += bookings
+        if progress:
+            progress(after_id, total_schedules, total_bookings)
+        if pause:
+            time.sleep(pause)
+
+
+def archived_history(client):
+    """Архивные записи клиента в том же виде, что и Booking для шаблонов"""
+    return (
+        ArchivedBooking.objects.filter(client=client)
+        .annotate(effective_status=F('status'))
+        .select_related('schedule', 'schedule__dance_style', 'schedule__trainer', 'schedule__trainer__user')
+        .order_by('-class_date')
+    )
+
+
+def archived_counts(client):
+    """Счетчики статусов по архиву клиента одним запросом"""
+    return ArchivedBooking.objects.filter(client=client).aggregate(
+        total=Count('id'),
+        attended=Count('id', filter=Q(status='attended')),
+        missed=Count('id', filter=Q(status='missed')),
+        cancelled=Count('id', filter=Q(status='cancelled')),
+    )
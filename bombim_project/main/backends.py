@@ -0,0 +1,38 @@
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from . import metrics
+from .models import User
+
+
+USER_CACHE_TIMEOUT = 60 * 5
+
+
+def cached_user_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def invalidate_cached_user(user_id):
+    cache.delete(cached_user_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend, который держит авторизованного пользователя в кэше.
+
+    Вместе с пользователем кэшируется его профиль преподавателя, поэтому
+    request.user.trainer_profile тоже не делает запроса. Кэш сбрасывается
+    сигналами при сохранении User/Trainer и при выходе (см. signals).
+    """
+
+    def get_user(self, user_id):
+        key = cached_user_key(user_id)
+        user = cache.get(key)
+        metrics.inc('bombim_cache_requests_total', cache='user', result='hit' if user else 'miss')
+        if user is None:
+            try:
+                user = User._default_manager.select_related('trainer_profile').get(pk=user_id)
+            except User.DoesNotExist:
+                return None
+            cache.set(key, user, USER_CACHE_TIMEOUT)
+        return user if self.user_can_authenticate(user) else None
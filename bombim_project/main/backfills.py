@@ -0,0 +1,158 @@
+"""Заполнение новых и денормализованных столбцов на больших таблицах.
+
+Backfill описывается классом: модель, поля для bulk_update и метод fix(obj),
+который исправляет одну строку. Запуск - команда backfill; миграции только
+добавляют столбцы и не держат долгих блокировок. После migrate незавершенные
+backfill запускают командой ``backfill --all``: например, до user_search_keys
+ресепшен не находит старых клиентов по телефону и фамилии.
+
+Таблица проходится диапазонами первичного ключа ``(position, position +
+chunk_size]`` до максимального id на момент первого запуска (новые строки
+уже пишет исправленный код). Каждый диапазон - своя транзакция, в ней же
+сдвигается BackfillCheckpoint, поэтому прерванный запуск продолжается с
+последнего записанного диапазона, а не с начала. Между диапазонами -
+пауза, чтобы не мешать записи на занятия.
+
+bulk_update не отправляет сигналы и не пишет события outbox: backfill
+исправляет производные поля, а не состояние записей.
+"""
+import time
+
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .models import User, Schedule, Booking, BackfillCheckpoint
+
+
+CHUNK_SIZE = 1000
+PAUSE = 0.05
+
+
+class Backfill:
+    """name - ключ контрольной точки, fields - поля для bulk_update"""
+    name = None
+    description = ''
+    model = None
+    fields = ()
+    chunk_size = CHUNK_SIZE
+
+    def queryset(self):
+        """Строки, которые нужно проверить (диапазон id добавляет run)"""
+        return self.model._default_manager.all()
+
+    def fix(self, obj):
+        """Исправляет obj. Возвращает True, если строку нужно сохранить"""
+        raise NotImplementedError
+
+
+BACKFILLS = {}
+
+
+def register(backfill_class):
+    BACKFILLS[backfill_class.name] = backfill_class()
+    return backfill_class
+
+
+@register
+class UserSearchKeys(Backfill):
+    name = 'user_search_keys'
+    description = 'User.phone_digits и User.name_key для поиска на ресепшене'
+    model = User
+    fields = ('phone_digits', 'name_key')
+
+    def queryset(self):
+        return User.objects.only('id', 'phone', 'first_name', 'last_name', 'phone_digits', 'name_key')
+
+    def fix(self, user):
+        before = (user.phone_digits, user.name_key)
+        user.fill_search_keys()
+        return (user.phone_digits, user.name_key) != before
+
+
+@register
+class ScheduleDayOfWeek(Backfill):
+    name = 'schedule_day_of_week'
+    description = 'Schedule.day_of_week по дате занятия'
+    model = Schedule
+    fields = ('day_of_week',)
+
+    def queryset(self):
+        return Schedule.objects.only('id', 'date', 'day_of_week')
+
+    def fix(self, schedule):
+        if schedule.day_of_week == schedule.date.weekday():
+            return False
+        schedule.day_of_week = schedule.date.weekday()
+        return True
+
+
+@register
+class BookingClassDate(Backfill):
+    name = 'booking_class_date'
+    description = 'Booking.class_date по дате занятия у старых записей'
+    model = Booking
+    fields = ('class_date',)
+
+    def queryset(self):
+        return Booking.objects.filter(class_date__isnull=True).select_related('schedule').only(
+            'id', 'class_date', 'schedule__date'
+        )
+
+    def fix(self, booking):
+        booking.class_date = booking.schedule.date
+        return True
+
+
+def run(backfill, chunk_size=None, pause=PAUSE, reset=False, progress=None):
+    """
+    Проходит таблицу backfill с последней контрольной точки.
+
+    progress(checkpoint, доля пройденного, секунд до конца)
+    вызывается после каждого диапазона. Возвращает BackfillCheckpoint.
+    """
+    chunk_size = chunk_size or backfill.chunk_size
+    if reset:
+        BackfillCheckpoint.objects.filter(name=backfill.name).delete()
+
+    checkpoint = BackfillCheckpoint.objects.filter(name=backfill.name).first()
+    if checkpoint is None:
+        bounds = backfill.model._default_manager.aggregate(low=Min('pk'), high=Max('pk'))
+        lower = (bounds['low'] or 1) - 1
+        checkpoint = BackfillCheckpoint.objects.create(
+            name=backfill.name, lower=lower, position=lower, upper=bounds['high'] or 0,
+        )
+    if checkpoint.finished_at is not None:
+        return checkpoint
+
+    resumed_at = checkpoint.position
+    started = time.monotonic()
+    while checkpoint.position < checkpoint.upper:
+        end = min(checkpoint.position + chunk_size, checkpoint.upper)
+        with transaction.atomic():
+            rows = list(
+                backfill.queryset().filter(pk__gt=checkpoint.position, pk__lte=end).select_for_update(of=('self',))
+            )
+            changed = [obj for obj in rows if backfill.fix(obj)]
+            if changed:
+                backfill.model._default_manager.bulk_update(changed, backfill.fields)
+            checkpoint.position = end
+            checkpoint.processed += len(rows)
+            checkpoint.changed += len(changed)
+            if checkpoint.position >= checkpoint.upper:
+                checkpoint.finished_at = timezone.now()
+            checkpoint.save()
+
+        if progress is not None:
+            # Скорость считаем только по этому запуску, долю - по всему диапазону
+            done = checkpoint.position - resumed_at
+            left = checkpoint.upper - checkpoint.position
+            eta = (time.monotonic() - started) / done * left
+            progress(checkpoint, (checkpoint.position - checkpoint.lower) / (checkpoint.upper - checkpoint.lower), eta)
+        if pause and checkpoint.position < checkpoint.upper:
+            time.sleep(pause)
+
+    if checkpoint.finished_at is None:
+        checkpoint.finished_at = timezone.now()
+        checkpoint.save(update_fields=['finished_at', 'updated_at'])
+    return checkpoint
@@ -0,0 +1,79 @@
+"""Кэш целых страниц каталога для анонимных посетителей.
+
+Ключ страницы включает язык, путь с параметрами и версию каталога. Версия
+меняется сигналами при сохранении направлений, преподавателей и
+пользователей, поэтому инвалидировать отдельные страницы не нужно: старые
+ключи просто перестают использоваться и вытесняются по таймауту.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import translation
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from . import metrics
+
+
+CATALOG_VERSION_KEY = 'catalog:version'
+PAGE_TIMEOUT = 60 * 15
+
+
+def catalog_version():
+    """Текущая версия каталога (время последнего изменения в наносекундах)"""
+    return cache.get_or_set(CATALOG_VERSION_KEY, time.time_ns, None)
+
+
+def bump_catalog_version(**kwargs):
+    """Обработчик сигналов: делает все закэшированные страницы каталога устаревшими"""
+    cache.set(CATALOG_VERSION_KEY, time.time_ns(), None)
+
+
+def cache_anonymous_page(timeout=PAGE_TIMEOUT):
+    """
+    Кэширует ответ view целиком, если посетитель не авторизован.
+
+    Авторизованные пользователи всегда получают свежую страницу. Ответ
+    снабжается ETag и Last-Modified, так что повторный запрос браузера
+    с If-None-Match завершается 304 без тела.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.user.is_authenticated or request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            version = catalog_version()
+            key = 'page:%s:%s:%s' % (
+                version,
+                translation.get_language(),
+                hashlib.md5(request.get_full_path().encode()).hexdigest(),
+            )
+            cached = cache.get(key)
+            metrics.inc('bombim_cache_requests_total', cache='page', result='hit' if cached else 'miss')
+            if cached is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming:
+                    return response
+                cached = (
+                    response.content,
+                    response['Content-Type'],
+                    '"%s"' % hashlib.md5(response.content).hexdigest(),
+                )
+                cache.set(key, cached, timeout)
+
+            content, content_type, etag = cached
+            last_modified = version // 1_000_000_000
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = HttpResponse(content, content_type=content_type)
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            patch_cache_control(response, max_age=0, must_revalidate=True)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,110 @@
+"""Отметка прихода клиентов на ресепшене.
+
+Клиента ищут по началу телефона или фамилии (и имени). Для этого у User
+есть нормализованные столбцы phone_digits ("79991234567") и name_key
+("иванова анна") с индексами: поиск по началу - это диапазон
+``key >= запрос AND key < запрос + максимальный символ``, который идет по
+индексу на любой базе (LIKE в SQLite не различает регистр только для
+латиницы и по обычному индексу не ищет).
+
+В профиле у клиента есть код для отметки: id клиента и время выдачи,
+подписанные HMAC (signing.TimestampSigner, соль SALT). Код проверяется без
+запроса к базе, подделать его без SECRET_KEY нельзя, а действует он
+settings.CHECKIN_TOKEN_MAX_AGE секунд: подсмотренный или сохраненный код
+через сутки бесполезен. Профиль при каждом открытии показывает новый код.
+Отметка переводит одну запись на сегодня из booked в attended одним UPDATE.
+"""
+import re
+
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.utils import timezone
+
+from . import outbox
+from .models import User, Booking, phone_digits, name_key
+
+
+SALT = 'main.checkin'
+MAX_RESULTS = 20
+MIN_PHONE_DIGITS = 3
+PHONE_QUERY_RE = re.compile(r'^[\d\s()+-]+$')
+
+
+def token_max_age():
+    return getattr(settings, 'CHECKIN_TOKEN_MAX_AGE', 60 * 60 * 24)
+
+
+def client_token(user):
+    """Код клиента для отметки (его можно показать QR-кодом)"""
+    return signing.TimestampSigner(salt=SALT).sign(str(user.pk))
+
+
+def read_token(value):
+    """id клиента из кода или None, если код не наш, подделан или устарел"""
+    try:
+        return int(signing.TimestampSigner(salt=SALT).unsign(value.strip(), max_age=token_max_age()))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def _prefix(queryset, field, prefix, end):
+    return queryset.filter(**{f'{field}__gte': prefix, f'{field}__lt': prefix + end}).order_by(field)
+
+
+def find_clients(query):
+    """
+    Клиенты по коду, началу телефона или началу "фамилия имя".
+
+    Возвращает (клиенты, id клиента из кода или None).
+    """
+    clients = User.objects.filter(role='client')
+    query = query.strip()
+    client_id = read_token(query) if ':' in query else None
+    if client_id is not None:
+        return list(clients.filter(id=client_id)), client_id
+
+    if PHONE_QUERY_RE.match(query):
+        digits = re.sub(r'\D', '', query)
+        if len(digits) < MIN_PHONE_DIGITS:
+            return [], None
+        # "8999..." и "999..." набирают без кода страны - ищем как "7999..."
+        if digits.startswith('8'):
+            digits = '7' + digits[1:]
+        elif digits.startswith('9'):
+            digits = '7' + digits
+        # Полный номер нормализуем так же, как при сохранении
+        if len(digits) >= 10:
+            digits = phone_digits(digits)
+        return list(_prefix(clients, 'phone_digits', digits, ':')[:MAX_RESULTS]), None
+
+    key = name_key(query, '')
+    if not key:
+        return [], None
+    return list(_prefix(clients, 'name_key', key, '\uffff')[:MAX_RESULTS]), None
+
+
+def todays_bookings(client_ids, today=None):
+    """{client_id: [записи на сегодня]} одним запросом"""
+    today = today or timezone.localdate()
+    result = {client_id: [] for client_id in client_ids}
+    for booking in (
+        Booking.objects.filter(client_id__in=client_ids, class_date=today)
+        .select_related('schedule', 'schedule__dance_style', 'schedule__trainer__user', 'schedule__room')
+        .order_by('schedule__start_time')
+    ):
+        result[booking.client_id].append(booking)
+    return result
+
+
+def check_in(booking_id, today=None):
+    """Отмечает приход по записи на сегодня. Возвращает True, если статус изменился"""
+    today = today or timezone.localdate()
+    with transaction.atomic():
+        updated = Booking.objects.filter(id=booking_id, class_date=today, status='booked').update(
+            status='attended', updated_at=timezone.now()
+        )
+        if updated:
+            booking = Booking.objects.filter(id=booking_id).only('id', 'schedule_id', 'client_id', 'class_date', 'status')
+            outbox.record_bookings('updated', booking)
+    return bool(updated)
@@ -0,0 +1,137 @@
+"""Пересечения занятий по преподавателю и по залу.
+
+Одно занятие (форма в админке) проверяется одним запросом: занятия того
+же дня у того же преподавателя или в том же зале, которые начинаются до
+конца нового и заканчиваются после его начала. Запрос идет по индексам
+(trainer, date, start_time) и (room, date, start_time).
+
+Много занятий сразу (импорт CSV, автоматическое расписание) проверяются
+проходом по отсортированным интервалам: существующие занятия загружаются
+одним запросом на весь диапазон дат, дальше все считается в памяти.
+
+Гонку двух одновременных правок закрывает select_for_update в
+check_schedule. В SQLite это пустая операция: блокировок строк там нет,
+и корректность держится только на transaction_mode: IMMEDIATE в
+settings.DATABASES (транзакция сразу берет блокировку записи на всю базу).
+Без этой настройки две транзакции могут обе не увидеть пересечения.
+"""
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Trainer, Room, Schedule
+
+
+def overlapping(schedule):
+    """Активные занятия, пересекающиеся со schedule у преподавателя или в зале"""
+    same_owner = Q(trainer_id=schedule.trainer_id)
+    if schedule.room_id:
+        same_owner |= Q(room_id=schedule.room_id)
+    return Schedule.objects.filter(
+        same_owner,
+        date=schedule.date,
+        is_active=True,
+        start_time__lt=schedule.end_time,
+        end_time__gt=schedule.start_time,
+    ).exclude(pk=schedule.pk)
+
+
+def check_schedule(schedule):
+    """
+    Первое пересечение для schedule или None.
+
+    Строки преподавателя и зала блокируются до конца внешней транзакции,
+    поэтому две одновременные правки с одним преподавателем или залом
+    проверяются по очереди и не могут обе пройти проверку. В SQLite
+    блокировки строк нет, там ту же роль играет BEGIN IMMEDIATE
+    (transaction_mode в settings.DATABASES).
+    """
+    with transaction.atomic():
+        list(Trainer.objects.select_for_update().filter(pk=schedule.trainer_id).values_list('pk'))
+        if schedule.room_id:
+            list(Room.objects.select_for_update().filter(pk=schedule.room_id).values_list('pk'))
+        return overlapping(schedule).select_related('room').first()
+
+
+def describe(schedule, other):
+    """Сообщение о пересечении schedule с существующим занятием other"""
+    if other.trainer_id == schedule.trainer_id:
+        return (
+            f"У преподавателя {schedule.trainer} уже есть занятие в это время: "
+            f"{other.start_time}-{other.end_time}"
+        )
+    return f"Зал \"{other.room}\" уже занят в это время: {other.start_time}-{other.end_time}"
+
+
+def _keys(schedule):
+    yield 'trainer', schedule.trainer_id
+    if schedule.room_id:
+        yield 'room', schedule.room_id
+
+
+EXISTING_MESSAGES = {
+    'trainer': 'У преподавателя уже есть занятие {date} в это время: {start:%H:%M}-{end:%H:%M}',
+    'room': 'Зал уже занят {date} в это время: {start:%H:%M}-{end:%H:%M}',
+}
+BATCH_MESSAGES = {
+    'trainer': 'Занятие пересекается с другой строкой файла ({date} {start:%H:%M}, тот же преподаватель)',
+    'room': 'Занятие пересекается с другой строкой файла ({date} {start:%H:%M}, тот же зал)',
+}
+
+
+def find_conflicts(new_schedules):
+    """
+    Ищет пересечения новых занятий с уже существующими и между собой.
+
+    Сохраненные занятия из new_schedules сравниваются с остальными, но не
+    сами с собой, так что функцией можно проверить и уже записанное
+    расписание. Возвращает {id(schedule): сообщение} для отклоненных занятий.
+    """
+    if not new_schedules:
+        return {}
+    dates = [s.date for s in new_schedules]
+    trainer_ids = {s.trainer_id for s in new_schedules}
+    room_ids = {s.room_id for s in new_schedules if s.room_id}
+    own_ids = {s.pk for s in new_schedules if s.pk}
+
+    existing = defaultdict(list)
+    for schedule in Schedule.objects.filter(
+        Q(trainer_id__in=trainer_ids) | Q(room_id__in=room_ids),
+        date__range=(min(dates), max(dates)),
+        is_active=True,
+    ).exclude(pk__in=own_ids).only('trainer_id', 'room_id', 'date', 'start_time', 'end_time'):
+        for kind, owner in _keys(schedule):
+            existing[(kind, owner, schedule.date)].append((schedule.start_time, schedule.end_time))
+
+    grouped = defaultdict(list)
+    for schedule in new_schedules:
+        for kind, owner in _keys(schedule):
+            grouped[(kind, owner, schedule.date)].append(schedule)
+
+    rejected = {}
+    # Сначала преподаватели: отклоненное по преподавателю занятие не занимает зал
+    for key in sorted(grouped, key=lambda key: key[0] != 'trainer'):
+        kind = key[0]
+        # Индекс существующих занятий: начала по возрастанию и префиксный максимум концов
+        intervals = sorted(existing.get(key, []))
+        starts = [start for start, _ in intervals]
+        max_ends = []
+        for _, end in intervals:
+            max_ends.append(max(end, max_ends[-1]) if max_ends else end)
+
+        # Проход по новым занятиям в порядке начала
+        busy_until = None
+        for schedule in sorted(grouped[key], key=lambda s: (s.start_time, s.end_time)):
+            if id(schedule) in rejected:
+                continue
+            fields = {'date': schedule.date, 'start': schedule.start_time, 'end': schedule.end_time}
+            idx = bisect_left(starts, schedule.end_time)
+            if idx and max_ends[idx - 1] > schedule.start_time:
+                rejected[id(schedule)] = EXISTING_MESSAGES[kind].format(**fields)
+            elif busy_until and schedule.start_time < busy_until:
+                rejected[id(schedule)] = BATCH_MESSAGES[kind].format(**fields)
+            else:
+                busy_until = max(busy_until, schedule.end_time) if busy_until else schedule.end_time
+    return rejected
@@ -2,11 +2,15 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_email
+from django.db.models import Q
 import re
 from datetime import date
 from .models import User
 
 class CustomUserCreationForm(UserCreationForm):
+    # Уникальные поля пользователя проверяются одним запросом (validate_unique)
+    UNIQUE_FIELDS = ('username', 'email', 'phone')
+
     phone = forms.CharField(
         max_length=20,
         required=True,
@@ -99,35 +103,31 @@ class CustomUserCreationForm(UserCreationForm):
             raise ValidationError('Введите корректный email адрес')     
         return email
 
-
-
-def clean_phone(self):
-    phone = self.cleaned_data.get('phone')
+    def clean_phone(self):
+        phone = self.cleaned_data.get('phone')
     
-    if not phone:
-        raise ValidationError('Телефон обязателен для заполнения')
+        if not phone:
+            raise ValidationError('Телефон обязателен для заполнения')
         
-    # Очищаем номер от лишних символов
-    clean_phone = re.sub(r'[^\d+]', '', phone)
+        # Очищаем номер от лишних символов
+        clean_phone = re.sub(r'[^\d+]', '', phone)
     
-    # УПРОЩАЕМ проверку - только базовые проверки
-    if len(clean_phone) < 10:
-        raise ValidationError('Номер телефона должен содержать минимум 10 цифр')
+        # УПРОЩАЕМ проверку - только базовые проверки
+        if len(clean_phone) < 10:
+            raise ValidationError('Номер телефона должен содержать минимум 10 цифр')
         
-    if len(clean_phone) > 15:
-        raise ValidationError('Номер телефона слишком длинный')
+        if len(clean_phone) > 15:
+            raise ValidationError('Номер телефона слишком длинный')
     
-    # Стандартизируем формат
-    if clean_phone.startswith('8'):
-        clean_phone = '+7' + clean_phone[1:]
-    elif clean_phone.startswith('7'):
-        clean_phone = '+' + clean_phone
-    elif not clean_phone.startswith('+'):
-        clean_phone = '+7' + clean_phone
+        # Стандартизируем формат
+        if clean_phone.startswith('8'):
+            clean_phone = '+7' + clean_phone[1:]
+        elif clean_phone.startswith('7'):
+            clean_phone = '+' + clean_phone
+        elif not clean_phone.startswith('+'):
+            clean_phone = '+7' + clean_phone
         
-    return clean_phone
-
-
+        return clean_phone
 
     def clean_birth_date(self):
         birth_date = self.cleaned_data.get('birth_date')
@@ -149,6 +149,33 @@ def clean_phone(self):
             
         return birth_date
 
+    def validate_unique(self):
+        """
+        Логин, email и телефон - одним запросом с OR вместо запроса на каждое поле.
+
+        Логин сравнивается без учета регистра, как в UserCreationForm.clean_username
+        (которую заменяет clean_username этой формы): "Ivan" занят, если есть "ivan".
+        """
+        values = {
+            field: self.cleaned_data[field]
+            for field in self.UNIQUE_FIELDS
+            if self.cleaned_data.get(field) and field not in self._errors
+        }
+        if not values:
+            return
+        condition = Q()
+        for field, value in values.items():
+            condition |= Q(**{f'{field}__iexact' if field == 'username' else field: value})
+        taken = User.objects.filter(condition)
+        if self.instance.pk:
+            taken = taken.exclude(pk=self.instance.pk)
+
+        for row in taken.values(*values)[:len(values)]:
+            for field, value in values.items():
+                same = row[field].lower() == value.lower() if field == 'username' else row[field] == value
+                if same and field not in self._errors:
+                    self.add_error(field, self.instance.unique_error_message(User, (field,)))
+
     def clean_password2(self):
         password1 = self.cleaned_data.get("password1")
         password2 = self.cleaned_data.get("password2")
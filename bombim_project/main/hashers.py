@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+
+
+class ConfiguredPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 с числом итераций из settings.PASSWORD_PBKDF2_ITERATIONS.
+
+    Число выбирается по bench_hashers (регистраций в секунду на ядро).
+    Хэши с другим числом итераций по-прежнему проверяются и пересчитываются
+    при следующем входе. Алгоритм тот же ("pbkdf2_sha256"), поэтому
+    переход на этот класс не требует миграции паролей.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, 'PASSWORD_PBKDF2_ITERATIONS', PBKDF2PasswordHasher.iterations)
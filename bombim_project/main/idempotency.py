@@ -0,0 +1,151 @@
+"""Заголовок Idempotency-Key для записи и отмены записи.
+
+Клиент на нестабильной сети повторяет тот же POST с тем же ключом.
+Первый запрос выполняется как обычно, его JSON ответ сохраняется в кэше
+и в таблице IdempotencyRecord (кэш у воркеров может быть свой, а повтор
+может прийти к другому воркеру). Повторы в пределах
+settings.IDEMPOTENCY_TTL получают сохраненный ответ с заголовком
+Idempotent-Replayed, без запросов к таблицам записей.
+
+Одновременные повторы разводятся короткой блокировкой в кэше: пока
+первый запрос выполняется, второй ждет его ответа до LOCK_WAIT секунд,
+потом получает 409 с Retry-After. Ключ действует только для того же
+пользователя и того же запроса: тот же ключ с другим адресом - 422.
+"""
+import hashlib
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from . import metrics
+from .models import IdempotencyRecord
+from .throttling import client_ident
+
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 5
+POLL_INTERVAL = 0.05
+
+
+def ttl():
+    return getattr(settings, 'IDEMPOTENCY_TTL', 60 * 60 * 24)
+
+
+def _fingerprint(request):
+    return hashlib.sha256(f'{request.method} {request.path}'.encode()).hexdigest()
+
+
+def _stored(key):
+    """Сохраненный ответ (fingerprint, статус, тело) из кэша или из базы"""
+    stored = cache.get(f'idem:{key}')
+    if stored is not None:
+        return stored
+    record = IdempotencyRecord.objects.filter(key=key, expires_at__gt=timezone.now()).first()
+    if record is None:
+        return None
+    stored = (record.fingerprint, record.status_code, record.body)
+    cache.set(f'idem:{key}', stored, max(1, int((record.expires_at - timezone.now()).total_seconds())))
+    return stored
+
+
+def _save(key, fingerprint, response):
+    stored = (fingerprint, response.status_code, response.content.decode())
+    cache.set(f'idem:{key}', stored, ttl())
+    try:
+        IdempotencyRecord.objects.create(
+            key=key,
+            fingerprint=fingerprint,
+            status_code=response.status_code,
+            body=stored[2],
+            expires_at=timezone.now() + timedelta(seconds=ttl()),
+        )
+    except IntegrityError:
+        # Истекшая строка с тем же ключом еще не удалена clear_expired_sessions
+        IdempotencyRecord.objects.filter(key=key).update(
+            fingerprint=fingerprint,
+            status_code=response.status_code,
+            body=stored[2],
+            expires_at=timezone.now() + timedelta(seconds=ttl()),
+        )
+
+
+def _replay(stored, fingerprint, view_name):
+    stored_fingerprint, status_code, body = stored
+    if stored_fingerprint != fingerprint:
+        return JsonResponse({'success': False, 'error': 'Ключ идемпотентности уже использован для другого запроса'},
+                            status=422)
+    metrics.inc('bombim_idempotent_replays_total', view=view_name)
+    response = HttpResponse(body, status=status_code, content_type='application/json')
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    """
+    Декоратор JSON view: повтор запроса с тем же Idempotency-Key получает первый ответ.
+
+    Ставится над throttle, чтобы повторы не расходовали лимит. Запросы без
+    заголовка обрабатываются как раньше. Сохраняются только ответы, которые
+    не зависят от сбоя: 2xx и 4xx, кроме 429 (лимит мог бы не сработать
+    при повторе).
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        raw_key = request.headers.get(HEADER)
+        if not raw_key or request.method != 'POST':
+            return view(request, *args, **kwargs)
+        if len(raw_key) > MAX_KEY_LENGTH:
+            return JsonResponse({'success': False, 'error': 'Слишком длинный ключ идемпотентности'}, status=400)
+
+        key = hashlib.sha256(f'{client_ident(request)}:{raw_key}'.encode()).hexdigest()
+        fingerprint = _fingerprint(request)
+        stored = _stored(key)
+        if stored is not None:
+            return _replay(stored, fingerprint, view.__name__)
+
+        lock = f'idem-lock:{key}'
+        deadline = time.monotonic() + LOCK_WAIT
+        while not cache.add(lock, 1, LOCK_TIMEOUT):
+            # Тот же запрос сейчас выполняется - ждем его ответ
+            if time.monotonic() >= deadline:
+                response = JsonResponse({'success': False, 'error': 'Запрос уже выполняется'}, status=409)
+                response['Retry-After'] = '1'
+                return response
+            time.sleep(POLL_INTERVAL)
+            stored = _stored(key)
+            if stored is not None:
+                return _replay(stored, fingerprint, view.__name__)
+
+        try:
+            # Ответ мог появиться между проверкой и блокировкой
+            stored = _stored(key)
+            if stored is not None:
+                return _replay(stored, fingerprint, view.__name__)
+            response = view(request, *args, **kwargs)
+            if response.status_code < 500 and response.status_code != 429 and \
+                    response.get('Content-Type', '').startswith('application/json'):
+                _save(key, fingerprint, response)
+            return response
+        finally:
+            cache.delete(lock)
+    return wrapper
+
+
+def prune(batch_size=1000):
+    """Удаляет истекшие ключи пачками. Возвращает их количество"""
+    now = timezone.now()
+    deleted = 0
+    while True:
+        ids = list(IdempotencyRecord.objects.filter(expires_at__lt=now).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        IdempotencyRecord.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
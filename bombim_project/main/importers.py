@@ -0,0 +1,387 @@
+"""Массовый импорт расписания, преподавателей и клиентов из CSV.
+
+Файл читается потоково порциями по ``chunk_size`` строк. Каждая порция
+проверяется целиком: одно обращение к базе на все логины, email и телефоны
+порции, пересечения занятий ищутся проходом по отсортированным интервалам.
+Прошедшие проверку строки сохраняются через ``bulk_create`` в одной
+транзакции на порцию, поэтому следующая порция уже видит их в базе.
+
+Импорт не атомарен целиком: одна транзакция на весь файл держала бы
+блокировку записи SQLite все время импорта, и записи на занятия ждали бы.
+Если порция не сохранилась (например, тот же логин успели создать
+параллельно), импорт останавливается; уже сохраненные порции остаются, а
+их диапазоны строк перечислены в ImportResult.committed. Исправленный
+файл можно загрузить повторно: сохраненные строки отсеются проверкой на
+занятые логины, email и телефоны.
+
+Пароли из файла хэшируются только для строк, прошедших проверку, и до
+транзакции порции; PBKDF2 дорогой, поэтому при hash_workers > 1 хэши
+считаются в пуле процессов.
+"""
+import csv
+import io
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import DatabaseError, transaction
+
+from . import outbox, search
+from .conflicts import find_conflicts
+from .models import User, DanceStyle, Trainer, Room, Schedule
+
+
+DEFAULT_CHUNK_SIZE = 2000
+HASH_CHUNK_SIZE = 16
+
+# Ограничение SQLite на количество параметров в одном запросе
+IN_QUERY_BATCH = 900
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    errors: list = field(default_factory=list)  # [(номер строки, сообщение)]
+    committed: list = field(default_factory=list)  # [(первая строка, последняя строка)] сохраненных порций
+    stopped: bool = False  # порция не сохранилась, следующие не обрабатывались
+
+    @property
+    def ok(self):
+        return not self.errors
+
+
+class RowError(Exception):
+    pass
+
+
+def normalize_phone(phone):
+    """Приводит телефон к виду +7XXXXXXXXXX (как при регистрации)"""
+    clean_phone = re.sub(r'[^\d+]', '', phone or '')
+    if len(clean_phone) < 10:
+        raise RowError('Номер телефона должен содержать минимум 10 цифр')
+    if len(clean_phone) > 15:
+        raise RowError('Номер телефона слишком длинный')
+
+    if clean_phone.startswith('8'):
+        clean_phone = '+7' + clean_phone[1:]
+    elif clean_phone.startswith('7'):
+        clean_phone = '+' + clean_phone
+    elif not clean_phone.startswith('+'):
+        clean_phone = '+7' + clean_phone
+    return clean_phone
+
+
+def open_csv(file_obj, encoding='utf-8-sig'):
+    """Оборачивает бинарный файл (в т.ч. загруженный через админку) в DictReader"""
+    if isinstance(file_obj, io.TextIOBase):
+        text = file_obj
+    else:
+        text = io.TextIOWrapper(file_obj, encoding=encoding, newline='')
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    return csv.DictReader(text, dialect=dialect)
+
+
+def _batched(values, size=IN_QUERY_BATCH):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def _existing(model, field_name, values):
+    """Одним запросом (на каждые IN_QUERY_BATCH значений) находит уже занятые значения поля"""
+    found = set()
+    for batch in _batched(set(values)):
+        found.update(model.objects.filter(**{f'{field_name}__in': batch}).values_list(field_name, flat=True))
+    return found
+
+
+class BaseImporter:
+    required_columns = ()
+
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, dry_run=False, hash_workers=1):
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.hash_workers = hash_workers
+
+    def run(self, reader):
+        result = ImportResult()
+        missing = [c for c in self.required_columns if c not in (reader.fieldnames or [])]
+        if missing:
+            result.errors.append((1, f'В файле нет обязательных колонок: {", ".join(missing)}'))
+            return result
+
+        # Строка 1 - заголовок, данные начинаются со второй
+        rows = ((line_no, row) for line_no, row in enumerate(reader, start=2))
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+            valid = self.validate_chunk(chunk, result.errors)
+            if valid and not self.dry_run:
+                self.prepare_chunk(valid)
+                try:
+                    with transaction.atomic():
+                        self.save_chunk(valid)
+                except DatabaseError as e:
+                    first, last = chunk[0][0], chunk[-1][0]
+                    result.errors.append((first, f'Строки {first}-{last} не сохранены, импорт остановлен: {e}'))
+                    result.stopped = True
+                    break
+                result.committed.append((chunk[0][0], chunk[-1][0]))
+            result.created += len(valid)
+
+        result.errors.sort()
+        return result
+
+    def validate_chunk(self, chunk, errors):
+        raise NotImplementedError
+
+    def prepare_chunk(self, valid):
+        """Подготовка порции к сохранению вне транзакции (долгие вычисления)"""
+
+    def save_chunk(self, valid):
+        raise NotImplementedError
+
+    @staticmethod
+    def _value(row, column):
+        return (row.get(column) or '').strip()
+
+
+class UserImporter(BaseImporter):
+    """Клиенты (и пользовательская часть преподавателей)"""
+    role = 'client'
+    required_columns = ('username', 'first_name', 'last_name', 'email', 'phone')
+
+    def run(self, reader):
+        # Без User.phone_digits у старых клиентов дубликаты телефонов не найти
+        if User.objects.filter(phone_digits='').exclude(phone='').exists():
+            result = ImportResult()
+            result.errors.append((1, 'Сначала заполните ключи поиска: manage.py backfill user_search_keys'))
+            return result
+        return super().run(reader)
+
+    def parse_row(self, row):
+        username = self._value(row, 'username')
+        if not re.match(r'^[a-zA-Z0-9_]{3,30}$', username):
+            raise RowError('Логин должен состоять из 3-30 латинских букв, цифр или "_"')
+
+        first_name = self._value(row, 'first_name')
+        last_name = self._value(row, 'last_name')
+        if not first_name or not last_name:
+            raise RowError('Имя и фамилия обязательны для заполнения')
+
+        email = self._value(row, 'email').lower()
+        try:
+            validate_email(email)
+        except ValidationError:
+            raise RowError('Некорректный email адрес')
+
+        birth_date = self._value(row, 'birth_date')
+        if birth_date:
+            try:
+                birth_date = datetime.strptime(birth_date, '%Y-%m-%d').date()
+            except ValueError:
+                raise RowError('Дата рождения должна быть в формате ГГГГ-ММ-ДД')
+
+        user = User(
+            username=username,
+            first_name=first_name,
+            last_name=last_name,
+            email=email,
+            phone=normalize_phone(self._value(row, 'phone')),
+            birth_date=birth_date or None,
+            role=self.role,
+        )
+        # Хэш считается в prepare_chunk и только для прошедших проверку строк
+        user.import_password = self._value(row, 'password')
+        user.fill_search_keys()  # bulk_create не вызывает save()
+        return user
+
+    def validate_chunk(self, chunk, errors):
+        parsed = []
+        for line_no, row in chunk:
+            try:
+                parsed.append((line_no, row, self.parse_row(row)))
+            except RowError as e:
+                errors.append((line_no, str(e)))
+
+        # Телефоны сравниваются цифрами: старые записи хранят их в произвольном виде
+        taken = {
+            'username': _existing(User, 'username', (u.username for _, _, u in parsed)),
+            'email': _existing(User, 'email', (u.email for _, _, u in parsed)),
+            'phone_digits': _existing(User, 'phone_digits', (u.phone_digits for _, _, u in parsed)),
+        }
+        labels = {'username': ('Логин', 'username'), 'email': ('Email', 'email'), 'phone_digits': ('Телефон', 'phone')}
+
+        valid = []
+        for line_no, row, user in parsed:
+            problems = []
+            for field_name, used in taken.items():
+                if getattr(user, field_name) in used:
+                    label, shown = labels[field_name]
+                    problems.append(f'{label} {getattr(user, shown)} уже используется')
+            if problems:
+                errors.append((line_no, '; '.join(problems)))
+                continue
+            # Дубликаты внутри файла: первая строка выигрывает
+            for field_name, used in taken.items():
+                used.add(getattr(user, field_name))
+            valid.append((line_no, row, user))
+        return valid
+
+    def hash_passwords(self, users):
+        """Пароли из файла -> хэши; без пароля в файле - неиспользуемый пароль"""
+        with_password = [user for user in users if user.import_password]
+        for user in users:
+            if not user.import_password:
+                user.set_unusable_password()
+        raw = [user.import_password for user in with_password]
+        if self.hash_workers > 1 and len(raw) > HASH_CHUNK_SIZE:
+            with ProcessPoolExecutor(max_workers=self.hash_workers, initializer=django.setup) as pool:
+                hashes = list(pool.map(make_password, raw, chunksize=HASH_CHUNK_SIZE))
+        else:
+            hashes = [make_password(password) for password in raw]
+        for user, password_hash in zip(with_password, hashes):
+            user.password = password_hash
+            user.import_password = None
+
+    def prepare_chunk(self, valid):
+        # PBKDF2 - до транзакции, чтобы не держать блокировку записи
+        self.hash_passwords([user for _, _, user in valid])
+
+    def save_chunk(self, valid):
+        User.objects.bulk_create([user for _, _, user in valid], batch_size=500)
+
+
+class TrainerImporter(UserImporter):
+    """Преподаватели: пользователь + профиль + направления (через ';')"""
+    role = 'trainer'
+    required_columns = UserImporter.required_columns + ('bio',)
+
+    def validate_chunk(self, chunk, errors):
+        self.styles = {s.name.lower(): s.id for s in DanceStyle.objects.only('id', 'name')}
+        valid = []
+        for line_no, row, user in super().validate_chunk(chunk, errors):
+            names = [n.strip() for n in self._value(row, 'styles').split(';') if n.strip()]
+            unknown = [n for n in names if n.lower() not in self.styles]
+            if unknown:
+                errors.append((line_no, f'Неизвестные направления: {", ".join(unknown)}'))
+                continue
+            valid.append((line_no, row, user))
+        return valid
+
+    def save_chunk(self, valid):
+        super().save_chunk(valid)
+        trainers = Trainer.objects.bulk_create([
+            Trainer(user=user, bio=self._value(row, 'bio'), photo=self._value(row, 'photo'))
+            for _, row, user in valid
+        ], batch_size=500)
+
+        through = Trainer.styles.through
+        links = []
+        for trainer, (_, row, _) in zip(trainers, valid):
+            for name in self._value(row, 'styles').split(';'):
+                if name.strip():
+                    links.append(through(trainer_id=trainer.id, dancestyle_id=self.styles[name.strip().lower()]))
+        through.objects.bulk_create(links, batch_size=500, ignore_conflicts=True)
+        search.index_trainers(trainers)
+
+
+class ScheduleImporter(BaseImporter):
+    """Занятия: date, start_time, end_time, dance_style (название), trainer (логин), room (название зала, необязательно)"""
+    required_columns = ('date', 'start_time', 'end_time', 'dance_style', 'trainer')
+
+    def parse_row(self, row):
+        try:
+            date = datetime.strptime(self._value(row, 'date'), '%Y-%m-%d').date()
+        except ValueError:
+            raise RowError('Дата должна быть в формате ГГГГ-ММ-ДД')
+        try:
+            start_time = datetime.strptime(self._value(row, 'start_time'), '%H:%M').time()
+            end_time = datetime.strptime(self._value(row, 'end_time'), '%H:%M').time()
+        except ValueError:
+            raise RowError('Время должно быть в формате ЧЧ:ММ')
+
+        # Те же правила, что и в ScheduleAdminForm
+        if start_time >= end_time:
+            raise RowError('Время окончания должно быть позже времени начала')
+        duration = datetime.combine(date, end_time) - datetime.combine(date, start_time)
+        if duration < timedelta(hours=1):
+            raise RowError('Занятие не может быть короче 1 часа')
+        if duration > timedelta(hours=5):
+            raise RowError('Занятие не может быть длиннее 5 часов')
+
+        style_id = self.styles.get(self._value(row, 'dance_style').lower())
+        if style_id is None:
+            raise RowError(f'Неизвестное направление: {self._value(row, "dance_style")}')
+        trainer_id = self.trainers.get(self._value(row, 'trainer'))
+        if trainer_id is None:
+            raise RowError(f'Неизвестный преподаватель: {self._value(row, "trainer")}')
+
+        max_participants = self._value(row, 'max_participants') or '10'
+        if not max_participants.isdigit() or int(max_participants) == 0:
+            raise RowError('Количество мест должно быть положительным числом')
+
+        room_id = None
+        if self._value(row, 'room'):
+            room = self.rooms.get(self._value(row, 'room').lower())
+            if room is None:
+                raise RowError(f'Неизвестный зал: {self._value(row, "room")}')
+            room_id, capacity = room
+            if int(max_participants) > capacity:
+                raise RowError(f'В зале "{self._value(row, "room")}" помещается только {capacity} человек')
+
+        return Schedule(
+            date=date,
+            day_of_week=date.weekday(),  # bulk_create не вызывает save()
+            start_time=start_time,
+            end_time=end_time,
+            dance_style_id=style_id,
+            trainer_id=trainer_id,
+            room_id=room_id,
+            max_participants=int(max_participants),
+            is_active=self._value(row, 'is_active').lower() not in ('0', 'false', 'нет'),
+        )
+
+    def validate_chunk(self, chunk, errors):
+        self.styles = {s.name.lower(): s.id for s in DanceStyle.objects.only('id', 'name')}
+        self.trainers = dict(Trainer.objects.values_list('user__username', 'id'))
+        self.rooms = {name.lower(): (room_id, capacity) for room_id, name, capacity in Room.objects.values_list('id', 'name', 'capacity')}
+
+        parsed = []
+        for line_no, row in chunk:
+            try:
+                parsed.append((line_no, row, self.parse_row(row)))
+            except RowError as e:
+                errors.append((line_no, str(e)))
+        if not parsed:
+            return []
+
+        active = [item for item in parsed if item[2].is_active]
+        rejected = find_conflicts([s for _, _, s in active])
+        for line_no, _, schedule in active:
+            if id(schedule) in rejected:
+                errors.append((line_no, rejected[id(schedule)]))
+        return [item for item in parsed if id(item[2]) not in rejected]
+
+    def save_chunk(self, valid):
+        schedules = Schedule.objects.bulk_create([schedule for _, _, schedule in valid], batch_size=500)
+        outbox.record_schedules('created', schedules)
+
+
+IMPORTERS = {
+    'schedule': ScheduleImporter,
+    'trainers': TrainerImporter,
+    'clients': UserImporter,
+}
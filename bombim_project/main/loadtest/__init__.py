@@ -0,0 +1,8 @@
+"""Нагрузочное тестирование локально запущенного сервера.
+
+Виртуальные клиенты (по одному asyncio-заданию на клиента, с собственными
+cookie и keep-alive соединением) выполняют смесь сценариев из
+``scenarios.SCENARIOS``: неделя расписания, фильтры, запись, отмена,
+личный кабинет. Отдельная фаза "открытие записи" отправляет запись всех
+клиентов на одно занятие одновременно. Запускается командой ``loadtest``.
+"""
@@ -0,0 +1,130 @@
+"""Минимальный асинхронный HTTP/1.1 клиент на asyncio.
+
+Сторонний клиент не нужен: сервер локальный, протокол - обычный HTTP/1.1
+без TLS. Каждый клиент держит одно keep-alive соединение и свои cookie
+(sessionid, csrftoken), как отдельный браузер.
+"""
+import asyncio
+import json
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlsplit
+
+
+class Response:
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers  # имена в нижнем регистре
+        self.body = body
+
+    def text(self):
+        return self.body.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class HttpClient:
+    def __init__(self, base_url, recorder, limiter=None, timeout=30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.recorder = recorder
+        self.limiter = limiter
+        self.timeout = timeout
+        self.cookies = {}
+        self.reader = self.writer = None
+
+    async def get(self, path, name):
+        return await self.request('GET', path, name)
+
+    async def post(self, path, name, data=None):
+        return await self.request('POST', path, name, data)
+
+    async def request(self, method, path, name, data=None):
+        """Выполняет запрос и записывает его время в recorder под именем name"""
+        if self.limiter is None:
+            return await self._timed(method, path, name, data)
+        async with self.limiter:
+            return await self._timed(method, path, name, data)
+
+    async def _timed(self, method, path, name, data):
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(self._send(method, path, data), self.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+            await self.close()
+            self.recorder.add(name, time.perf_counter() - started, None, error=type(e).__name__)
+            return None
+        self.recorder.add(name, time.perf_counter() - started, response.status)
+        return response
+
+    async def _send(self, method, path, data):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+        body = urlencode(data or {}).encode() if method == 'POST' else b''
+        headers = {
+            'Host': f'{self.host}:{self.port}',
+            'Connection': 'keep-alive',
+            'Content-Length': str(len(body)),
+        }
+        if method == 'POST':
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['Referer'] = f'http://{self.host}:{self.port}{path}'
+            if 'csrftoken' in self.cookies:
+                headers['X-CSRFToken'] = self.cookies['csrftoken']
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+
+        head = f'{method} {path} HTTP/1.1\r\n' + ''.join(f'{k}: {v}\r\n' for k, v in headers.items())
+        self.writer.write(head.encode('latin-1') + b'\r\n' + body)
+        await self.writer.drain()
+
+        response = await self._read_response()
+        if response.headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return response
+
+    async def _read_response(self):
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionResetError('Сервер закрыл соединение')
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = (await self.reader.readline()).decode('latin-1').rstrip('\r\n')
+            if not line:
+                break
+            key, _, value = line.partition(':')
+            key, value = key.strip().lower(), value.strip()
+            if key == 'set-cookie':
+                for morsel in SimpleCookie(value).values():
+                    self.cookies[morsel.key] = morsel.value
+            headers[key] = value
+
+        if 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = b''
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if not size:
+                    await self.reader.readline()
+                    break
+                body += await self.reader.readexactly(size)
+                await self.reader.readline()
+        else:
+            body = await self.reader.read()
+            headers['connection'] = 'close'
+        return Response(status, headers, body)
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
@@ -0,0 +1,76 @@
+"""Сбор времени ответов и отчет по пропускной способности и перцентилям"""
+from collections import Counter, defaultdict
+
+
+PERCENTILES = (50, 90, 95, 99)
+
+# Ответ book_class / cancel_booking при исключении внутри view (код 200)
+SERVER_ERROR_PREFIX = 'Внутренняя ошибка сервера'
+
+
+def percentile(sorted_values, p):
+    """Перцентиль методом ближайшего ранга"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.errors = Counter()  # имя -> количество (5xx, сетевые ошибки, ошибки view)
+        self.outcomes = Counter()  # результаты записи/отмены по тексту ответа
+
+    def add(self, name, seconds, status, error=None):
+        self.latencies[name].append(seconds)
+        self.statuses[name][status if status is not None else error] += 1
+        if status is None or status >= 500:
+            self.errors[name] += 1
+
+    def outcome(self, name, payload):
+        """Учитывает JSON ответ записи/отмены: успех, отказ по причине или ошибка сервера"""
+        if payload.get('success'):
+            key = 'queued' if payload.get('queued') else 'success'
+        else:
+            key = payload.get('error', '?')
+            if key.startswith(SERVER_ERROR_PREFIX):
+                self.errors[name] += 1
+                key = SERVER_ERROR_PREFIX
+        self.outcomes[(name, key)] += 1
+
+    @property
+    def total(self):
+        return sum(len(values) for values in self.latencies.values())
+
+    @property
+    def error_count(self):
+        return sum(self.errors.values())
+
+    def rows(self, elapsed):
+        """[(имя, запросов, запросов/с, ошибок, p50, p90, p95, p99, max)], время в мс"""
+        rows = []
+        everything = []
+        for name in sorted(self.latencies):
+            values = sorted(self.latencies[name])
+            everything.extend(values)
+            rows.append(self._row(name, values, self.errors[name], elapsed))
+        rows.append(self._row('ВСЕГО', sorted(everything), self.error_count, elapsed))
+        return rows
+
+    @staticmethod
+    def _row(name, values, errors, elapsed):
+        return (
+            name, len(values), len(values) / elapsed if elapsed else 0.0, errors,
+            *(percentile(values, p) * 1000 for p in PERCENTILES),
+            (values[-1] if values else 0.0) * 1000,
+        )
+
+
+def format_table(rows):
+    header = ('Запрос', 'Кол-во', 'Зап/с', 'Ошибок') + tuple(f'p{p}, мс' for p in PERCENTILES) + ('max, мс',)
+    lines = ['{:<18}{:>8}{:>9}{:>8}'.format(*header[:4]) + ''.join(f'{h:>10}' for h in header[4:])]
+    for name, count, rps, errors, *times in rows:
+        lines.append(f'{name:<18}{count:>8}{rps:>9.1f}{errors:>8}' + ''.join(f'{t:>10.1f}' for t in times))
+    return '\n'.join(lines)
@@ -0,0 +1,167 @@
+"""Сценарии виртуальных клиентов и запуск нагрузки.
+
+Сценарий - корутина ``(client, context, rng)``, выполняющая один или
+несколько запросов так же, как это делает браузер со страниц сайта.
+Веса в SCENARIOS задают долю сценария в смеси.
+"""
+import asyncio
+import random
+import re
+import time
+
+from .client import HttpClient
+from .report import Recorder
+
+
+BOOKING_ID_RE = re.compile(r'cancelBooking\((\d+)')
+TICKET_POLL_INTERVAL = 0.2
+TICKET_POLL_ATTEMPTS = 150
+
+
+class Context:
+    """Данные, которые сценарии берут из базы до начала нагрузки"""
+
+    def __init__(self, schedule_ids, style_ids, trainer_ids, rush_schedule_id=None):
+        self.schedule_ids = schedule_ids
+        self.style_ids = style_ids
+        self.trainer_ids = trainer_ids
+        self.rush_schedule_id = rush_schedule_id
+
+
+async def login_form(client, username, password):
+    """Вход через форму: csrftoken из GET /login/, затем POST с токеном"""
+    await client.get('/login/', 'login_page')
+    response = await client.post('/login/', 'login', {
+        'csrfmiddlewaretoken': client.cookies.get('csrftoken', ''),
+        'username': username,
+        'password': password,
+    })
+    return response is not None and response.status == 302 and 'sessionid' in client.cookies
+
+
+async def book_schedule(client, schedule_id, name, recorder):
+    response = await client.post(f'/book/{schedule_id}/', name)
+    if response is None or response.status != 200:
+        return None
+    payload = response.json()
+    recorder.outcome(name, payload)
+
+    # Режим открытия записи: ждем результат заявки по билету
+    if payload.get('queued'):
+        ticket = payload['ticket']
+        for _ in range(TICKET_POLL_ATTEMPTS):
+            await asyncio.sleep(TICKET_POLL_INTERVAL)
+            status = await client.get(f'/book/ticket/{ticket}/', 'book_ticket')
+            if status is None or status.status != 200:
+                return None
+            payload = status.json()
+            if not payload.get('pending'):
+                recorder.outcome(f'{name}_result', payload)
+                break
+    return payload
+
+
+async def browse_week(client, context, rng):
+    await client.get(f'/schedule/?week={rng.randint(-1, 3)}', 'schedule')
+
+
+async def filter_schedule(client, context, rng):
+    params = []
+    if context.style_ids and rng.random() < 0.7:
+        params.append(f'style={rng.choice(context.style_ids)}')
+    if context.trainer_ids and rng.random() < 0.5:
+        params.append(f'trainer={rng.choice(context.trainer_ids)}')
+    params.append(f'week={rng.randint(0, 3)}')
+    await client.get('/schedule/?' + '&'.join(params), 'schedule_filter')
+
+
+async def book(client, context, rng):
+    if context.schedule_ids:
+        await book_schedule(client, rng.choice(context.schedule_ids), 'book', client.recorder)
+
+
+async def cancel(client, context, rng):
+    response = await client.get('/profile/', 'profile')
+    if response is None or response.status != 200:
+        return
+    booking_ids = BOOKING_ID_RE.findall(response.text())
+    if booking_ids:
+        cancelled = await client.post(f'/cancel-booking/{rng.choice(booking_ids)}/', 'cancel')
+        if cancelled is not None and cancelled.status == 200:
+            client.recorder.outcome('cancel', cancelled.json())
+
+
+async def open_profile(client, context, rng):
+    await client.get(f'/profile/?tab={rng.choice(("bookings", "history"))}', 'profile')
+
+
+SCENARIOS = {
+    'browse': (browse_week, 40),
+    'filter': (filter_schedule, 20),
+    'book': (book, 20),
+    'cancel': (cancel, 10),
+    'profile': (open_profile, 10),
+}
+
+
+async def _user_loop(client, context, deadline, think_time, rng):
+    names = list(SCENARIOS)
+    weights = [SCENARIOS[name][1] for name in names]
+    while time.monotonic() < deadline:
+        scenario = SCENARIOS[rng.choices(names, weights)[0]][0]
+        await scenario(client, context, rng)
+        if think_time:
+            await asyncio.sleep(rng.uniform(0, 2 * think_time))
+
+
+async def _run(base_url, accounts, context, concurrency, duration, think_time, login, seed):
+    recorder = Recorder()
+    limiter = asyncio.Semaphore(concurrency)
+    clients = []
+    for username, password, session_key in accounts:
+        client = HttpClient(base_url, recorder, limiter)
+        if session_key:
+            client.cookies['sessionid'] = session_key
+        clients.append((client, username, password))
+
+    if login:
+        logged_in = await asyncio.gather(*(login_form(c, u, p) for c, u, p in clients))
+        clients = [item for item, ok in zip(clients, logged_in) if ok]
+    clients = [client for client, _, _ in clients]
+
+    # Прогрев: соединение и cookie csrftoken, как при открытии страницы
+    await asyncio.gather(*(client.get('/schedule/', 'schedule') for client in clients))
+
+    started = time.monotonic()
+    if context.rush_schedule_id:
+        start = asyncio.Event()
+
+        async def rush_one(client):
+            await start.wait()
+            await book_schedule(client, context.rush_schedule_id, 'book_rush', recorder)
+
+        tasks = [asyncio.create_task(rush_one(client)) for client in clients]
+        await asyncio.sleep(0)
+        start.set()
+        await asyncio.gather(*tasks)
+
+    deadline = time.monotonic() + duration
+    rng = random.Random(seed)
+    await asyncio.gather(*(
+        _user_loop(client, context, deadline, think_time, random.Random(rng.random()))
+        for client in clients
+    ))
+    elapsed = time.monotonic() - started
+
+    await asyncio.gather(*(client.close() for client in clients))
+    return recorder, elapsed, len(clients)
+
+
+def run(base_url, accounts, context, concurrency=100, duration=30, think_time=0.0, login=False, seed=None):
+    """
+    Запускает нагрузку и возвращает (recorder, секунд, активных клиентов).
+
+    accounts - [(username, password, session_key)]; при login=True клиенты
+    входят через форму, иначе используют готовые сессии.
+    """
+    return asyncio.run(_run(base_url, accounts, context, concurrency, duration, think_time, login, seed))
@@ -0,0 +1,108 @@
+"""Подготовка данных для нагрузки: клиенты, сессии, занятие для "открытия записи".
+
+Клиенты создаются тем же UserImporter, что и при импорте CSV. Пароль у всех
+один и хэшируется один раз; сессии создаются прямо в хранилище сессий, так
+что вход через форму (ограниченный по IP) для нагрузки не нужен.
+"""
+from datetime import time as dtime, timedelta
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.hashers import make_password
+from django.contrib.sessions.backends.cached_db import SessionStore
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from ..importers import UserImporter
+from ..models import User, DanceStyle, Trainer, Schedule, Booking
+from .scenarios import Context
+
+
+USERNAME_PREFIX = 'loadtest_'
+PHONE_PREFIX = '+7000'
+
+
+def seed_clients(count, password):
+    """Создает недостающих клиентов loadtest_NNNNN и возвращает их список"""
+    usernames = [f'{USERNAME_PREFIX}{i:05d}' for i in range(count)]
+    existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    rows = [
+        {
+            'username': username,
+            'first_name': 'Нагрузка',
+            'last_name': f'Клиент {i}',
+            'email': f'{username}@loadtest.invalid',
+            'phone': f'{PHONE_PREFIX}{i:07d}',
+        }
+        for i, username in enumerate(usernames) if username not in existing
+    ]
+    if rows:
+        result = UserImporter().run(_Rows(rows))
+        if not result.ok:
+            raise ValueError('; '.join(f'строка {line}: {message}' for line, message in result.errors[:5]))
+
+    User.objects.filter(username__in=usernames).update(password=make_password(password))
+    return list(User.objects.filter(username__in=usernames).order_by('username'))
+
+
+class _Rows(list):
+    """Список словарей с атрибутом fieldnames, как у csv.DictReader"""
+
+    def __init__(self, rows):
+        super().__init__(rows)
+        self.fieldnames = list(rows[0]) if rows else []
+
+
+def create_session(user):
+    """Ключ сессии, равносильной входу пользователя через login()"""
+    session = SessionStore()
+    session[SESSION_KEY] = str(user.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+    session.create()
+    return session.session_key
+
+
+def create_rush_schedule(capacity, opening_mode=False):
+    """Занятие через 30 дней, на которое одновременно записываются все клиенты"""
+    style, trainer = DanceStyle.objects.first(), Trainer.objects.first()
+    if style is None or trainer is None:
+        raise ValueError('Нужны направления и преподаватели (fill_data / import_csv)')
+    return Schedule.objects.create(
+        date=timezone.now().date() + timedelta(days=30),
+        start_time=dtime(23, 0),
+        end_time=dtime(23, 59),
+        dance_style=style,
+        trainer=trainer,
+        max_participants=capacity,
+        opening_mode=opening_mode,
+    )
+
+
+def build_context(rush_schedule=None):
+    today = timezone.now().date()
+    schedule_ids = Schedule.objects.filter(is_active=True, date__gte=today)
+    if rush_schedule is not None:
+        schedule_ids = schedule_ids.exclude(id=rush_schedule.id)
+    return Context(
+        schedule_ids=list(schedule_ids.values_list('id', flat=True)),
+        style_ids=list(DanceStyle.objects.values_list('id', flat=True)),
+        trainer_ids=list(Trainer.objects.values_list('id', flat=True)),
+        rush_schedule_id=rush_schedule.id if rush_schedule is not None else None,
+    )
+
+
+def overbooked_schedules():
+    """Занятия, где активных записей больше, чем мест"""
+    return list(
+        Schedule.objects.annotate(booked=Count('bookings', filter=Q(bookings__status='booked')))
+        .filter(booked__gt=F('max_participants'))
+        .values_list('id', 'booked', 'max_participants')
+    )
+
+
+def remove_clients():
+    """Удаляет клиентов нагрузочного теста вместе с их записями"""
+    clients = User.objects.filter(username__startswith=USERNAME_PREFIX, role='client')
+    Booking.objects.filter(client__in=clients).delete()
+    return clients.delete()[0]
@@ -0,0 +1,25 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from main.archive import archive_before
+
+
+class Command(BaseCommand):
+    help = 'Move schedules and bookings older than the horizon into archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=180, help='Горизонт: занятия старше стольких дней уходят в архив')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0.05, help='Пауза между пачками, с')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now().date() - timedelta(days=options['days'])
+        self.stdout.write(f'Переносим в архив занятия раньше {cutoff}')
+
+        def progress(last_id, schedules, bookings):
+            self.stdout.write(f'  до id {last_id}: занятий {schedules}, записей {bookings}')
+
+        schedules, bookings = archive_before(
+            cutoff, chunk_size=options['chunk_size'], pause=options['pause'], progress=progress
+        )
+        self.stdout.write(self.style.SUCCESS(f'Перенесено занятий: {schedules}, записей: {bookings}'))
@@ -0,0 +1,69 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from main import backfills
+from main.models import BackfillCheckpoint
+
+
+class Command(BaseCommand):
+    help = 'Run resumable chunked backfills (see main.backfills); without arguments lists them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', metavar='name', help='Имена backfill (по умолчанию - список)')
+        parser.add_argument('--all', action='store_true', help='Запустить все незавершенные')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Строк id в одном диапазоне')
+        parser.add_argument('--pause', type=float, default=backfills.PAUSE, help='Пауза между диапазонами, с')
+        parser.add_argument('--reset', action='store_true', help='Начать заново, забыв контрольную точку')
+
+    def handle(self, *args, **options):
+        unknown = set(options['names']) - set(backfills.BACKFILLS)
+        if unknown:
+            raise CommandError(f'Неизвестные backfill: {", ".join(sorted(unknown))}')
+        if options['chunk_size'] is not None and options['chunk_size'] < 1:
+            raise CommandError('Размер диапазона должен быть положительным')
+
+        names = sorted(backfills.BACKFILLS) if options['all'] else options['names']
+        if not names:
+            self.list()
+            return
+
+        for name in names:
+            backfill = backfills.BACKFILLS[name]
+            self.stdout.write(f'{name}: {backfill.description}')
+
+            def progress(checkpoint, fraction, eta):
+                self.stdout.write(
+                    f'  id {checkpoint.position}/{checkpoint.upper} ({fraction:.0%}), '
+                    f'проверено {checkpoint.processed}, исправлено {checkpoint.changed}, '
+                    f'осталось ~{timedelta(seconds=round(eta))}'
+                )
+
+            try:
+                checkpoint = backfills.run(
+                    backfill, chunk_size=options['chunk_size'], pause=options['pause'],
+                    reset=options['reset'], progress=progress,
+                )
+            except KeyboardInterrupt:
+                # Прерывание могло прийти до создания контрольной точки
+                checkpoint = BackfillCheckpoint.objects.filter(name=name).first()
+                if checkpoint is None:
+                    self.stdout.write(self.style.WARNING('Прервано до начала, контрольной точки нет'))
+                else:
+                    self.stdout.write(self.style.WARNING(
+                        f'Прервано на id {checkpoint.position}, повторный запуск продолжит с этого места'
+                    ))
+                return
+            self.stdout.write(self.style.SUCCESS(
+                f'{name}: готово, проверено {checkpoint.processed}, исправлено {checkpoint.changed}'
+            ))
+
+    def list(self):
+        checkpoints = {c.name: c for c in BackfillCheckpoint.objects.all()}
+        for name, backfill in sorted(backfills.BACKFILLS.items()):
+            checkpoint = checkpoints.get(name)
+            if checkpoint is None:
+                state = 'не запускался'
+            elif checkpoint.finished_at:
+                state = f'завершен {checkpoint.finished_at:%Y-%m-%d %H:%M}, исправлено {checkpoint.changed}'
+            else:
+                state = f'остановлен на id {checkpoint.position}/{checkpoint.upper}'
+            self.stdout.write(f'{name:<24} {state}  - {backfill.description}')
@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time as dtime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.test import Client, override_settings
+from django.utils import timezone
+from main import admission
+from main.models import User, Schedule, Booking, DanceStyle, Trainer
+import time
+
+
+class Command(BaseCommand):
+    help = 'Local booking-rush benchmark: direct booking vs the admission queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=200)
+        parser.add_argument('--threads', type=int, default=32)
+
+    def handle(self, *args, **options):
+        users = list(User.objects.filter(role='client')[:options['clients']])
+        style, trainer = DanceStyle.objects.first(), Trainer.objects.first()
+        if not users or style is None or trainer is None:
+            raise CommandError('Нужны клиенты, направления и преподаватели (fill_data / import_csv)')
+
+        clients = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+
+        for opening_mode in (False, True):
+            schedule = Schedule.objects.create(
+                date=timezone.now().date() + timedelta(days=30),
+                start_time=dtime(23, 0),
+                end_time=dtime(23, 59),
+                dance_style=style,
+                trainer=trainer,
+                max_participants=len(users),
+                opening_mode=opening_mode,
+            )
+            try:
+                # Бенчмарк идет в одном процессе - очередь работает и с кэшем в памяти
+                with override_settings(ADMISSION_SINGLE_PROCESS=True):
+                    self.run_rush(schedule, clients, options['threads'])
+            finally:
+                schedule.delete()
+
+    def run_rush(self, schedule, clients, threads):
+        url = f'/book/{schedule.id}/'
+
+        def book(client):
+            try:
+                return client.post(url).json()
+            finally:
+                close_old_connections()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            responses = list(pool.map(book, clients))
+
+        if schedule.opening_mode:
+            # Ждем, пока обработчик очереди разберет все билеты
+            while admission.drain_all() or schedule.bookings.count() < sum(r.get('success', False) for r in responses):
+                if time.perf_counter() - started > 60:
+                    break
+                time.sleep(0.01)
+        elapsed = time.perf_counter() - started
+
+        committed = Booking.objects.filter(schedule=schedule).count()
+        errors = sum(not r.get('success') for r in responses)
+        mode = 'очередь' if schedule.opening_mode else 'напрямую'
+        self.stdout.write(
+            f'{mode:>9}: записано {committed}/{len(clients)}, ошибок {errors}, '
+            f'{elapsed:.2f} с, {committed / elapsed:.0f} записей/с'
+        )
@@ -0,0 +1,82 @@
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test import Client, override_settings
+from main.models import User
+import statistics
+import time
+
+
+NO_THROTTLE = {'signup': '100000/m', 'login': '100000/m'}
+PASSWORD = 'Bench-pass-2024'
+
+
+class Command(BaseCommand):
+    help = 'PBKDF2 work factor vs signup/login requests per second per core'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, nargs='+', default=None,
+                            help='Варианты числа итераций (по умолчанию текущее и 600000, 300000, 100000)')
+        parser.add_argument('--requests', type=int, default=10, help='Запросов на каждый вариант')
+
+    def handle(self, *args, **options):
+        current = settings.PASSWORD_PBKDF2_ITERATIONS
+        variants = options['iterations'] or sorted({current, 1_000_000, 600_000, 300_000, 100_000}, reverse=True)
+        if any(value < 1 for value in variants):
+            raise CommandError('Число итераций должно быть положительным')
+
+        self.stdout.write(f'Сейчас PASSWORD_PBKDF2_ITERATIONS = {current}; один поток = одно ядро\n')
+        self.stdout.write(f'{"итераций":>10} {"хэш, мс":>9} {"регистраций/с":>14} {"входов/с":>10}')
+        for iterations in variants:
+            with override_settings(PASSWORD_PBKDF2_ITERATIONS=iterations, THROTTLE_RATES=NO_THROTTLE):
+                hash_ms = self.hash_time(iterations)
+                signups = self.rate(options['requests'], self.signup)
+                logins = self.rate(options['requests'], self.login, prepare=self.create_login_user)
+            mark = '  <- сейчас' if iterations == current else ''
+            self.stdout.write(f'{iterations:>10} {hash_ms:>9.1f} {signups:>14.1f} {logins:>10.1f}{mark}')
+
+    def hash_time(self, iterations, rounds=5):
+        hasher = get_hasher()
+        timings = []
+        for _ in range(rounds):
+            started = time.process_time()
+            hasher.encode(PASSWORD, hasher.salt(), iterations)
+            timings.append((time.process_time() - started) * 1000)
+        return statistics.median(timings)
+
+    def rate(self, requests, make_request, prepare=None):
+        """Запросов в секунду процессорного времени; каждый запрос откатывается"""
+        spent = 0.0
+        for number in range(requests):
+            with transaction.atomic():
+                if prepare is not None:
+                    prepare(number)
+                started = time.process_time()
+                response = make_request(Client(), number)
+                spent += time.process_time() - started
+                transaction.set_rollback(True)
+            if response.status_code != 302:
+                raise CommandError(f'Запрос не прошел: статус {response.status_code}')
+        return requests / spent
+
+    def signup(self, client, number):
+        return client.post('/signup/', {
+            'username': f'bench_signup_{number}',
+            'first_name': 'Тест',
+            'last_name': 'Регистрация',
+            'email': f'bench_signup_{number}@bench.invalid',
+            'phone': f'+7001{number:07d}',
+            'birth_date': '1990-01-01',
+            'password1': PASSWORD,
+            'password2': PASSWORD,
+        })
+
+    def create_login_user(self, number):
+        User.objects.create_user(
+            username=f'bench_login_{number}', email=f'bench_login_{number}@bench.invalid',
+            phone=f'+7002{number:07d}', password=PASSWORD,
+        )
+
+    def login(self, client, number):
+        return client.post('/login/', {'username': f'bench_login_{number}', 'password': PASSWORD})
@@ -0,0 +1,118 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time as dtime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, transaction
+from django.db.models import Sum
+from django.test import Client, override_settings
+from django.utils import timezone
+from main import passes
+from main.models import User, Schedule, Booking, DanceStyle, Trainer, ClassPass, PassLedger
+import statistics
+import time
+
+
+NO_THROTTLE = {'book': '100000/m', 'cancel': '100000/m'}
+
+
+class Command(BaseCommand):
+    help = 'Concurrent bookings against one class pass: the balance never goes negative; charge latency vs ledger size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--classes', type=int, default=8, help='Занятий в абонементе')
+        parser.add_argument('--attempts', type=int, default=40, help='Одновременных записей одного клиента')
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--ledger-rows', type=int, default=100000,
+                            help='Строк журнала для замера времени списания')
+
+    def handle(self, *args, **options):
+        client_user = User.objects.filter(role='client').first()
+        style, trainer = DanceStyle.objects.first(), Trainer.objects.first()
+        if client_user is None or style is None or trainer is None:
+            raise CommandError('Нужны клиенты, направления и преподаватели (fill_data / import_csv)')
+
+        class_pass = passes.issue(client_user, options['classes'])
+        schedules = Schedule.objects.bulk_create([
+            Schedule(
+                date=timezone.now().date() + timedelta(days=60 + i),
+                day_of_week=(timezone.now().date() + timedelta(days=60 + i)).weekday(),
+                start_time=dtime(23, 0),
+                end_time=dtime(23, 59),
+                dance_style=style,
+                trainer=trainer,
+                max_participants=10,
+            )
+            for i in range(options['attempts'])
+        ])
+        try:
+            with override_settings(THROTTLE_RATES=NO_THROTTLE, CLASS_PASS_REQUIRED=True):
+                failures = self.race(client_user, class_pass, schedules, options['threads'])
+            self.latency(class_pass, options['ledger_rows'])
+        finally:
+            Booking.objects.filter(schedule__in=schedules).delete()
+            Schedule.objects.filter(id__in=[s.id for s in schedules]).delete()
+            class_pass.delete()
+
+        if failures:
+            raise CommandError('Проверки не пройдены: ' + '; '.join(failures))
+        self.stdout.write(self.style.SUCCESS('Проверки пройдены'))
+
+    def race(self, user, class_pass, schedules, threads):
+        def book(schedule):
+            client = Client()
+            client.force_login(user)
+            try:
+                return client.post(f'/book/{schedule.id}/').json()
+            finally:
+                close_old_connections()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            responses = list(pool.map(book, schedules))
+        elapsed = time.perf_counter() - started
+
+        class_pass.refresh_from_db()
+        charged = Booking.objects.filter(class_pass=class_pass).count()
+        ledger = class_pass.ledger.aggregate(total=Sum('delta'))['total']
+        errors = [r['error'] for r in responses if not r.get('success')]
+        self.stdout.write(
+            f'Записей: {len(responses) - len(errors)}/{len(responses)} за {elapsed:.2f} с, '
+            f'списано с абонемента {charged}, остаток {class_pass.balance}, по журналу {ledger}'
+        )
+        for error in sorted(set(errors)):
+            self.stdout.write(f'  {errors.count(error)} x {error}')
+
+        failures = []
+        if class_pass.balance < 0:
+            failures.append(f'остаток ушел в минус: {class_pass.balance}')
+        if charged != class_pass.classes - class_pass.balance:
+            failures.append(f'списано {charged}, а остаток уменьшился на {class_pass.classes - class_pass.balance}')
+        if ledger != class_pass.balance:
+            failures.append(f'сумма журнала {ledger} не равна остатку {class_pass.balance}')
+        if len(responses) - len(errors) != charged:
+            failures.append('при обязательном абонементе есть записи без списания')
+        return failures
+
+    def latency(self, class_pass, ledger_rows):
+        """Время списания (UPDATE остатка и строка журнала) на коротком и на длинном журнале"""
+        def measure(label, rounds=200):
+            timings = []
+            for _ in range(rounds):
+                started = time.perf_counter()
+                with transaction.atomic():
+                    pass_id = passes.charge(class_pass.client_id)
+                    PassLedger.objects.create(class_pass_id=pass_id, delta=-1, reason='booking')
+                    ClassPass.objects.filter(id=pass_id).update(balance=class_pass.classes)
+                    transaction.set_rollback(True)
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(f'{label:>24}: медиана {statistics.median(timings):.3f} мс')
+            return statistics.median(timings)
+
+        ClassPass.objects.filter(id=class_pass.id).update(balance=class_pass.classes)
+        measure('прогрев', rounds=50)
+        empty = measure(f'журнал {class_pass.ledger.count()} строк')
+        PassLedger.objects.bulk_create(
+            [PassLedger(class_pass=class_pass, delta=0, reason='adjustment') for _ in range(ledger_rows)],
+            batch_size=5000,
+        )
+        full = measure(f'журнал {class_pass.ledger.count()} строк')
+        self.stdout.write(f'Отношение: {full / empty:.2f}')
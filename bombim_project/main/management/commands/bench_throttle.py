@@ -0,0 +1,33 @@
+from django.contrib.sessions.backends.base import SessionBase
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from main.throttling import consume, client_ident
+import time
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request cost of the throttling decision'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20000)
+        parser.add_argument('--clients', type=int, default=100)
+
+    def handle(self, *args, **options):
+        factory = RequestFactory()
+        requests = []
+        for i in range(options['clients']):
+            request = factory.post('/book/1/', REMOTE_ADDR=f'10.0.{i // 256}.{i % 256}')
+            request.session = SessionBase()
+            requests.append(request)
+
+        n = options['requests']
+        allowed = 0
+        started = time.perf_counter()
+        for i in range(n):
+            request = requests[i % len(requests)]
+            ok, _ = consume('bench', client_ident(request), 50, 60)
+            allowed += ok
+        elapsed = time.perf_counter() - started
+
+        self.stdout.write(f'Запросов: {n}, разрешено: {allowed}, отклонено: {n - allowed}')
+        self.stdout.write(self.style.SUCCESS(f'Среднее время решения: {elapsed / n * 1e6:.1f} мкс'))
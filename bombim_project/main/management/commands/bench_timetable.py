@@ -0,0 +1,49 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from main import timetable
+import random
+import time
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the timetable solver on synthetic trainers, styles and availability (no database)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trainers', type=int, default=50)
+        parser.add_argument('--styles', type=int, default=20)
+        parser.add_argument('--weeks', type=int, default=4)
+        parser.add_argument('--rooms', type=int, default=4)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        style_ids = list(range(1, options['styles'] + 1))
+
+        trainers = {}
+        for trainer_id in range(1, options['trainers'] + 1):
+            styles = set(rng.sample(style_ids, rng.randint(1, 4)))
+            windows = []
+            for day in rng.sample(range(7), rng.randint(3, 6)):
+                start, end = sorted(rng.sample(range(len(timetable.TIME_SLOTS)), 2))
+                windows.append((day, timetable.TIME_SLOTS[start][0], timetable.TIME_SLOTS[end][1]))
+            trainers[trainer_id] = (styles, windows)
+        demand = {style_id: rng.randint(3, 8) for style_id in style_ids}
+
+        started = time.perf_counter()
+        result = timetable.solve(trainers, demand, rooms=options['rooms'])
+        classes = result.dated(timezone.now().date() + timedelta(days=1), options['weeks'])
+        elapsed = time.perf_counter() - started
+
+        problems = timetable.check(result, trainers, rooms=options['rooms'])
+        wanted = sum(demand.values())
+        self.stdout.write(
+            f'{options["trainers"]} преподавателей, {options["styles"]} направлений, '
+            f'залов: {options["rooms"]}; поставлено {len(result.assignments)}/{wanted} в неделю, '
+            f'{len(classes)} занятий на {options["weeks"]} нед. за {elapsed * 1000:.0f} мс'
+        )
+        if problems:
+            for problem in problems[:10]:
+                self.stdout.write(self.style.ERROR(problem))
+        else:
+            self.stdout.write(self.style.SUCCESS('Конфликтов нет'))
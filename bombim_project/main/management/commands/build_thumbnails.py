@@ -0,0 +1,32 @@
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.core.management.base import BaseCommand
+from main.thumbnails import build_variants_for_path, source_names
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = 'Build responsive thumbnails for existing trainer photos and style images'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+
+    def handle(self, *args, **options):
+        names = source_names()
+        self.stdout.write(f'Найдено картинок: {len(names)}')
+
+        started = time.monotonic()
+        done = failed = 0
+        # Воркеры работают только с файлами и не используют соединения с БД
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as pool:
+            for name, ok, error in pool.map(build_variants_for_path, names, chunksize=4):
+                if ok:
+                    done += 1
+                else:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f'Пропущен {name} {error}'.rstrip()))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано {done}, пропущено {failed} за {time.monotonic() - started:.1f} с'
+        ))
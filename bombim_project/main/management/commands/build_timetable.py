@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from main import timetable
+from main.models import DanceStyle, Room
+import time
+
+
+class Command(BaseCommand):
+    help = 'Build a conflict-free timetable from trainer styles, availability and weekly demand'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='Первый день (ГГГГ-ММ-ДД), по умолчанию ближайший понедельник')
+        parser.add_argument('--weeks', type=int, default=4)
+        parser.add_argument('--rooms', type=int, default=None,
+                            help='Занятий в одном слоте одновременно (по умолчанию - число залов или 1)')
+        parser.add_argument('--max-per-trainer', type=int, default=None, help='Занятий в неделю на преподавателя')
+        parser.add_argument('--max-participants', type=int, default=10)
+        parser.add_argument('--dry-run', action='store_true', help='Только показать результат')
+
+    def handle(self, *args, **options):
+        if options['start']:
+            try:
+                start = datetime.strptime(options['start'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Дата должна быть в формате ГГГГ-ММ-ДД')
+        else:
+            today = timezone.now().date()
+            start = today + timedelta(days=7 - today.weekday())
+
+        rooms = options['rooms'] or Room.objects.count() or 1
+        trainers, demand = timetable.load_inputs()
+        if not demand:
+            raise CommandError('Не задано ни одного занятия: заполните "weekly_classes" у направлений')
+
+        started = time.perf_counter()
+        result = timetable.solve(trainers, demand, rooms=rooms, max_per_trainer=options['max_per_trainer'])
+        solved = time.perf_counter() - started
+
+        created, skipped = timetable.write(
+            result, start, options['weeks'],
+            max_participants=options['max_participants'],
+            rooms=rooms,
+            dry_run=options['dry_run'],
+        )
+
+        self.stdout.write(
+            f'Шаблон: {len(result.assignments)} занятий в неделю ({solved * 1000:.0f} мс), '
+            f'с {start} на {options["weeks"]} нед.'
+        )
+        if result.unplaced:
+            names = dict(DanceStyle.objects.filter(id__in=result.unplaced).values_list('id', 'name'))
+            for style_id, count in sorted(result.unplaced.items()):
+                self.stdout.write(self.style.WARNING(f'Не удалось поставить: {names.get(style_id, style_id)} x{count}'))
+        if skipped:
+            self.stdout.write(self.style.WARNING(f'Пропущено из-за существующих занятий: {skipped}'))
+        action = 'Будет создано' if options['dry_run'] else 'Создано'
+        self.stdout.write(self.style.SUCCESS(f'{action} занятий: {created}'))
@@ -0,0 +1,31 @@
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from main import idempotency
+import time
+
+
+class Command(BaseCommand):
+    help = 'Delete expired sessions and idempotency keys in small batches to avoid long write locks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--sleep', type=float, default=0.05, help='Пауза между пачками, с')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        deleted = 0
+        while True:
+            keys = list(
+                Session.objects.filter(expire_date__lt=now)
+                .values_list('session_key', flat=True)[:options['batch_size']]
+            )
+            if not keys:
+                break
+            Session.objects.filter(session_key__in=keys).delete()
+            deleted += len(keys)
+            time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'Удалено истекших сессий: {deleted}'))
+        keys = idempotency.prune(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Удалено истекших ключей идемпотентности: {keys}'))
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from main import outbox
+import time
+
+
+class Command(BaseCommand):
+    help = 'Process booking/schedule outbox events for registered consumers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', action='append', choices=sorted(outbox.CONSUMERS),
+                            help='Потребитель (по умолчанию все)')
+        parser.add_argument('--batch-size', type=int, default=outbox.BATCH_SIZE)
+        parser.add_argument('--loop', type=float, default=None, metavar='SECONDS',
+                            help='Не завершаться, проверять новые события с этим интервалом')
+        parser.add_argument('--prune', action='store_true',
+                            help='Удалить события, прочитанные всеми потребителями')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('Размер пачки должен быть положительным')
+        consumers = [outbox.CONSUMERS[name] for name in options['consumer'] or sorted(outbox.CONSUMERS)]
+        try:
+            while True:
+                for consumer in consumers:
+                    started = time.monotonic()
+                    processed = outbox.drain(consumer, options['batch_size'])
+                    if processed or options['loop'] is None:
+                        self.stdout.write(
+                            f'{consumer.name}: событий {processed} ({time.monotonic() - started:.2f} с)'
+                        )
+                if options['prune']:
+                    deleted = outbox.prune()
+                    if deleted or options['loop'] is None:
+                        self.stdout.write(f'Удалено прочитанных событий: {deleted}')
+                if options['loop'] is None:
+                    break
+                time.sleep(options['loop'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('Остановлено'))
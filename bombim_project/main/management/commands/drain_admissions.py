@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from main.admission import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Run the booking admission queue worker (for deployments with a shared cache)'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Обработчик очереди записи запущен, Ctrl+C для остановки')
+        try:
+            run_worker()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('Обработчик остановлен'))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from main.importers import IMPORTERS, DEFAULT_CHUNK_SIZE, open_csv
+import os
+import time
+
+
+class Command(BaseCommand):
+    help = 'Bulk import schedule, trainers or clients from a CSV file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS), help='Что импортируем')
+        parser.add_argument('path', help='Путь к CSV файлу (UTF-8, разделитель , или ;)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Только проверить файл, ничего не сохранять')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Процессов для хэширования паролей из файла')
+
+    def handle(self, *args, **options):
+        importer = IMPORTERS[options['kind']](
+            chunk_size=options['chunk_size'], dry_run=options['dry_run'], hash_workers=options['workers'],
+        )
+
+        started = time.monotonic()
+        try:
+            with open(options['path'], 'rb') as f:
+                result = importer.run(open_csv(f))
+        except OSError as e:
+            raise CommandError(f'Не удалось открыть файл: {e}')
+        elapsed = time.monotonic() - started
+
+        for line_no, message in result.errors:
+            self.stdout.write(self.style.WARNING(f'Строка {line_no}: {message}'))
+
+        if result.stopped:
+            ranges = ', '.join(f'{first}-{last}' for first, last in result.committed) or 'нет'
+            self.stdout.write(self.style.ERROR(f'Импорт остановлен. Сохранены строки: {ranges}'))
+
+        verb = 'Прошло проверку' if options['dry_run'] else 'Импортировано'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {result.created} строк за {elapsed:.2f} с, ошибок: {len(result.errors)}'
+        ))
@@ -0,0 +1,117 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from main.loadtest import scenarios, seed
+from main.loadtest.report import format_table
+from main.models import Booking
+import os
+import socket
+import subprocess
+import sys
+import time
+
+
+class Command(BaseCommand):
+    help = 'Load-test a local server: mixed browsing/booking scenarios plus a booking rush'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Адрес сервера')
+        parser.add_argument('--start-server', action='store_true',
+                            help='Запустить runserver на --url на время теста')
+        parser.add_argument('--users', type=int, default=500, help='Виртуальных клиентов')
+        parser.add_argument('--concurrency', type=int, default=100, help='Одновременных запросов')
+        parser.add_argument('--duration', type=float, default=30, help='Секунд смешанной нагрузки')
+        parser.add_argument('--think-time', type=float, default=0.0,
+                            help='Средняя пауза клиента между сценариями, с')
+        parser.add_argument('--rush-capacity', type=int, default=20,
+                            help='Мест на занятии для одновременной записи (0 - без этой фазы)')
+        parser.add_argument('--opening-mode', action='store_true', help='Занятие для записи в режиме очереди')
+        parser.add_argument('--login', action='store_true',
+                            help='Входить через форму (нужен повышенный лимит THROTTLE_RATES["login"])')
+        parser.add_argument('--password', default='loadtest123')
+        parser.add_argument('--seed', type=int, default=None, help='Зерно генератора сценариев')
+        parser.add_argument('--max-error-rate', type=float, default=0.01)
+        parser.add_argument('--cleanup', action='store_true', help='Удалить клиентов нагрузочного теста и выйти')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            self.stdout.write(f'Удалено объектов: {seed.remove_clients()}')
+            return
+
+        try:
+            users = seed.seed_clients(options['users'], options['password'])
+            rush = None
+            if options['rush_capacity']:
+                rush = seed.create_rush_schedule(options['rush_capacity'], options['opening_mode'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f'Клиентов: {len(users)}')
+
+        server = self.start_server(options['url']) if options['start_server'] else None
+        try:
+            accounts = [
+                (user.username, options['password'], None if options['login'] else seed.create_session(user))
+                for user in users
+            ]
+            recorder, elapsed, active = scenarios.run(
+                options['url'], accounts, seed.build_context(rush),
+                concurrency=options['concurrency'],
+                duration=options['duration'],
+                think_time=options['think_time'],
+                login=options['login'],
+                seed=options['seed'],
+            )
+            rush_booked = rush.bookings.filter(status='booked').count() if rush else 0
+            overbooked = seed.overbooked_schedules()
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+            if rush is not None:
+                Booking.objects.filter(schedule=rush).delete()
+                rush.delete()
+
+        self.stdout.write(f'\nАктивных клиентов: {active}, {elapsed:.1f} с\n')
+        self.stdout.write(format_table(recorder.rows(elapsed)))
+        if recorder.outcomes:
+            self.stdout.write('\nРезультаты записи и отмены:')
+            for (name, outcome), count in sorted(recorder.outcomes.items()):
+                self.stdout.write(f'  {name:<18}{count:>7}  {outcome}')
+
+        # Проверки корректности: нет переполненных занятий, доля ошибок в пределах
+        failures = []
+        if rush is not None:
+            self.stdout.write(f'\nОткрытие записи: записано {rush_booked} из {rush.max_participants} мест')
+            if rush_booked > rush.max_participants:
+                failures.append(f'переполнено занятие для одновременной записи: {rush_booked}/{rush.max_participants}')
+        for schedule_id, booked, capacity in overbooked:
+            failures.append(f'занятие {schedule_id} переполнено: {booked}/{capacity}')
+        error_rate = recorder.error_count / recorder.total if recorder.total else 1.0
+        self.stdout.write(f'Доля ошибок: {error_rate:.2%}')
+        if error_rate > options['max_error_rate']:
+            failures.append(f'доля ошибок {error_rate:.2%} больше {options["max_error_rate"]:.2%}')
+        if not active:
+            failures.append('ни один клиент не вошел на сайт')
+
+        if failures:
+            raise CommandError('Проверки не пройдены: ' + '; '.join(failures))
+        self.stdout.write(self.style.SUCCESS('Проверки пройдены'))
+
+    def start_server(self, url):
+        address = url.split('://', 1)[-1].rstrip('/')
+        host, _, port = address.partition(':')
+        server = subprocess.Popen(
+            [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'runserver', '--noreload', address],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection((host, int(port or 80)), timeout=1).close()
+                return server
+            except OSError:
+                if server.poll() is not None:
+                    break
+                time.sleep(0.2)
+        server.kill()
+        raise CommandError(f'Сервер не запустился на {address}')
@@ -0,0 +1,40 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.urls import reverse
+import gzip
+
+
+class Command(BaseCommand):
+    help = 'Report HTML bytes sent per page view (the part the browser cannot cache)'
+
+    PUBLIC_PAGES = ('home', 'styles', 'trainers', 'schedule', 'login', 'signup')
+    # Бюджет на страницу: HTML после gzip (CSS/JS кэшируются браузером отдельно)
+    GZIP_BUDGET = 8 * 1024
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='Также измерить личный кабинет этого пользователя')
+
+    def handle(self, *args, **options):
+        client = Client()
+        pages = [(name, reverse(name)) for name in self.PUBLIC_PAGES]
+
+        if options['username']:
+            try:
+                user = get_user_model().objects.get(username=options['username'])
+            except get_user_model().DoesNotExist:
+                raise CommandError('Пользователь не найден')
+            client.force_login(user)
+            pages = [('profile', reverse('trainer_profile' if user.is_trainer() else 'profile'))]
+
+        total = total_gz = 0
+        self.stdout.write(f'{"Страница":<16}{"HTML, байт":>12}{"gzip, байт":>12}')
+        for name, url in pages:
+            response = client.get(url, follow=True)
+            body = response.content
+            compressed = len(gzip.compress(body))
+            total += len(body)
+            total_gz += compressed
+            line = f'{name:<16}{len(body):>12}{compressed:>12}'
+            self.stdout.write(line if compressed <= self.GZIP_BUDGET else self.style.ERROR(f'{line}  > {self.GZIP_BUDGET}'))
+        self.stdout.write(self.style.SUCCESS(f'{"Итого":<16}{total:>12}{total_gz:>12}'))
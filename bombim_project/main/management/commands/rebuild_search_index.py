@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from main import search
+import time
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index over dance styles and trainers'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = search.rebuild()
+        backend = 'FTS5' if search.fts_available() else 'LIKE'
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано документов: {count} ({backend}, {time.monotonic() - started:.2f} с)'
+        ))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from main import passes
+import time
+
+
+class Command(BaseCommand):
+    help = 'Replay the class-pass ledger in chunks and compare it with stored balances'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=passes.REPLAY_CHUNK_SIZE)
+        parser.add_argument('--fix', action='store_true', help='Записать в остаток сумму по журналу')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        mismatches = passes.reconcile(options['chunk_size'], fix=options['fix'])
+        elapsed = time.monotonic() - started
+
+        for pass_id, balance, total in mismatches:
+            self.stdout.write(self.style.WARNING(f'Абонемент {pass_id}: остаток {balance}, по журналу {total}'))
+        if mismatches and not options['fix']:
+            raise CommandError(f'Расхождений: {len(mismatches)} ({elapsed:.2f} с)')
+        action = 'исправлено' if mismatches else 'расхождений нет'
+        self.stdout.write(self.style.SUCCESS(f'Сверка журнала абонементов: {action} ({elapsed:.2f} с)'))
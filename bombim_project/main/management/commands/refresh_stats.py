@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from main.stats import refresh_stats
+import time
+
+
+class Command(BaseCommand):
+    help = 'Refresh DailyClassStats for dates touched since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Пересчитать всю историю')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        dates, rows = refresh_stats(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано дат: {dates}, строк агрегата: {rows} ({time.monotonic() - started:.2f} с)'
+        ))
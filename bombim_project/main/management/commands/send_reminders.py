@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from main.reminders import send_reminders
+import time
+
+
+class Command(BaseCommand):
+    help = "Email reminders for tomorrow's booked classes (safe to re-run)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Дата занятий ГГГГ-ММ-ДД (по умолчанию завтра)')
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать письма')
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                class_date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Дата должна быть в формате ГГГГ-ММ-ДД')
+        else:
+            class_date = timezone.localdate() + timedelta(days=1)
+
+        started = time.monotonic()
+        sent = send_reminders(
+            class_date,
+            chunk_size=options['chunk_size'],
+            dry_run=options['dry_run'],
+            progress=lambda n: self.stdout.write(f'  отправлено {n}'),
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Напоминаний на {class_date}: {sent} за {time.monotonic() - started:.1f} с'
+        ))
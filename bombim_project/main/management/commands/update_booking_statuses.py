@@ -1,24 +1,16 @@
 from django.core.management.base import BaseCommand
-from main.models import Booking
-from datetime import datetime
+from django.utils import timezone
+from main import outbox
+from main.models import Booking, past_class
+
 
 class Command(BaseCommand):
-    help = 'Update booking statuses for past classes'
+    help = 'Nightly compaction: store "missed" for bookings on past classes that were never marked'
 
     def handle(self, *args, **options):
-        today = datetime.now().date()
-        
-        # Находим все записи со статусом 'booked' на прошедшие даты
-        past_bookings = Booking.objects.filter(status='booked', class_date__lt=today)
-        
-        self.stdout.write(f'Найдено {past_bookings.count()} прошедших записей')
-        
-        # Обновляем статус на 'missed'
-        updated_count = 0
-        for booking in past_bookings:
-            booking.status = 'missed'
-            booking.save()
-            updated_count += 1
-            self.stdout.write(f'Обновлена запись {booking.id}: {booking.class_date} -> missed')
-        
+        # Чтение уже видит такие записи как 'missed' (Booking.objects.with_effective_status),
+        # команда только закрепляет статус в базе - UPDATE порциями, без сохранения каждой строки
+        updated_count = outbox.update_bookings(
+            Booking.objects.filter(past_class(), status='booked'), status='missed', updated_at=timezone.now()
+        )
         self.stdout.write(self.style.SUCCESS(f'Успешно обновлено {updated_count} записей'))
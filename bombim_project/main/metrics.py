@@ -0,0 +1,205 @@
+"""Метрики приложения в текстовом формате Prometheus.
+
+Счетчики и гистограммы живут в памяти процесса, обновление - пара операций
+со словарем под локом. Если задан settings.METRICS_DIR, фоновый поток
+каждого процесса раз в FLUSH_INTERVAL секунд сбрасывает изменившиеся
+значения в файл <pid>.json в этом каталоге (запрос в файл не пишет), а
+/metrics складывает файлы всех воркеров (gunicorn запускает несколько
+процессов с отдельной памятью).
+
+Файлы завершившихся процессов /metrics удаляет: после перезапуска
+воркеров суммы счетчиков уменьшаются, Prometheus считает это сбросом
+счетчика (rate и increase его учитывают).
+"""
+import bisect
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+
+FLUSH_INTERVAL = 1.0
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    'bombim_requests_total': ('counter', 'HTTP запросы по view и коду ответа'),
+    'bombim_view_latency_seconds': ('histogram', 'Время обработки запроса view'),
+    'bombim_booking_outcomes_total': ('counter', 'Результаты попыток записи на занятие'),
+    'bombim_booking_cancellations_total': ('counter', 'Отмены записей клиентами'),
+    'bombim_cache_requests_total': ('counter', 'Обращения к кэшу по назначению и результату'),
+    'bombim_idempotent_replays_total': ('counter', 'Повторы запросов, получившие сохраненный ответ'),
+}
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}     # (имя, метки) -> значение
+        self.histograms = {}   # (имя, метки) -> [счетчики корзин..., сумма, количество]
+        self.changes = 0
+        self.flusher_pid = None
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            self.changes += 1
+        self._start_flusher()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            data = self.histograms.get(key)
+            if data is None:
+                data = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 3)
+            data[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+            data[-2] += value
+            data[-1] += 1
+            self.changes += 1
+        self._start_flusher()
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, list(labels), list(data)] for (name, labels), data in self.histograms.items()],
+            }
+
+    def _start_flusher(self):
+        """Поток сброса в файл: один на процесс (после fork запускается заново)"""
+        pid = os.getpid()
+        if self.flusher_pid == pid or not getattr(settings, 'METRICS_DIR', None):
+            return
+        with self.lock:
+            if self.flusher_pid == pid:
+                return
+            self.flusher_pid = pid
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        flushed = 0
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            directory = getattr(settings, 'METRICS_DIR', None)
+            changes = self.changes
+            if not directory or changes == flushed:
+                continue
+            try:
+                self.flush(directory)
+            except OSError:
+                continue
+            flushed = changes
+
+    def flush(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+
+registry = Registry()
+inc = registry.inc
+observe = registry.observe
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # процесс есть, но чужой
+        return True
+    return True
+
+
+def _collect():
+    """Сумма значений всех процессов: файлы из METRICS_DIR + память текущего"""
+    snapshots = [registry.snapshot()]
+    directory = getattr(settings, 'METRICS_DIR', None)
+    if directory and os.path.isdir(directory):
+        own = f'{os.getpid()}.json'
+        for filename in os.listdir(directory):
+            if filename.endswith('.json') and filename != own:
+                pid = filename[:-len('.json')]
+                if pid.isdigit() and not _alive(int(pid)):
+                    try:
+                        os.remove(os.path.join(directory, filename))
+                    except OSError:
+                        pass
+                    continue
+                try:
+                    with open(os.path.join(directory, filename)) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot['counters']:
+            key = (name, tuple(tuple(item) for item in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, data in snapshot['histograms']:
+            key = (name, tuple(tuple(item) for item in labels))
+            total = histograms.setdefault(key, [0] * len(data))
+            for i, value in enumerate(data):
+                total[i] += value
+    return counters, histograms
+
+
+def _labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    escaped = (
+        '%s="%s"' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in items
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def render():
+    """Текст в формате exposition 0.0.4"""
+    counters, histograms = _collect()
+    lines = []
+    described = set()
+
+    def describe(name):
+        if name not in described and name in HELP:
+            metric_type, help_text = HELP[name]
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            described.add(name)
+
+    for (name, labels), value in sorted(counters.items()):
+        describe(name)
+        lines.append(f'{name}{_labels(labels)} {value}')
+
+    for (name, labels), data in sorted(histograms.items()):
+        describe(name)
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), data[:-2]):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(labels, [("le", bound)])} {cumulative}')
+        lines.append(f'{name}_sum{_labels(labels)} {data[-2]}')
+        lines.append(f'{name}_count{_labels(labels)} {data[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    """Время и код ответа каждого запроса с меткой по имени URL"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        observe('bombim_view_latency_seconds', time.perf_counter() - started, view=view)
+        inc('bombim_requests_total', view=view, status=response.status_code)
+        return response
@@ -0,0 +1,68 @@
+import json
+import mimetypes
+import os
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotAllowed
+
+
+class StaticFilesMiddleware:
+    """
+    Отдает собранную статику (STATIC_ROOT) прямо из процесса приложения.
+
+    Список файлов читается один раз при старте, поэтому запрос к статике не
+    трогает ни базу, ни файловую систему сверх открытия самого файла.
+    Файлы с хэшем в имени отдаются с Cache-Control immutable на год,
+    при поддержке клиентом - заранее сжатой .gz копией.
+    """
+    IMMUTABLE = 'public, max-age=31536000, immutable'
+    SHORT = 'public, max-age=60'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        self.files = self._scan(getattr(settings, 'STATIC_ROOT', None))
+
+    def _scan(self, root):
+        files = {}
+        if not root or not os.path.isdir(root):
+            return files
+
+        hashed = set()
+        manifest_path = os.path.join(root, 'staticfiles.json')
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                hashed = set(json.load(f).get('paths', {}).values())
+
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if filename.endswith('.gz'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                name = os.path.relpath(path, root).replace(os.sep, '/')
+                gz_path = path + '.gz'
+                content_type, _ = mimetypes.guess_type(filename)
+                files[self.prefix + name] = (
+                    path,
+                    gz_path if os.path.exists(gz_path) else None,
+                    content_type or 'application/octet-stream',
+                    self.IMMUTABLE if name in hashed else self.SHORT,
+                )
+        return files
+
+    def __call__(self, request):
+        entry = self.files.get(request.path_info) if request.path_info.startswith(self.prefix) else None
+        if entry is None:
+            return self.get_response(request)
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+
+        path, gz_path, content_type, cache_control = entry
+        use_gzip = gz_path and 'gzip' in request.META.get('HTTP_ACCEPT_ENCODING', '')
+        response = FileResponse(open(gz_path if use_gzip else path, 'rb'), content_type=content_type)
+        if use_gzip:
+            response['Content-Encoding'] = 'gzip'
+        if gz_path:
+            response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = cache_control
+        return response
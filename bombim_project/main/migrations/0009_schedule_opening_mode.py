@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0008_daily_class_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='schedule',
+            name='opening_mode',
+            field=models.BooleanField(default=False, help_text='Режим открытия записи: заявки обрабатываются очередью по порядку'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_schedule_opening_mode'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedSchedule',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('date', models.DateField()),
+                ('day_of_week', models.IntegerField(choices=[(0, 'Понедельник'), (1, 'Вторник'), (2, 'Среда'), (3, 'Четверг'), (4, 'Пятница'), (5, 'Суббота'), (6, 'Воскресенье')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('max_participants', models.PositiveIntegerField()),
+                ('is_active', models.BooleanField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('dance_style', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='main.dancestyle')),
+                ('trainer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_schedules', to='main.trainer')),
+            ],
+            options={
+                'verbose_name': 'Архивное занятие',
+                'verbose_name_plural': 'Архив расписания',
+                'ordering': ['date', 'start_time'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedBooking',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('booking_date', models.DateTimeField()),
+                ('status', models.CharField(choices=[('booked', 'Записан'), ('attended', 'Посещено'), ('missed', 'Не пришел'), ('cancelled', 'Отменено')], max_length=10)),
+                ('class_date', models.DateField(blank=True, null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_bookings', to=settings.AUTH_USER_MODEL)),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bookings', to='main.archivedschedule')),
+            ],
+            options={
+                'verbose_name': 'Архивная запись',
+                'verbose_name_plural': 'Архив записей',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedschedule',
+            index=models.Index(fields=['date'], name='main_archiv_date_1915c9_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedbooking',
+            index=models.Index(fields=['client', 'class_date'], name='main_archiv_client__23ff79_idx'),
+        ),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:44
+
+from django.db import migrations, models
+
+
+FTS_SQL = [
+    "CREATE VIRTUAL TABLE main_searchentry_fts USING fts5("
+    "text, content='main_searchentry', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER main_searchentry_ai AFTER INSERT ON main_searchentry BEGIN "
+    "INSERT INTO main_searchentry_fts(rowid, text) VALUES (new.id, new.text); END",
+    "CREATE TRIGGER main_searchentry_ad AFTER DELETE ON main_searchentry BEGIN "
+    "INSERT INTO main_searchentry_fts(main_searchentry_fts, rowid, text) VALUES ('delete', old.id, old.text); END",
+    "CREATE TRIGGER main_searchentry_au AFTER UPDATE ON main_searchentry BEGIN "
+    "INSERT INTO main_searchentry_fts(main_searchentry_fts, rowid, text) VALUES ('delete', old.id, old.text); "
+    "INSERT INTO main_searchentry_fts(rowid, text) VALUES (new.id, new.text); END",
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS main_searchentry_ai",
+    "DROP TRIGGER IF EXISTS main_searchentry_ad",
+    "DROP TRIGGER IF EXISTS main_searchentry_au",
+    "DROP TABLE IF EXISTS main_searchentry_fts",
+]
+
+
+def create_fts(apps, schema_editor):
+    # FTS5 есть только в SQLite; на других базах поиск работает по SearchEntry напрямую
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in FTS_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+def build_index(apps, schema_editor):
+    from main.search import style_text, trainer_text
+
+    SearchEntry = apps.get_model('main', 'SearchEntry')
+    DanceStyle = apps.get_model('main', 'DanceStyle')
+    Trainer = apps.get_model('main', 'Trainer')
+    entries = [
+        SearchEntry(kind='style', object_id=style.id, text=style_text(style))
+        for style in DanceStyle.objects.all()
+    ] + [
+        SearchEntry(kind='trainer', object_id=trainer.id, text=trainer_text(trainer))
+        for trainer in Trainer.objects.select_related('user')
+    ]
+    SearchEntry.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0011_booking_reminder'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('style', 'Направление'), ('trainer', 'Преподаватель')], max_length=10)),
+                ('object_id', models.PositiveIntegerField()),
+                ('text', models.TextField()),
+            ],
+            options={
+                'unique_together': {('kind', 'object_id')},
+            },
+        ),
+        migrations.RunPython(create_fts, drop_fts),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
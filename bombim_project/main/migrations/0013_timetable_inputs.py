@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0012_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dancestyle',
+            name='weekly_classes',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Сколько занятий в неделю ставить при автоматическом составлении расписания'),
+        ),
+        migrations.CreateModel(
+            name='TrainerAvailability',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day_of_week', models.IntegerField(choices=[(0, 'Понедельник'), (1, 'Вторник'), (2, 'Среда'), (3, 'Четверг'), (4, 'Пятница'), (5, 'Суббота'), (6, 'Воскресенье')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('trainer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability', to='main.trainer')),
+            ],
+            options={
+                'verbose_name': 'Доступность преподавателя',
+                'verbose_name_plural': 'Доступность преподавателей',
+                'ordering': ['day_of_week', 'start_time'],
+            },
+        ),
+    ]
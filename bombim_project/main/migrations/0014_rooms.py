@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0013_timetable_inputs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Room',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('capacity', models.PositiveIntegerField(help_text='Сколько человек помещается в зале')),
+            ],
+            options={
+                'verbose_name': 'Зал',
+                'verbose_name_plural': 'Залы',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='schedule',
+            name='room',
+            field=models.ForeignKey(blank=True, help_text='Зал; количество мест не может быть больше его вместимости', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='schedules', to='main.room'),
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['room', 'date', 'start_time'], name='main_schedu_room_id_464cc1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['trainer', 'date', 'start_time'], name='main_schedu_trainer_9a4997_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 13:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0014_rooms'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassPass',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('classes', models.PositiveSmallIntegerField(choices=[(8, '8 занятий'), (12, '12 занятий')])),
+                ('balance', models.PositiveSmallIntegerField(help_text='Сколько занятий осталось')),
+                ('expires_at', models.DateField(blank=True, help_text='Последний день действия', null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='class_passes', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Абонемент',
+                'verbose_name_plural': 'Абонементы',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='booking',
+            name='class_pass',
+            field=models.ForeignKey(blank=True, help_text='Абонемент, с которого списано занятие (пусто после возврата)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='bookings', to='main.classpass'),
+        ),
+        migrations.CreateModel(
+            name='PassLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.SmallIntegerField()),
+                ('reason', models.CharField(choices=[('purchase', 'Покупка'), ('booking', 'Запись на занятие'), ('refund', 'Возврат'), ('adjustment', 'Корректировка')], max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('booking', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='main.booking')),
+                ('class_pass', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ledger', to='main.classpass')),
+            ],
+            options={
+                'verbose_name': 'Движение по абонементу',
+                'verbose_name_plural': 'Движения по абонементам',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='classpass',
+            index=models.Index(fields=['client', 'expires_at'], name='main_classp_client__8162cd_idx'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Только столбцы: значения заполняет backfill user_search_keys (main.backfills)
+
+    dependencies = [
+        ('main', '0017_idempotency_records'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='name_key',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=61),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='phone_digits',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=15),
+        ),
+    ]
@@ -1,9 +1,26 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
 from django.core.validators import MinLengthValidator
 from datetime import time
 from django.utils import timezone
 from datetime import datetime, timedelta
+import re
+
+
+def phone_digits(phone):
+    """Телефон только цифрами: "+7 (999) 123-45-67" и "89991234567" -> "79991234567" """
+    digits = re.sub(r'\D', '', phone or '')
+    if len(digits) == 11 and digits.startswith('8'):
+        digits = '7' + digits[1:]
+    elif len(digits) == 10:
+        digits = '7' + digits
+    return digits[:15]
+
+
+def name_key(last_name, first_name):
+    """Фамилия и имя в нижнем регистре - ключ поиска по началу"""
+    return ' '.join(f'{last_name or ""} {first_name or ""}'.lower().split())
 
 
 class User(AbstractUser):
@@ -19,10 +36,24 @@ class User(AbstractUser):
     email = models.EmailField(unique=True)
     first_name = models.CharField(max_length=30)
     last_name = models.CharField(max_length=30)
+    # Ключи поиска на ресепшене (main.checkin): запрос по началу идет диапазоном по индексу
+    phone_digits = models.CharField(max_length=15, blank=True, db_index=True, editable=False)
+    name_key = models.CharField(max_length=61, blank=True, db_index=True, editable=False)
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
 
+    def fill_search_keys(self):
+        self.phone_digits = phone_digits(self.phone)
+        self.name_key = name_key(self.last_name, self.first_name)
+
+    def save(self, *args, **kwargs):
+        self.fill_search_keys()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'phone', 'first_name', 'last_name'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'phone_digits', 'name_key'}
+        super().save(*args, **kwargs)
+
     def is_client(self):
         return self.role == 'client'
     
@@ -37,6 +68,9 @@ class DanceStyle(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
     image = models.ImageField(upload_to='styles/')
+    weekly_classes = models.PositiveSmallIntegerField(
+        default=0, help_text="Сколько занятий в неделю ставить при автоматическом составлении расписания"
+    )
 
     def __str__(self):
         return self.name
@@ -52,6 +86,20 @@ class Trainer(models.Model):
         return f"{self.user.first_name} {self.user.last_name}"
 
 
+class Room(models.Model):
+    """Зал: одновременно в нем идет не больше одного занятия"""
+    name = models.CharField(max_length=100, unique=True)
+    capacity = models.PositiveIntegerField(help_text="Сколько человек помещается в зале")
+
+    class Meta:
+        ordering = ['name']
+        verbose_name = 'Зал'
+        verbose_name_plural = 'Залы'
+
+    def __str__(self):
+        return self.name
+
+
 class Schedule(models.Model):
     DAYS_OF_WEEK = (
         (0, 'Понедельник'),
@@ -70,22 +118,48 @@ class Schedule(models.Model):
     end_time = models.TimeField()
     dance_style = models.ForeignKey(DanceStyle, on_delete=models.CASCADE)
     trainer = models.ForeignKey(Trainer, on_delete=models.CASCADE)
+    room = models.ForeignKey(
+        Room, on_delete=models.PROTECT, null=True, blank=True, related_name='schedules',
+        help_text="Зал; количество мест не может быть больше его вместимости",
+    )
     max_participants = models.PositiveIntegerField(default=10)
     is_active = models.BooleanField(default=True, help_text="Активное занятие")
+    opening_mode = models.BooleanField(
+        default=False,
+        help_text="Режим открытия записи: заявки обрабатываются очередью по порядку",
+    )
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         ordering = ['date', 'start_time']
         verbose_name = 'Расписание'
         verbose_name_plural = 'Расписания'
+        # Поиск пересечений: занятия зала или преподавателя за день по времени начала
+        indexes = [
+            models.Index(fields=['room', 'date', 'start_time']),
+            models.Index(fields=['trainer', 'date', 'start_time']),
+        ]
 
     def __str__(self):
         return f"{self.date} {self.start_time}-{self.end_time} - {self.dance_style.name}"
 
+    def clean(self):
+        if self.room_id and self.max_participants and self.max_participants > self.room.capacity:
+            raise ValidationError({
+                'max_participants': f'В зале "{self.room}" помещается только {self.room.capacity} человек',
+            })
+
     def save(self, *args, **kwargs):
         # Автоматически устанавливаем день недели из даты
         if self.date:
             self.day_of_week = self.date.weekday()
-        super().save(*args, **kwargs)
+        # Событие outbox (сигнал post_save) пишется в той же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
 
     def get_day_of_week_display(self):
         """Возвращает русское название дня недели"""
@@ -136,6 +210,66 @@ class Schedule(models.Model):
         return self.current_participants >= self.max_participants
 
 
+class TrainerAvailability(models.Model):
+    """Окно, в которое преподаватель может вести занятия (без окон - в любое время)"""
+    trainer = models.ForeignKey(Trainer, on_delete=models.CASCADE, related_name='availability')
+    day_of_week = models.IntegerField(choices=Schedule.DAYS_OF_WEEK)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    class Meta:
+        ordering = ['day_of_week', 'start_time']
+        verbose_name = 'Доступность преподавателя'
+        verbose_name_plural = 'Доступность преподавателей'
+
+    def __str__(self):
+        return f"{self.trainer}: {self.get_day_of_week_display()} {self.start_time}-{self.end_time}"
+
+
+class ClassPass(models.Model):
+    """Абонемент на несколько занятий; balance - остаток, каждое изменение есть в PassLedger"""
+    CLASSES_CHOICES = (
+        (8, '8 занятий'),
+        (12, '12 занятий'),
+    )
+
+    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='class_passes')
+    classes = models.PositiveSmallIntegerField(choices=CLASSES_CHOICES)
+    balance = models.PositiveSmallIntegerField(help_text="Сколько занятий осталось")
+    expires_at = models.DateField(null=True, blank=True, help_text="Последний день действия")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['client', 'expires_at'])]
+        verbose_name = 'Абонемент'
+        verbose_name_plural = 'Абонементы'
+
+    def __str__(self):
+        return f"{self.client}: {self.balance}/{self.classes}"
+
+
+def past_class(today=None):
+    """Условие "занятие записи уже прошло" (у старых записей class_date может быть пустой)"""
+    today = today or timezone.localdate()
+    return models.Q(class_date__lt=today) | models.Q(class_date__isnull=True, schedule__date__lt=today)
+
+
+def effective_status(today=None):
+    """Статус записи с учетом даты: 'booked' на прошедшем занятии читается как 'missed'"""
+    return models.Case(
+        models.When(models.Q(status='booked') & past_class(today), then=models.Value('missed')),
+        default=models.F('status'),
+        output_field=models.CharField(),
+    )
+
+
+class BookingQuerySet(models.QuerySet):
+    def with_effective_status(self, today=None):
+        """Добавляет effective_status; в базу 'missed' пишет только update_booking_statuses"""
+        return self.annotate(effective_status=effective_status(today))
+
+
 class Booking(models.Model):
     STATUS_CHOICES = (
         ('booked', 'Записан'),
@@ -149,6 +283,13 @@ class Booking(models.Model):
     booking_date = models.DateTimeField(auto_now_add=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='booked')
     class_date = models.DateField(null=True, blank=True, help_text="Фактическая дата занятия")
+    class_pass = models.ForeignKey(
+        ClassPass, on_delete=models.SET_NULL, null=True, blank=True, related_name='bookings',
+        help_text="Абонемент, с которого списано занятие (пусто после возврата)",
+    )
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = BookingQuerySet.as_manager()
 
     class Meta:
         unique_together = ['client', 'schedule']
@@ -157,13 +298,215 @@ class Booking(models.Model):
         # Автоматически устанавливаем дату занятия из расписания
         if not self.class_date and self.schedule:
             self.class_date = self.schedule.date
-        
-        # Автоматически обновляем статус для прошедших занятий
-        if self.class_date and self.class_date < timezone.now().date():
-            if self.status == 'booked':
-                self.status = 'missed'
-        
+        # Событие outbox (сигнал post_save) пишется в той же транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            return super().delete(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.client} - {self.schedule}"
+
+
+class PassLedger(models.Model):
+    """Журнал абонемента: строки только добавляются, сумма delta равна остатку"""
+    REASON_CHOICES = (
+        ('purchase', 'Покупка'),
+        ('booking', 'Запись на занятие'),
+        ('refund', 'Возврат'),
+        ('adjustment', 'Корректировка'),
+    )
+
+    class_pass = models.ForeignKey(ClassPass, on_delete=models.CASCADE, related_name='ledger')
+    delta = models.SmallIntegerField()
+    reason = models.CharField(max_length=10, choices=REASON_CHOICES)
+    # Запись может быть удалена (отмена клиентом) - ссылка остается для истории
+    booking = models.ForeignKey(
+        Booking, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+',
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Движение по абонементу'
+        verbose_name_plural = 'Движения по абонементам'
+
+    def __str__(self):
+        return f"{self.class_pass_id}: {self.delta:+d} ({self.reason})"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError('Строки журнала абонемента не изменяются')
         super().save(*args, **kwargs)
 
+
+class BookingReminder(models.Model):
+    """Отметка об отправленном напоминании: повторный запуск send_reminders ее пропустит"""
+    booking = models.OneToOneField(Booking, on_delete=models.CASCADE, related_name='reminder')
+    sent_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.booking_id}: {self.sent_at}"
+
+
+class ArchivedSchedule(models.Model):
+    """Прошедшее занятие, перенесенное из Schedule командой archive_history (id сохраняется)"""
+    id = models.BigIntegerField(primary_key=True)
+    date = models.DateField()
+    day_of_week = models.IntegerField(choices=Schedule.DAYS_OF_WEEK)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    dance_style = models.ForeignKey(DanceStyle, on_delete=models.CASCADE, related_name='+')
+    trainer = models.ForeignKey(Trainer, on_delete=models.CASCADE, related_name='archived_schedules')
+    room = models.ForeignKey(Room, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    max_participants = models.PositiveIntegerField()
+    is_active = models.BooleanField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['date', 'start_time']
+        indexes = [models.Index(fields=['date'])]
+        verbose_name = 'Архивное занятие'
+        verbose_name_plural = 'Архив расписания'
+
+    def __str__(self):
+        return f"{self.date} {self.start_time}-{self.end_time} - {self.dance_style.name}"
+
+
+class ArchivedBooking(models.Model):
+    """Запись на архивное занятие (id сохраняется)"""
+    id = models.BigIntegerField(primary_key=True)
+    client = models.ForeignKey(User, on_delete=models.CASCADE, related_name='archived_bookings')
+    schedule = models.ForeignKey(ArchivedSchedule, on_delete=models.CASCADE, related_name='bookings')
+    booking_date = models.DateTimeField()
+    status = models.CharField(max_length=10, choices=Booking.STATUS_CHOICES)
+    class_date = models.DateField(null=True, blank=True)
+    class_pass = models.ForeignKey(ClassPass, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['client', 'class_date'])]
+        verbose_name = 'Архивная запись'
+        verbose_name_plural = 'Архив записей'
+
+    def __str__(self):
+        return f"{self.client} - {self.schedule}"
+
+
+class DailyClassStats(models.Model):
+    """Агрегат посещаемости: одна строка на (дата, преподаватель, направление, час начала)"""
+    date = models.DateField()
+    day_of_week = models.IntegerField(choices=Schedule.DAYS_OF_WEEK)
+    hour = models.PositiveSmallIntegerField()
+    trainer = models.ForeignKey(Trainer, on_delete=models.CASCADE, related_name='daily_stats')
+    dance_style = models.ForeignKey(DanceStyle, on_delete=models.CASCADE, related_name='daily_stats')
+    classes = models.PositiveIntegerField(default=0)
+    capacity = models.PositiveIntegerField(default=0)
+    booked = models.PositiveIntegerField(default=0)
+    attended = models.PositiveIntegerField(default=0)
+    missed = models.PositiveIntegerField(default=0)
+    cancelled = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ['date', 'trainer', 'dance_style', 'hour']
+        indexes = [models.Index(fields=['date'])]
+        verbose_name = 'Статистика занятий'
+        verbose_name_plural = 'Статистика занятий'
+
+    def __str__(self):
+        return f"{self.date} {self.hour}:00 - {self.dance_style_id}/{self.trainer_id}"
+
+
+class StatsWatermark(models.Model):
+    """Момент последнего пересчета агрегатов (по имени задачи)"""
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name}: {self.value}"
+
+
+class StatsDirtyDate(models.Model):
+    """Даты, затронутые удалениями: их не найти по updated_at"""
+    date = models.DateField(unique=True)
+
+
+class BackfillCheckpoint(models.Model):
+    """Докуда дошло заполнение столбцов (см. main.backfills)"""
+    name = models.CharField(max_length=50, unique=True)
+    lower = models.BigIntegerField(help_text="id, с которого начали")
+    position = models.BigIntegerField(help_text="Последний обработанный id")
+    upper = models.BigIntegerField(help_text="Максимальный id на момент первого запуска")
+    processed = models.PositiveIntegerField(default=0)
+    changed = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.position}/{self.upper}"
+
+
+class SearchEntry(models.Model):
+    """Документ поискового индекса: основы слов направления или преподавателя (см. main.search)"""
+    KIND_CHOICES = (
+        ('style', 'Направление'),
+        ('trainer', 'Преподаватель'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    text = models.TextField()
+
+    class Meta:
+        unique_together = ['kind', 'object_id']
+
+    def __str__(self):
+        return f"{self.kind}:{self.object_id}"
+
+
+class IdempotencyRecord(models.Model):
+    """Сохраненный ответ на запрос с заголовком Idempotency-Key (см. main.idempotency)"""
+    key = models.CharField(max_length=64, unique=True, help_text="sha256 от пользователя и ключа клиента")
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField()
+    body = models.TextField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key[:12]}... до {self.expires_at}"
+
+
+class OutboxEvent(models.Model):
+    """Изменение записи или занятия; пишется в одной транзакции с самим изменением (см. main.outbox)"""
+    TOPIC_CHOICES = (
+        ('booking', 'Запись'),
+        ('schedule', 'Занятие'),
+    )
+    ACTION_CHOICES = (
+        ('created', 'Создано'),
+        ('updated', 'Изменено'),
+        ('deleted', 'Удалено'),
+    )
+
+    topic = models.CharField(max_length=10, choices=TOPIC_CHOICES)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    object_id = models.BigIntegerField()
+    schedule_id = models.BigIntegerField(null=True, blank=True)
+    client_id = models.BigIntegerField(null=True, blank=True)
+    date = models.DateField(null=True, blank=True, help_text="Дата занятия")
+    status = models.CharField(max_length=10, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.id}: {self.topic} {self.object_id} {self.action}"
+
+
+class ConsumerOffset(models.Model):
+    """Последнее обработанное потребителем событие outbox"""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
     def __str__(self):
-        return f"{self.client} - {self.schedule}"
\ No newline at end of file
+        return f"{self.name}: {self.position}"
@@ -0,0 +1,153 @@
+"""Outbox событий по записям и занятиям для инкрементальных потребителей.
+
+Каждое изменение Booking и Schedule оставляет строку OutboxEvent в той же
+транзакции, что и само изменение: одиночные save()/delete() - через
+сигналы (см. signals), массовые bulk_create/bulk_update/update - явно,
+через функции этого модуля. Откатилось изменение - откатилось и событие.
+
+Потребитель (подкласс Consumer, зарегистрированный через @register)
+читает события по возрастанию id пачками и хранит позицию в
+ConsumerOffset. Обработка пачки и сдвиг позиции идут в одной транзакции,
+поэтому потребитель, который пишет только в базу, видит каждое событие
+ровно один раз; внешние действия (письма, сброс кэша) должны выдерживать
+повтор пачки. Запуск - команда consume_outbox.
+
+События моложе settings.OUTBOX_SETTLE_SECONDS не читаются: в базах, где
+транзакции фиксируются не в порядке выдачи id, более раннее событие
+может появиться уже после того, как потребитель прошел его id.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Booking, OutboxEvent, ConsumerOffset
+from .stats import refresh_dates
+
+
+BATCH_SIZE = 500
+UPDATE_CHUNK_SIZE = 500
+
+
+def booking_event(action, booking):
+    return OutboxEvent(
+        topic='booking',
+        action=action,
+        object_id=booking.id,
+        schedule_id=booking.schedule_id,
+        client_id=booking.client_id,
+        date=booking.class_date,
+        status=booking.status,
+    )
+
+
+def schedule_event(action, schedule):
+    return OutboxEvent(
+        topic='schedule',
+        action=action,
+        object_id=schedule.id,
+        schedule_id=schedule.id,
+        date=schedule.date,
+        status='active' if schedule.is_active else 'inactive',
+    )
+
+
+def record_bookings(action, bookings):
+    """События для пачки записей (bulk_create и bulk_update не отправляют сигналы)"""
+    OutboxEvent.objects.bulk_create([booking_event(action, b) for b in bookings], batch_size=BATCH_SIZE)
+
+
+def record_schedules(action, schedules):
+    """События для пачки занятий"""
+    OutboxEvent.objects.bulk_create([schedule_event(action, s) for s in schedules], batch_size=BATCH_SIZE)
+
+
+def update_bookings(bookings, **fields):
+    """
+    QuerySet.update для записей с событием на каждую измененную строку.
+
+    Строки блокируются и обновляются порциями по id в одной транзакции.
+    Возвращает количество обновленных записей.
+    """
+    updated = 0
+    with transaction.atomic():
+        ids = list(bookings.select_for_update().values_list('id', flat=True))
+        for start in range(0, len(ids), UPDATE_CHUNK_SIZE):
+            chunk = Booking.objects.filter(id__in=ids[start:start + UPDATE_CHUNK_SIZE])
+            updated += chunk.update(**fields)
+            record_bookings('updated', chunk.only('id', 'schedule_id', 'client_id', 'class_date', 'status'))
+    return updated
+
+
+def settle_delay():
+    return timedelta(seconds=getattr(settings, 'OUTBOX_SETTLE_SECONDS', 2))
+
+
+class Consumer:
+    """Потребитель событий: name - ключ позиции в ConsumerOffset, topics - нужные темы"""
+    name = None
+    topics = ('booking', 'schedule')
+
+    def handle(self, events):
+        raise NotImplementedError
+
+
+CONSUMERS = {}
+
+
+def register(consumer_class):
+    CONSUMERS[consumer_class.name] = consumer_class()
+    return consumer_class
+
+
+@register
+class DailyStatsConsumer(Consumer):
+    """Пересчет DailyClassStats по датам из событий, без ожидания refresh_stats"""
+    name = 'daily_class_stats'
+
+    def handle(self, events):
+        refresh_dates({event.date for event in events if event.date})
+
+
+def consume(consumer, batch_size=BATCH_SIZE):
+    """
+    Обрабатывает одну пачку событий после позиции потребителя.
+
+    Позиция блокируется на время обработки, поэтому два запуска одного
+    потребителя не возьмут одну пачку. Возвращает количество прочитанных событий.
+    """
+    ConsumerOffset.objects.get_or_create(name=consumer.name)
+    with transaction.atomic():
+        offset = ConsumerOffset.objects.select_for_update().get(name=consumer.name)
+        events = list(
+            OutboxEvent.objects.filter(id__gt=offset.position, created_at__lt=timezone.now() - settle_delay())
+            .order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0
+        wanted = [event for event in events if event.topic in consumer.topics]
+        if wanted:
+            consumer.handle(wanted)
+        offset.position = events[-1].id
+        offset.save(update_fields=['position', 'updated_at'])
+    return len(events)
+
+
+def drain(consumer, batch_size=BATCH_SIZE):
+    """Обрабатывает все накопившиеся события. Возвращает их количество"""
+    processed = 0
+    while True:
+        count = consume(consumer, batch_size)
+        if not count:
+            return processed
+        processed += count
+
+
+def prune():
+    """Удаляет события, которые прочитали все зарегистрированные потребители"""
+    positions = dict(ConsumerOffset.objects.filter(name__in=CONSUMERS).values_list('name', 'position'))
+    if set(positions) != set(CONSUMERS):
+        return 0
+    deleted, _ = OutboxEvent.objects.filter(id__lte=min(positions.values())).delete()
+    return deleted
@@ -0,0 +1,185 @@
+"""Абонементы: списание занятия при записи и возврат при отмене.
+
+Остаток хранится в ClassPass.balance и меняется только условным
+``UPDATE ... SET balance = balance - 1 WHERE id = ? AND balance > 0``
+в той же транзакции, что и запись на занятие: одновременные записи не
+уведут остаток в минус, а время записи не зависит от длины журнала.
+Каждое изменение добавляет строку в PassLedger; reconcile_passes сверяет
+сумму журнала с остатками.
+
+Если у клиента нет абонемента с остатком, запись без абонемента
+разрешена, пока не включен settings.CLASS_PASS_REQUIRED.
+
+Отмена возвращает занятие на абонемент, поэтому запись, которую потом
+снова отмечают (attended, missed), оплачивается заново - recharge.
+"""
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.utils import timezone
+
+from . import outbox
+from .models import ClassPass, PassLedger, Booking
+
+
+# Сколько раз искать другой абонемент, если остаток выбранного забрала параллельная запись
+CHARGE_ATTEMPTS = 3
+REPLAY_CHUNK_SIZE = 5000
+
+
+class NoClassPass(Exception):
+    """Нет абонемента с остатком, а абонемент обязателен (CLASS_PASS_REQUIRED)"""
+
+
+def required():
+    return getattr(settings, 'CLASS_PASS_REQUIRED', False)
+
+
+def issue(client, classes, expires_at=None):
+    """Новый абонемент с записью о покупке в журнале"""
+    with transaction.atomic():
+        class_pass = ClassPass.objects.create(client=client, classes=classes, balance=classes, expires_at=expires_at)
+        PassLedger.objects.create(class_pass=class_pass, delta=classes, reason='purchase')
+    return class_pass
+
+
+def usable(client_id):
+    """Абонементы клиента с остатком: сначала те, что раньше истекают"""
+    return ClassPass.objects.filter(
+        Q(expires_at__isnull=True) | Q(expires_at__gte=timezone.localdate()),
+        client_id=client_id,
+        balance__gt=0,
+    ).order_by(F('expires_at').asc(nulls_last=True), 'id')
+
+
+def charge(client_id):
+    """
+    Списывает одно занятие с абонемента клиента. Возвращает id абонемента или None.
+
+    Вызывается внутри транзакции записи; строку журнала добавляет record_charges
+    после сохранения записи.
+    """
+    for _ in range(CHARGE_ATTEMPTS):
+        pass_id = usable(client_id).values_list('id', flat=True).first()
+        if pass_id is None:
+            return None
+        if ClassPass.objects.filter(id=pass_id, balance__gt=0).update(balance=F('balance') - 1):
+            return pass_id
+    return None
+
+
+def record_charges(bookings):
+    """Строки журнала для записей, оплаченных абонементом (booking.class_pass_id задан)"""
+    PassLedger.objects.bulk_create([
+        PassLedger(class_pass_id=booking.class_pass_id, delta=-1, reason='booking', booking_id=booking.id)
+        for booking in bookings if booking.class_pass_id
+    ])
+
+
+def refund(bookings):
+    """
+    Возвращает занятия на абонементы для записей из queryset bookings.
+
+    Ссылка на абонемент у записи снимается, поэтому повторная отмена той же
+    записи второй раз ничего не вернет. Возвращает количество возвратов.
+    """
+    with transaction.atomic():
+        charged = list(
+            bookings.filter(class_pass__isnull=False).select_for_update().values_list('id', 'class_pass_id')
+        )
+        if not charged:
+            return 0
+        outbox.update_bookings(Booking.objects.filter(id__in=[booking_id for booking_id, _ in charged]), class_pass=None)
+        for pass_id, count in Counter(pass_id for _, pass_id in charged).items():
+            ClassPass.objects.filter(id=pass_id).update(balance=F('balance') + count)
+        PassLedger.objects.bulk_create([
+            PassLedger(class_pass_id=pass_id, delta=1, reason='refund', booking_id=booking_id)
+            for booking_id, pass_id in charged
+        ])
+    return len(charged)
+
+
+def recharge(bookings):
+    """
+    Снова списывает занятие за отмененные записи из queryset bookings.
+
+    Вызывается в транзакции до того, как записи выходят из статуса
+    'cancelled'. Без абонемента запись остается неоплаченной, а при
+    обязательном абонементе - NoClassPass (транзакция вызывающего
+    откатывается). Возвращает количество списаний.
+    """
+    with transaction.atomic():
+        cancelled = list(
+            bookings.filter(status='cancelled', class_pass__isnull=True).select_for_update()
+            .only('id', 'schedule_id', 'client_id', 'class_date', 'status', 'class_pass')
+        )
+        charged = []
+        for booking in cancelled:
+            pass_id = charge(booking.client_id)
+            if pass_id is None:
+                if required():
+                    raise NoClassPass(booking.client_id)
+                continue
+            booking.class_pass_id = pass_id
+            charged.append(booking)
+        Booking.objects.bulk_update(charged, ['class_pass'])
+        outbox.record_bookings('updated', charged)
+        record_charges(charged)
+    return len(charged)
+
+
+def replay(chunk_size=REPLAY_CHUNK_SIZE):
+    """
+    Остатки по журналу: {class_pass_id: сумма delta}.
+
+    Журнал читается порциями по id до максимального id на момент начала,
+    так что память не зависит от его длины. Возвращает (остатки, последний id).
+    """
+    last_id = PassLedger.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    balances = defaultdict(int)
+    cursor = 0
+    while cursor < last_id:
+        rows = list(
+            PassLedger.objects.filter(id__gt=cursor, id__lte=last_id)
+            .order_by('id').values_list('id', 'class_pass_id', 'delta')[:chunk_size]
+        )
+        if not rows:
+            break
+        for _, pass_id, delta in rows:
+            balances[pass_id] += delta
+        cursor = rows[-1][0]
+    return balances, last_id
+
+
+def reconcile(chunk_size=REPLAY_CHUNK_SIZE, fix=False):
+    """
+    Сверяет ClassPass.balance с журналом. Возвращает [(id абонемента, остаток, по журналу)].
+
+    Расхождения, найденные по снимку журнала, перепроверяются под блокировкой
+    абонемента (записи, сделанные во время сверки, не считаются ошибкой);
+    fix=True записывает в balance сумму журнала.
+    """
+    replayed, _ = replay(chunk_size)
+    suspects = []
+    cursor = 0
+    while True:
+        rows = list(ClassPass.objects.filter(id__gt=cursor).order_by('id').values_list('id', 'balance')[:chunk_size])
+        if not rows:
+            break
+        suspects.extend(pass_id for pass_id, balance in rows if replayed.get(pass_id, 0) != balance)
+        cursor = rows[-1][0]
+
+    mismatches = []
+    for pass_id in suspects:
+        with transaction.atomic():
+            class_pass = ClassPass.objects.select_for_update().filter(id=pass_id).first()
+            if class_pass is None:
+                continue
+            total = class_pass.ledger.aggregate(total=Sum('delta'))['total'] or 0
+            if total != class_pass.balance:
+                mismatches.append((pass_id, class_pass.balance, total))
+                if fix and total >= 0:
+                    ClassPass.objects.filter(id=pass_id).update(balance=total)
+    return mismatches
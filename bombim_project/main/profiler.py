@@ -0,0 +1,124 @@
+"""Профилирование отдельного запроса по требованию персонала.
+
+Запрос с заголовком ``X-Profile: 1`` или параметром ``?__profile=1`` от
+пользователя со is_staff выполняется под cProfile, параллельно поток-сэмплер
+снимает стек запроса каждые SAMPLE_INTERVAL секунд, а все SQL запросы
+записываются. Результат сохраняется в settings.PROFILER_DIR под id из
+заголовка ответа X-Profile-Id:
+
+    <id>.pstats     - для pstats / snakeviz
+    <id>.collapsed  - свернутые стеки для flamegraph.pl / speedscope
+    <id>.sql.txt    - SQL запросы с временем
+
+Для остальных запросов middleware делает одну проверку строки и ничего не
+импортирует. Частота ограничена областью 'profile' в THROTTLE_RATES.
+"""
+import cProfile
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from .throttling import client_ident, consume, get_rate
+
+
+SAMPLE_INTERVAL = 0.002
+PROFILE_ID_CHARS = set('0123456789abcdef-')
+
+
+def profiler_dir():
+    return getattr(settings, 'PROFILER_DIR', None) or os.path.join(settings.BASE_DIR, 'profiles')
+
+
+def profile_path(profile_id, suffix):
+    """Путь к файлу профиля; None для некорректного id"""
+    if not profile_id or set(profile_id) - PROFILE_ID_CHARS:
+        return None
+    return os.path.join(profiler_dir(), f'{profile_id}{suffix}')
+
+
+class StackSampler(threading.Thread):
+    """Периодически снимает стек заданного потока и считает одинаковые стеки"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class ProfilerMiddleware:
+    """Должен стоять после AuthenticationMiddleware"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    @staticmethod
+    def requested(request):
+        """Ровно X-Profile: 1 или ?__profile=1; строку запроса разбираем, только если в ней есть __profile"""
+        if request.META.get('HTTP_X_PROFILE') == '1':
+            return True
+        return '__profile=' in request.META.get('QUERY_STRING', '') and request.GET.get('__profile') == '1'
+
+    def __call__(self, request):
+        if not self.requested(request):
+            return self.get_response(request)
+        if not (request.user.is_authenticated and request.user.is_staff):
+            return self.get_response(request)
+
+        rate = get_rate('profile')
+        if rate and not consume('profile', client_ident(request), *rate)[0]:
+            return self.get_response(request)
+
+        return self.profile(request)
+
+    def profile(self, request):
+        profile_id = time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:8]
+        profiler = cProfile.Profile()
+        sampler = StackSampler(threading.get_ident())
+
+        started = time.perf_counter()
+        sampler.start()
+        with CaptureQueriesContext(connection) as queries:
+            response = profiler.runcall(self.get_response, request)
+        sampler.stop()
+        elapsed = time.perf_counter() - started
+
+        os.makedirs(profiler_dir(), exist_ok=True)
+        profiler.dump_stats(profile_path(profile_id, '.pstats'))
+        with open(profile_path(profile_id, '.collapsed'), 'w') as f:
+            f.write(sampler.collapsed())
+        with open(profile_path(profile_id, '.sql.txt'), 'w') as f:
+            f.write(f'# {request.method} {request.get_full_path()} - {elapsed * 1000:.1f} ms, '
+                    f'{len(queries)} SQL запросов\n')
+            for query in queries.captured_queries:
+                f.write(f'{query["time"]}s  {query["sql"]}\n')
+
+        response['X-Profile-Id'] = profile_id
+        response['X-Profile-Queries'] = str(len(queries))
+        return response
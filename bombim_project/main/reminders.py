@@ -0,0 +1,63 @@
+"""Напоминания о завтрашних занятиях.
+
+Все записи выбираются одним запросом с join'ами, письма рендерятся из
+один раз скомпилированного шаблона и уходят пачками через одно
+соединение с почтовым сервером. После каждой пачки отправленные записи
+отмечаются в BookingReminder, поэтому повторный запуск не шлет дубли.
+"""
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.template.loader import get_template
+
+from .models import Booking, BookingReminder
+
+
+SUBJECT = 'Напоминание о занятии в студии Bombim'
+TEMPLATE = 'main/emails/class_reminder.txt'
+
+
+def pending_reminders(class_date):
+    return (
+        Booking.objects.filter(class_date=class_date, status='booked', reminder__isnull=True)
+        .exclude(client__email='')
+        .select_related('client', 'schedule', 'schedule__dance_style', 'schedule__trainer__user')
+        .order_by('id')
+    )
+
+
+def send_reminders(class_date, chunk_size=500, connection=None, dry_run=False, progress=None):
+    """Отправляет напоминания на class_date. Возвращает количество писем"""
+    template = get_template(TEMPLATE)
+    connection = connection or get_connection()
+    sent = 0
+
+    def flush(batch):
+        nonlocal sent
+        if not batch:
+            return
+        if not dry_run:
+            connection.send_messages([message for _, message in batch])
+            BookingReminder.objects.bulk_create(
+                [BookingReminder(booking_id=booking_id) for booking_id, _ in batch],
+                ignore_conflicts=True,
+            )
+        sent += len(batch)
+        if progress:
+            progress(sent)
+
+    batch = []
+    with connection:
+        for booking in pending_reminders(class_date).iterator(chunk_size=chunk_size):
+            message = EmailMessage(
+                SUBJECT,
+                template.render({'booking': booking}),
+                settings.DEFAULT_FROM_EMAIL,
+                [booking.client.email],
+                connection=connection,
+            )
+            batch.append((booking.id, message))
+            if len(batch) >= chunk_size:
+                flush(batch)
+                batch = []
+        flush(batch)
+    return sent
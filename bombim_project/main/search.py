@@ -0,0 +1,223 @@
+"""Полнотекстовый поиск по направлениям, преподавателям и ближайшим занятиям.
+
+Для каждого направления (название, описание) и преподавателя (имя, фамилия,
+о себе) хранится строка SearchEntry с основами слов: окончания отрезаются
+простым стеммером, поэтому "сальсой" и "сальса" дают одну основу "сальс".
+В SQLite по этим строкам построена таблица FTS5 (миграция 0012), которую
+триггеры держат в синхроне; запрос ищет каждое слово префиксом ("сальс"*)
+и ранжирует по bm25. На других базах те же строки ищутся через LIKE.
+
+Слова времени суток и дней недели ("вечером", "в субботу") не ищутся в
+тексте, а становятся фильтрами по времени и дню занятия.
+"""
+import re
+from datetime import time as dtime, timedelta
+
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import SearchEntry, DanceStyle, Trainer, Schedule
+
+
+FTS_TABLE = 'main_searchentry_fts'
+DEFAULT_WEEKS = 4
+MAX_WEEKS = 12
+MAX_RESULTS = 50
+MIN_STEM = 3
+
+WORD_RE = re.compile(r'\w+')
+
+# Окончания существительных, прилагательных и глаголов - сначала длинные
+ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'иях', 'ях', 'ах', 'ией', 'ием', 'ий', 'ый', 'ой', 'ей', 'ом', 'ем',
+    'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ую', 'юю',
+    'ов', 'ев', 'ам', 'ям', 'ию', 'ия', 'ье', 'ья', 'ать', 'ять', 'ить', 'еть', 'ешь', 'ость', 'ости',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+
+# Начала слов -> интервал времени начала занятия
+PERIODS = (
+    (('утр',), (dtime(0, 0), dtime(12, 0))),
+    (('днем', 'днём', 'днев'), (dtime(12, 0), dtime(17, 0))),
+    (('вечер',), (dtime(17, 0), dtime(23, 59, 59))),
+)
+
+# Начала слов и сокращения -> день недели (как Schedule.day_of_week)
+WEEKDAYS = (
+    (('понедельн', 'пн'), 0),
+    (('вторн', 'вт'), 1),
+    (('сред', 'ср'), 2),
+    (('четверг', 'чт'), 3),
+    (('пятниц', 'пт'), 4),
+    (('суббот', 'сб'), 5),
+    (('воскрес', 'вс'), 6),
+)
+
+_fts_available = None
+
+
+def stem(word):
+    word = word.lower().replace('ё', 'е')
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def stem_text(text):
+    return ' '.join(stem(word) for word in WORD_RE.findall(text or ''))
+
+
+def style_text(style):
+    return stem_text(f'{style.name} {style.description}')
+
+
+def trainer_text(trainer):
+    return stem_text(f'{trainer.user.first_name} {trainer.user.last_name} {trainer.bio}')
+
+
+def fts_available():
+    """Есть ли таблица FTS5 (только SQLite после миграции 0012)"""
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+    return _fts_available
+
+
+# Поддержание индекса
+
+def index_style(style):
+    SearchEntry.objects.update_or_create(kind='style', object_id=style.pk, defaults={'text': style_text(style)})
+
+
+def index_trainer(trainer):
+    SearchEntry.objects.update_or_create(kind='trainer', object_id=trainer.pk, defaults={'text': trainer_text(trainer)})
+
+
+def index_trainers(trainers):
+    """Пачка новых преподавателей (bulk_create не отправляет сигналы)"""
+    SearchEntry.objects.bulk_create(
+        [SearchEntry(kind='trainer', object_id=t.pk, text=trainer_text(t)) for t in trainers],
+        batch_size=500,
+    )
+
+
+def remove_entry(kind, object_id):
+    SearchEntry.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def rebuild():
+    """Полностью пересобирает индекс. Возвращает количество документов"""
+    entries = [
+        SearchEntry(kind='style', object_id=style.id, text=style_text(style))
+        for style in DanceStyle.objects.all()
+    ] + [
+        SearchEntry(kind='trainer', object_id=trainer.id, text=trainer_text(trainer))
+        for trainer in Trainer.objects.select_related('user')
+    ]
+    with transaction.atomic():
+        SearchEntry.objects.all().delete()
+        SearchEntry.objects.bulk_create(entries, batch_size=500)
+        if fts_available():
+            with connection.cursor() as cursor:
+                cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return len(entries)
+
+
+# Запросы
+
+def parse_query(query):
+    """'сальса вечером' -> (['сальс'], [(17:00, 23:59:59)], [])"""
+    terms, periods, weekdays = [], [], []
+    for word in WORD_RE.findall((query or '').lower()):
+        period = next((r for prefixes, r in PERIODS if word.startswith(prefixes)), None)
+        weekday = next((d for prefixes, d in WEEKDAYS if word == prefixes[1] or word.startswith(prefixes[0])), None)
+        if period is not None:
+            periods.append(period)
+        elif weekday is not None:
+            weekdays.append(weekday)
+        elif len(word) > 1 or word.isdigit():
+            terms.append(stem(word))
+    return terms, periods, weekdays
+
+
+def match_term(term):
+    """{(kind, object_id): релевантность} для одной основы; больше - лучше"""
+    if fts_available():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT e.kind, e.object_id, -bm25({FTS_TABLE}) FROM {FTS_TABLE} '
+                f'JOIN main_searchentry e ON e.id = {FTS_TABLE}.rowid WHERE {FTS_TABLE} MATCH %s',
+                [f'"{term}"*'],
+            )
+            return {(kind, object_id): score for kind, object_id, score in cursor.fetchall()}
+
+    entries = SearchEntry.objects.filter(Q(text__startswith=term) | Q(text__contains=f' {term}'))
+    return {(kind, object_id): 1.0 for kind, object_id in entries.values_list('kind', 'object_id')}
+
+
+def matching_ids(kind, query):
+    """id объектов kind, в документе которых есть все слова запроса; None - пустой запрос"""
+    terms = [stem(word) for word in WORD_RE.findall((query or '').lower())]
+    if not terms:
+        return None
+    ids = None
+    for term in terms:
+        found = {object_id for (entry_kind, object_id) in match_term(term) if entry_kind == kind}
+        ids = found if ids is None else ids & found
+    return ids
+
+
+def search_classes(query, weeks=DEFAULT_WEEKS, limit=MAX_RESULTS):
+    """
+    Ближайшие занятия, подходящие под запрос, от более релевантных к менее.
+
+    Каждое слово запроса должно найтись в направлении или в преподавателе
+    занятия; релевантность занятия - сумма лучших оценок по словам.
+    """
+    terms, periods, weekdays = parse_query(query)
+    if not (terms or periods or weekdays):
+        return []
+
+    now = timezone.localtime()
+    today = now.date()
+    schedules = Schedule.objects.filter(
+        Q(date__gt=today) | Q(date=today, start_time__gte=now.time()),
+        is_active=True,
+        date__lt=today + timedelta(weeks=weeks),
+    )
+    if periods:
+        in_period = Q()
+        for start, end in periods:
+            in_period |= Q(start_time__gte=start, start_time__lt=end)
+        schedules = schedules.filter(in_period)
+    if weekdays:
+        schedules = schedules.filter(day_of_week__in=weekdays)
+
+    matches = [match_term(term) for term in terms]
+    if terms:
+        style_ids = {object_id for found in matches for (kind, object_id) in found if kind == 'style'}
+        trainer_ids = {object_id for found in matches for (kind, object_id) in found if kind == 'trainer'}
+        if not (style_ids or trainer_ids):
+            return []
+        schedules = schedules.filter(Q(dance_style_id__in=style_ids) | Q(trainer_id__in=trainer_ids))
+
+    schedules = schedules.select_related('dance_style', 'trainer__user').annotate(
+        booked=Count('bookings', filter=Q(bookings__status='booked')),
+    )
+
+    ranked = []
+    for schedule in schedules:
+        score = 0.0
+        for found in matches:
+            scores = [found[key] for key in (('style', schedule.dance_style_id), ('trainer', schedule.trainer_id))
+                      if key in found]
+            if not scores:
+                break
+            score += max(scores)
+        else:
+            ranked.append((score, schedule))
+
+    ranked.sort(key=lambda item: (-item[0], item[1].date, item[1].start_time))
+    return ranked[:limit]
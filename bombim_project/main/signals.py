@@ -0,0 +1,161 @@
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .backends import invalidate_cached_user
+from . import outbox, search
+from .caching import bump_catalog_version
+from .models import User, Schedule, Booking, DanceStyle, Trainer
+from .stats import mark_dates_dirty
+from .thumbnails import build_variants
+
+
+# Удаленные строки не видны по updated_at - запоминаем их даты для refresh_stats
+@receiver(post_delete, sender=Schedule)
+def schedule_deleted(sender, instance, **kwargs):
+    mark_dates_dirty([instance.date])
+
+
+@receiver(post_delete, sender=Booking)
+def booking_deleted(sender, instance, **kwargs):
+    mark_dates_dirty([instance.class_date])
+
+
+# Занятие, перенесенное на другую дату, и запись, перенесенная на другое занятие,
+# по updated_at видны только на новой дате - старую тоже запоминаем
+@receiver(pre_save, sender=Schedule)
+def schedule_moved(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding or (update_fields is not None and 'date' not in update_fields):
+        return
+    old_date = Schedule.objects.filter(pk=instance.pk).values_list('date', flat=True).first()
+    if old_date is not None and old_date != instance.date:
+        mark_dates_dirty([old_date])
+
+
+@receiver(pre_save, sender=Booking)
+def booking_moved(sender, instance, update_fields=None, **kwargs):
+    if instance._state.adding or (
+        update_fields is not None and not {'schedule', 'class_date'} & set(update_fields)
+    ):
+        return
+    old = Booking.objects.filter(pk=instance.pk).values_list('schedule_id', 'schedule__date', 'class_date').first()
+    if old is not None and (old[0], old[2]) != (instance.schedule_id, instance.class_date):
+        mark_dates_dirty(old[1:])
+
+
+# События outbox пишутся в транзакции save()/delete() (см. Schedule.save, Booking.save)
+@receiver(post_save, sender=Booking)
+def booking_event_saved(sender, instance, created, **kwargs):
+    outbox.record_bookings('created' if created else 'updated', [instance])
+
+
+@receiver(post_delete, sender=Booking)
+def booking_event_deleted(sender, instance, **kwargs):
+    outbox.record_bookings('deleted', [instance])
+
+
+@receiver(post_save, sender=Schedule)
+def schedule_event_saved(sender, instance, created, **kwargs):
+    outbox.record_schedules('created' if created else 'updated', [instance])
+
+
+@receiver(post_delete, sender=Schedule)
+def schedule_event_deleted(sender, instance, **kwargs):
+    outbox.record_schedules('deleted', [instance])
+
+
+# Уменьшенные копии готовим сразу после загрузки, а не на первом показе.
+# Только когда файл сменился: обычное сохранение (описание, имя) картинку не трогает
+IMAGE_FIELDS = {DanceStyle: 'image', Trainer: 'photo'}
+
+
+@receiver(pre_save, sender=DanceStyle)
+@receiver(pre_save, sender=Trainer)
+def remember_image(sender, instance, update_fields=None, **kwargs):
+    field = IMAGE_FIELDS[sender]
+    if instance._state.adding or (update_fields is not None and field not in update_fields):
+        instance._stored_image = None
+        return
+    instance._stored_image = sender.objects.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+def _image_changed(instance, field, update_fields):
+    image = getattr(instance, field)
+    if not image or (update_fields is not None and field not in update_fields):
+        return False
+    return image.name != getattr(instance, '_stored_image', None)
+
+
+@receiver(post_save, sender=DanceStyle)
+def style_saved(sender, instance, update_fields=None, **kwargs):
+    if _image_changed(instance, 'image', update_fields):
+        build_variants(instance.image.name, instance.image.storage)
+
+
+@receiver(post_save, sender=Trainer)
+def trainer_saved(sender, instance, update_fields=None, **kwargs):
+    if _image_changed(instance, 'photo', update_fields):
+        build_variants(instance.photo.name, instance.photo.storage)
+
+
+# Страницы каталога в кэше зависят от направлений, преподавателей и их имен
+for model in (DanceStyle, Trainer):
+    post_save.connect(bump_catalog_version, sender=model, dispatch_uid=f'catalog_save_{model.__name__}')
+    post_delete.connect(bump_catalog_version, sender=model, dispatch_uid=f'catalog_delete_{model.__name__}')
+m2m_changed.connect(bump_catalog_version, sender=Trainer.styles.through, dispatch_uid='catalog_trainer_styles')
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    invalidate_cached_user(instance.pk)
+    # Вход обновляет только last_login - каталог от этого не меняется
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    if instance.role == 'trainer':
+        bump_catalog_version()
+        # Имя преподавателя есть в поисковом индексе
+        trainer = Trainer.objects.filter(user=instance).first()
+        if trainer is not None:
+            trainer.user = instance
+            search.index_trainer(trainer)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    invalidate_cached_user(instance.pk)
+    if instance.role == 'trainer':
+        bump_catalog_version()
+
+
+# Пользователь кэшируется вместе с профилем преподавателя (см. backends)
+@receiver(post_save, sender=Trainer)
+@receiver(post_delete, sender=Trainer)
+def trainer_changed(sender, instance, **kwargs):
+    invalidate_cached_user(instance.user_id)
+
+
+@receiver(user_logged_out)
+def user_logged_out_handler(sender, request, user, **kwargs):
+    if user is not None:
+        invalidate_cached_user(user.pk)
+
+
+# Поисковый индекс (main.search): массовая пересборка - команда rebuild_search_index
+@receiver(post_save, sender=DanceStyle)
+def style_indexed(sender, instance, **kwargs):
+    search.index_style(instance)
+
+
+@receiver(post_delete, sender=DanceStyle)
+def style_unindexed(sender, instance, **kwargs):
+    search.remove_entry('style', instance.pk)
+
+
+@receiver(post_save, sender=Trainer)
+def trainer_indexed(sender, instance, **kwargs):
+    search.index_trainer(instance)
+
+
+@receiver(post_delete, sender=Trainer)
+def trainer_unindexed(sender, instance, **kwargs):
+    search.remove_entry('trainer', instance.pk)
@@ -0,0 +1,182 @@
+"""Инкрементальный пересчет агрегата DailyClassStats.
+
+Пересчитываются только даты, затронутые после последнего водяного знака:
+занятия и записи с ``updated_at`` позже него, плюс даты из StatsDirtyDate
+(туда сигналы пишут даты удаленных занятий и записей, а также старые даты
+перенесенных занятий и записей).
+
+updated_at ставится при save(), а виден другим соединениям только после
+commit, поэтому изменения читаются с запасом settings.STATS_WATERMARK_OVERLAP
+секунд до водяного знака: строка, записанная транзакцией, которая
+завершилась уже после начала прошлого пересчета, попадет в этот. Запас
+должен быть больше самой длинной транзакции записи; даты из запаса
+пересчитываются повторно, это безопасно.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+
+from .models import (
+    Schedule, Booking, DanceStyle, Trainer, ArchivedSchedule, ArchivedBooking,
+    DailyClassStats, StatsWatermark, StatsDirtyDate,
+)
+
+
+WATERMARK_NAME = 'daily_class_stats'
+DATES_PER_BATCH = 200
+
+
+def watermark_overlap():
+    return timedelta(seconds=getattr(settings, 'STATS_WATERMARK_OVERLAP', 60))
+
+
+def mark_dates_dirty(dates):
+    """Запоминает даты, которые нужно пересчитать (для удалений и QuerySet.update)"""
+    StatsDirtyDate.objects.bulk_create(
+        [StatsDirtyDate(date=d) for d in set(dates) if d],
+        ignore_conflicts=True,
+    )
+
+
+def touched_dates(since):
+    """Даты, изменившиеся после since (None - все даты)"""
+    if since is None:
+        dates = set(Schedule.objects.values_list('date', flat=True).distinct())
+        dates.update(ArchivedSchedule.objects.values_list('date', flat=True).distinct())
+        return dates
+
+    dates = set(Schedule.objects.filter(updated_at__gt=since).values_list('date', flat=True).distinct())
+    dates.update(
+        Booking.objects.filter(updated_at__gt=since).values_list('schedule__date', flat=True).distinct()
+    )
+    dates.update(StatsDirtyDate.objects.values_list('date', flat=True))
+    return dates
+
+
+def _aggregate(dates):
+    """Считает строки агрегата для набора дат (горячие и архивные таблицы)"""
+    rows = {}
+    # В архиве статусы уже окончательные, в горячей таблице считаем по effective_status
+    for schedule_model, bookings in (
+        (Schedule, Booking.objects.with_effective_status()),
+        (ArchivedSchedule, ArchivedBooking.objects.annotate(effective_status=F('status'))),
+    ):
+        for item in (
+            schedule_model.objects.filter(date__in=dates)
+            .annotate(hour=ExtractHour('start_time'))
+            .values('date', 'hour', 'trainer_id', 'dance_style_id')
+            .annotate(classes=Count('id'), capacity=Sum('max_participants'))
+            .order_by()
+        ):
+            key = (item['date'], item['hour'], item['trainer_id'], item['dance_style_id'])
+            stats = rows.setdefault(key, DailyClassStats(
+                date=item['date'],
+                day_of_week=item['date'].weekday(),
+                hour=item['hour'],
+                trainer_id=item['trainer_id'],
+                dance_style_id=item['dance_style_id'],
+            ))
+            stats.classes += item['classes']
+            stats.capacity += item['capacity'] or 0
+
+        for item in (
+            bookings.filter(schedule__date__in=dates)
+            .annotate(hour=ExtractHour('schedule__start_time'))
+            .values('schedule__date', 'hour', 'schedule__trainer_id', 'schedule__dance_style_id')
+            .annotate(
+                booked=Count('id', filter=Q(effective_status='booked')),
+                attended=Count('id', filter=Q(effective_status='attended')),
+                missed=Count('id', filter=Q(effective_status='missed')),
+                cancelled=Count('id', filter=Q(effective_status='cancelled')),
+            )
+            .order_by()
+        ):
+            key = (item['schedule__date'], item['hour'], item['schedule__trainer_id'], item['schedule__dance_style_id'])
+            stats = rows.get(key)
+            if stats is None:
+                continue
+            stats.booked += item['booked']
+            stats.attended += item['attended']
+            stats.missed += item['missed']
+            stats.cancelled += item['cancelled']
+    return list(rows.values())
+
+
+def refresh_dates(dates):
+    """Полностью пересобирает строки агрегата для указанных дат"""
+    dates = sorted(set(dates))
+    refreshed = 0
+    for start in range(0, len(dates), DATES_PER_BATCH):
+        batch = dates[start:start + DATES_PER_BATCH]
+        with transaction.atomic():
+            DailyClassStats.objects.filter(date__in=batch).delete()
+            rows = DailyClassStats.objects.bulk_create(_aggregate(batch), batch_size=500)
+        refreshed += len(rows)
+    return refreshed
+
+
+def refresh_stats(full=False):
+    """
+    Пересчитывает агрегат начиная с последнего водяного знака.
+
+    Новый водяной знак берется до чтения изменений, а читаются изменения
+    с запасом watermark_overlap() до прошлого знака, поэтому правки, сделанные
+    или зафиксированные во время пересчета, попадут в следующий запуск.
+    Возвращает (количество дат, количество строк агрегата).
+    """
+    started = timezone.now()
+    watermark = StatsWatermark.objects.filter(name=WATERMARK_NAME).first()
+    since = None if full or watermark is None else watermark.value - watermark_overlap()
+
+    dirty = list(StatsDirtyDate.objects.values_list('id', flat=True))
+    dates = touched_dates(since)
+    if full:
+        dates.update(DailyClassStats.objects.values_list('date', flat=True).distinct())
+
+    rows = refresh_dates(dates)
+
+    with transaction.atomic():
+        StatsDirtyDate.objects.filter(id__in=dirty).delete()
+        StatsWatermark.objects.update_or_create(name=WATERMARK_NAME, defaults={'value': started})
+    return len(dates), rows
+
+
+def report(queryset, group_by):
+    """Сводка по агрегату: group_by - одно из полей DailyClassStats"""
+    rows = (
+        queryset.values(group_by)
+        .annotate(
+            classes=Sum('classes'),
+            capacity=Sum('capacity'),
+            booked=Sum('booked'),
+            attended=Sum('attended'),
+            missed=Sum('missed'),
+            cancelled=Sum('cancelled'),
+        )
+        .order_by(group_by)
+    )
+    result = []
+    for row in rows:
+        taken = row['booked'] + row['attended'] + row['missed']
+        visits = row['attended'] + row['missed']
+        row['fill_rate'] = round(taken / row['capacity'] * 100, 1) if row['capacity'] else 0
+        row['attendance_rate'] = round(row['attended'] / visits * 100, 1) if visits else 0
+        result.append(row)
+    return result
+
+
+def group_labels(group_by):
+    """Подписи для значений группировки (один запрос на справочник)"""
+    if group_by == 'trainer':
+        return {t.id: str(t) for t in Trainer.objects.select_related('user')}
+    if group_by == 'dance_style':
+        return dict(DanceStyle.objects.values_list('id', 'name'))
+    if group_by == 'day_of_week':
+        return dict(Schedule.DAYS_OF_WEEK)
+    if group_by == 'hour':
+        return {h: f'{h:02d}:00' for h in range(24)}
+    return {}
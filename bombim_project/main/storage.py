@@ -0,0 +1,45 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Хэшированные имена статики плюс заранее сжатые .gz копии.
+
+    Сжатие выполняется один раз при collectstatic, поэтому при отдаче
+    файлов (см. main.middleware.StaticFilesMiddleware) CPU не тратится.
+
+    Без манифеста (collectstatic не запускался: тесты, локальный запуск с
+    DEBUG=False) {% static %} отдает имя без хэша вместо ValueError.
+    """
+    manifest_strict = False
+    compressible_extensions = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.map')
+    min_compress_size = 256
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # Файла нет и в STATIC_ROOT - хэш посчитать не из чего
+            return name
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+
+        for name in set(self.hashed_files.values()):
+            if name.endswith(self.compressible_extensions):
+                self._write_gzip(name)
+
+    def _write_gzip(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < self.min_compress_size:
+            return
+        compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) < len(data):
+            with open(path + '.gz', 'wb') as f:
+                f.write(compressed)
@@ -0,0 +1,31 @@
+from django import template
+from django.utils.html import format_html
+
+from main.thumbnails import get_variants, srcset, largest
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(field_file, alt='', css_class='', sizes='(max-width: 768px) 100vw, 400px'):
+    """
+    <picture> с WebP/JPEG вариантами и ленивой загрузкой.
+
+    Если варианты создать не удалось, выводит обычный <img> на исходный файл.
+    """
+    variants = get_variants(field_file)
+    if not variants:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy" decoding="async">',
+            field_file.url, alt, css_class,
+        )
+
+    storage = field_file.storage
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy" decoding="async">'
+        '</picture>',
+        srcset(variants, 'webp', storage), sizes,
+        largest(variants, 'jpg', storage), srcset(variants, 'jpg', storage), sizes, alt, css_class,
+    )
@@ -1,3 +1,1064 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+import time as clock
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import IntegrityError, connection, close_old_connections, transaction
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.models import Session
+from django.test import Client, RequestFactory, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    admission, archive, backfills, checkin, conflicts, metrics, outbox, passes, reminders, search, stats,
+    throttling, timetable,
+)
+from .backends import CachedModelBackend, cached_user_key
+from .forms import CustomUserCreationForm
+from .importers import UserImporter
+from .profiler import ProfilerMiddleware
+from .management.commands.page_weight import Command as PageWeightCommand
+from .models import (
+    User, DanceStyle, Trainer, Schedule, Booking, PassLedger, DailyClassStats, StatsWatermark,
+    BackfillCheckpoint, ConsumerOffset, OutboxEvent, Room, BookingReminder, StatsDirtyDate,
+    ArchivedSchedule, ArchivedBooking,
+)
+
+
+NO_THROTTLE = {'book': '100000/m', 'cancel': '100000/m'}
+
+
+def make_client(number):
+    return User.objects.create(
+        username=f'client{number}', email=f'client{number}@test.invalid',
+        phone=f'+7901{number:07d}', first_name='Клиент', last_name=f'Тестовый{number}', role='client',
+    )
+
+
+def make_schedule(max_participants=10, days=7, **fields):
+    style = DanceStyle.objects.first() or DanceStyle.objects.create(name='Сальса', description='')
+    trainer = Trainer.objects.first()
+    if trainer is None:
+        user = User.objects.create(
+            username='trainer', email='trainer@test.invalid', phone='+79000000000',
+            first_name='Преподаватель', last_name='Тестовый', role='trainer',
+        )
+        trainer = Trainer.objects.create(user=user, bio='')
+    fields = {'start_time': time(19, 0), 'end_time': time(20, 0), **fields}
+    return Schedule.objects.create(
+        date=timezone.localdate() + timedelta(days=days),
+        dance_style=style,
+        trainer=trainer,
+        max_participants=max_participants,
+        **fields,
+    )
+
+
+def run_parallel(function, items, threads=10):
+    """Вызывает function(item) в пуле потоков, у каждого потока свое соединение с базой"""
+    def call(item):
+        try:
+            return function(item)
+        finally:
+            close_old_connections()
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        return list(pool.map(call, items))
+
+
+@override_settings(THROTTLE_RATES=NO_THROTTLE)
+class BookingRushTests(TransactionTestCase):
+    """Одновременная запись на занятие (сценарий loadtest с --rush-capacity)"""
+
+    def test_concurrent_bookings_do_not_exceed_capacity(self):
+        schedule = make_schedule(max_participants=5)
+        clients = [make_client(number) for number in range(30)]
+
+        def book(user):
+            client = Client()
+            client.force_login(user)
+            return client.post(f'/book/{schedule.id}/').json()
+
+        responses = run_parallel(book, clients)
+
+        booked = Booking.objects.filter(schedule=schedule, status='booked').count()
+        self.assertEqual(booked, 5)
+        self.assertEqual(sum(response['success'] for response in responses), 5)
+
+
+@override_settings(THROTTLE_RATES=NO_THROTTLE)
+class AdmissionQueueTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(ADMISSION_SINGLE_PROCESS=False, ADMISSION_INPROCESS_WORKER=False)
+    def test_opening_mode_books_directly_without_shared_cache(self):
+        schedule = make_schedule(opening_mode=True)
+        client = Client()
+        client.force_login(make_client(1))
+
+        response = client.post(f'/book/{schedule.id}/').json()
+
+        self.assertTrue(response['success'])
+        self.assertNotIn('queued', response)
+        self.assertTrue(Booking.objects.filter(schedule=schedule).exists())
+
+    @override_settings(ADMISSION_SINGLE_PROCESS=True, ADMISSION_INPROCESS_WORKER=False)
+    def test_lost_entry_gets_terminal_expired_result(self):
+
+        schedule = make_schedule(opening_mode=True)
+        user = make_client(1)
+        client = Client()
+        client.force_login(user)
+        ticket = client.post(f'/book/{schedule.id}/').json()['ticket']
+        cache.delete(admission._entry_key(schedule.id, 1))
+
+        with mock.patch.object(admission, 'MISSING_GRACE', 0):
+            admission.drain_all()
+            admission.drain_all()
+
+        response = client.get(f'/book/ticket/{ticket}/').json()
+        self.assertFalse(response['pending'])
+        self.assertTrue(response['expired'])
+        self.assertFalse(Booking.objects.filter(schedule=schedule).exists())
+
+    @override_settings(ADMISSION_SINGLE_PROCESS=True, ADMISSION_INPROCESS_WORKER=False)
+    def test_drain_stops_when_worker_lock_is_lost(self):
+
+        schedule = make_schedule(opening_mode=True)
+        for number in range(3):
+            admission.enqueue(schedule.id, make_client(number).id)
+
+        calls = []
+
+        def renew():
+            calls.append(1)
+            cache.set(admission.WORKER_LOCK_KEY, 'another-worker')
+            return len(calls) == 1
+
+        self.assertEqual(admission.drain(schedule.id, batch_size=1, renew=renew), 1)
+        self.assertEqual(Booking.objects.filter(schedule=schedule).count(), 1)
+
+    @override_settings(ADMISSION_SINGLE_PROCESS=True, ADMISSION_INPROCESS_WORKER=False)
+    def test_places_given_in_ticket_order_up_to_capacity(self):
+        schedule = make_schedule(max_participants=3, opening_mode=True)
+        users = [make_client(number) for number in range(5)]
+        tickets = [admission.enqueue(schedule.id, user.id) for user in users]
+        admission.enqueue(schedule.id, users[0].id)
+
+        self.assertEqual(admission.drain(schedule.id, batch_size=2), 6)
+
+        results = [admission.get_result(ticket, user.id) for ticket, user in zip(tickets, users)]
+        self.assertEqual([result['success'] for result in results], [True, True, True, False, False])
+        self.assertEqual(
+            set(Booking.objects.filter(schedule=schedule).values_list('client_id', flat=True)),
+            {user.id for user in users[:3]},
+        )
+        self.assertIsNone(admission.get_result(tickets[0], users[1].id))
+
+
+class ClassPassTests(TransactionTestCase):
+    def test_concurrent_charges_keep_balance_and_ledger(self):
+        client = make_client(1)
+        class_pass = passes.issue(client, 3)
+        schedules = [make_schedule(days=day) for day in range(1, 21)]
+
+        def charge(schedule):
+            with transaction.atomic():
+                pass_id = passes.charge(client.id)
+                if pass_id is not None:
+                    booking = Booking.objects.create(
+                        client=client, schedule=schedule, class_date=schedule.date, class_pass_id=pass_id,
+                    )
+                    passes.record_charges([booking])
+            return pass_id
+
+        charged = [pass_id for pass_id in run_parallel(charge, schedules) if pass_id is not None]
+
+        class_pass.refresh_from_db()
+        self.assertEqual(len(charged), 3)
+        self.assertEqual(class_pass.balance, 0)
+        self.assertEqual(PassLedger.objects.filter(class_pass=class_pass, reason='booking').count(), 3)
+        self.assertEqual(passes.reconcile(), [])
+
+    def test_roll_call_charges_again_when_booking_leaves_cancelled(self):
+        client = make_client(1)
+        class_pass = passes.issue(client, 2)
+        schedule = make_schedule()
+        booking = Booking.objects.create(
+            client=client, schedule=schedule, class_date=schedule.date, class_pass_id=passes.charge(client.id),
+        )
+        passes.record_charges([booking])
+
+        trainer = Client()
+        trainer.force_login(schedule.trainer.user)
+        url = f'/roll-call/{schedule.id}/{schedule.date:%Y-%m-%d}/'
+        for status in ('cancelled', 'attended'):
+            response = trainer.post(url, json.dumps({'statuses': {str(client.id): status}}),
+                                    content_type='application/json')
+            self.assertTrue(response.json()['success'])
+
+        booking.refresh_from_db()
+        class_pass.refresh_from_db()
+        self.assertEqual(booking.status, 'attended')
+        self.assertEqual(booking.class_pass_id, class_pass.id)
+        self.assertEqual(class_pass.balance, 1)
+        self.assertEqual(passes.reconcile(), [])
+
+    @override_settings(THROTTLE_RATES=NO_THROTTLE)
+    def test_booking_charges_pass_and_cancel_refunds_it(self):
+        user = make_client(1)
+        class_pass = passes.issue(user, 5)
+        schedule = make_schedule()
+        client = Client()
+        client.force_login(user)
+
+        self.assertTrue(client.post(f'/book/{schedule.id}/').json()['success'])
+        booking = Booking.objects.get(schedule=schedule, client=user)
+        class_pass.refresh_from_db()
+        self.assertEqual((booking.class_pass_id, class_pass.balance), (class_pass.id, 4))
+
+        self.assertTrue(client.post(f'/cancel-booking/{booking.id}/').json()['success'])
+        class_pass.refresh_from_db()
+        self.assertEqual(class_pass.balance, 5)
+        self.assertEqual(
+            list(PassLedger.objects.filter(class_pass=class_pass).order_by('id').values_list('reason', 'delta')),
+            [('purchase', 5), ('booking', -1), ('refund', 1)],
+        )
+        self.assertEqual(passes.reconcile(), [])
+
+    @override_settings(CLASS_PASS_REQUIRED=True)
+    def test_mark_attended_is_refused_without_pass(self):
+        client = make_client(1)
+        schedule = make_schedule()
+        booking = Booking.objects.create(client=client, schedule=schedule, class_date=schedule.date, status='cancelled')
+
+        trainer = Client()
+        trainer.force_login(schedule.trainer.user)
+        response = trainer.post(f'/mark-class-attended/{schedule.id}/{schedule.date:%Y-%m-%d}/')
+
+        self.assertFalse(response.json()['success'])
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'cancelled')
+
+
+class StatsRefreshTests(TransactionTestCase):
+    def test_moved_schedule_leaves_no_stats_on_old_date(self):
+        schedule = make_schedule()
+        stats.refresh_stats()
+        old_date = schedule.date
+
+        schedule.date = old_date + timedelta(days=1)
+        schedule.save()
+        stats.refresh_stats()
+
+        self.assertFalse(DailyClassStats.objects.filter(date=old_date).exists())
+        self.assertTrue(DailyClassStats.objects.filter(date=schedule.date).exists())
+
+    def test_change_committed_after_watermark_is_counted(self):
+        schedule = make_schedule()
+        stats.refresh_stats()
+
+        # Запись сохранена до водяного знака, но зафиксирована после пересчета
+        watermark = StatsWatermark.objects.get(name=stats.WATERMARK_NAME).value
+        booking = Booking.objects.create(client=make_client(1), schedule=schedule, class_date=schedule.date)
+        Booking.objects.filter(id=booking.id).update(updated_at=watermark - timedelta(seconds=1))
+        stats.refresh_stats()
+
+        self.assertEqual(DailyClassStats.objects.get(date=schedule.date).booked, 1)
+
+
+class PageWeightTests(TransactionTestCase):
+    def test_public_pages_fit_gzip_budget(self):
+        # Неделя расписания: по три занятия в день
+        for day in range(7):
+            for hour in (10, 18, 20):
+                make_schedule(days=day + 1, start_time=time(hour, 0), end_time=time(hour + 1, 0))
+
+        client = Client()
+        for name in PageWeightCommand.PUBLIC_PAGES:
+            response = client.get(reverse(name), follow=True)
+            self.assertEqual(response.status_code, 200, name)
+            self.assertLessEqual(len(gzip.compress(response.content)), PageWeightCommand.GZIP_BUDGET, name)
+
+
+class ThumbnailSignalTests(TransactionTestCase):
+    @mock.patch('main.signals.build_variants')
+    def test_variants_are_built_only_when_image_changes(self, build_variants):
+        style = DanceStyle.objects.create(name='Бачата', description='', image='styles/bachata.jpg')
+        self.assertEqual(build_variants.call_count, 1)
+
+        style.description = 'Парный танец'
+        style.save()
+        self.assertEqual(build_variants.call_count, 1)
+
+        style.image = 'styles/bachata-2.jpg'
+        style.save()
+        self.assertEqual(build_variants.call_count, 2)
+        build_variants.assert_called_with('styles/bachata-2.jpg', style.image.storage)
+
+
+class ThrottleTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_rejected_requests_do_not_spend_tokens(self):
+        now = 6000.0
+        results = [throttling.consume('test', 'ip1', 2, 60, now=now)[0] for _ in range(7)]
+        self.assertEqual(results, [True, True] + [False] * 5)
+
+        # Через полтора окна от двух разрешенных запросов остался вклад в один токен
+        self.assertTrue(throttling.consume('test', 'ip1', 2, 60, now=now + 90)[0])
+
+    def test_ident_is_user_when_authenticated_else_ip(self):
+        request = RequestFactory().post('/book/1/', REMOTE_ADDR='10.0.0.1')
+        request.user = AnonymousUser()
+        self.assertEqual(throttling.client_ident(request), 'ip10.0.0.1')
+
+        request.user = make_client(1)
+        self.assertEqual(throttling.client_ident(request), f'u{request.user.pk}')
+
+    @override_settings(THROTTLE_RATES={**NO_THROTTLE, 'book': '2/m'})
+    def test_booking_over_limit_gets_429_before_view_runs(self):
+        schedules = [make_schedule(start_time=time(10 + hour, 0), end_time=time(11 + hour, 0)) for hour in range(3)]
+        client = Client()
+        client.force_login(make_client(1))
+
+        statuses = [client.post(f'/book/{schedule.id}/').status_code for schedule in schedules]
+
+        self.assertEqual(statuses, [200, 200, 429])
+        self.assertFalse(Booking.objects.filter(schedule=schedules[2]).exists())
+        self.assertIn('Retry-After', client.post(f'/book/{schedules[2].id}/'))
+
+
+class MetricsFileTests(TransactionTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(lambda: [os.remove(os.path.join(self.directory, name)) for name in os.listdir(self.directory)])
+
+    def test_counters_are_flushed_by_background_thread(self):
+        registry = metrics.Registry()
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with override_settings(METRICS_DIR=self.directory), mock.patch.object(metrics, 'FLUSH_INTERVAL', 0.05):
+            registry.inc('bombim_test_total')
+            self.assertFalse(os.path.exists(path))
+
+            deadline = clock.monotonic() + 5
+            while not os.path.exists(path) and clock.monotonic() < deadline:
+                clock.sleep(0.05)
+        with open(path) as f:
+            self.assertEqual(json.load(f)['counters'], [['bombim_test_total', [], 1]])
+
+    def test_files_of_dead_processes_are_pruned(self):
+        # pid больше pid_max Linux - такого процесса нет
+        dead = os.path.join(self.directory, '999999999.json')
+        with open(dead, 'w') as f:
+            json.dump({'counters': [['bombim_dead_total', [], 5]], 'histograms': []}, f)
+
+        with override_settings(METRICS_DIR=self.directory):
+            self.assertNotIn('bombim_dead_total', metrics.render())
+        self.assertFalse(os.path.exists(dead))
+
+
+class MarkClassesBatchTests(TransactionTestCase):
+    def test_batch_marks_only_bookings_on_given_date(self):
+        schedule = make_schedule(days=-1)
+        other_date = schedule.date - timedelta(days=7)
+        current = Booking.objects.create(client=make_client(1), schedule=schedule, class_date=schedule.date)
+        earlier = Booking.objects.create(client=make_client(2), schedule=schedule, class_date=other_date)
+
+        trainer = Client()
+        trainer.force_login(schedule.trainer.user)
+        response = trainer.post('/mark-classes/', {
+            'status': 'attended', 'schedule_ids': [schedule.id], 'class_dates': [f'{schedule.date:%Y-%m-%d}'],
+        })
+
+        self.assertTrue(response.json()['success'])
+        current.refresh_from_db()
+        earlier.refresh_from_db()
+        self.assertEqual(current.status, 'attended')
+        self.assertEqual(earlier.status, 'booked')
+
+    def test_batch_requires_date_for_each_class(self):
+        schedule = make_schedule()
+        trainer = Client()
+        trainer.force_login(schedule.trainer.user)
+        response = trainer.post('/mark-classes/', {'status': 'attended', 'schedule_ids': [schedule.id]})
+        self.assertFalse(response.json()['success'])
+
+
+class RollCallQueryTests(TransactionTestCase):
+    """Число запросов отметки посещаемости не зависит от размера группы"""
+
+    # Сессия, пользователь, транзакция с блокировкой записей, outbox, пересчет статистики за дату
+    ROLL_CALL_QUERIES = 19
+    BATCH_QUERIES = 15
+
+    def setUp(self):
+        self.next_client = 0
+
+    def trainer_with_roster(self, size, **schedule_fields):
+        schedule = make_schedule(max_participants=size, days=-1, **schedule_fields)
+        clients = [make_client(self.next_client + i) for i in range(size)]
+        self.next_client += size
+        Booking.objects.bulk_create(
+            Booking(client=client, schedule=schedule, class_date=schedule.date) for client in clients
+        )
+        trainer = Client()
+        trainer.force_login(schedule.trainer.user)
+        return trainer, schedule, clients
+
+    def roll_call(self, size):
+        trainer, schedule, clients = self.trainer_with_roster(size)
+        url = f'/roll-call/{schedule.id}/{schedule.date:%Y-%m-%d}/'
+        trainer.get(url)
+        with self.assertNumQueries(self.ROLL_CALL_QUERIES):
+            response = trainer.post(
+                url, json.dumps({'statuses': {str(client.id): 'attended' for client in clients}}),
+                content_type='application/json',
+            )
+        self.assertTrue(response.json()['success'])
+        self.assertEqual(Booking.objects.filter(schedule=schedule, status='attended').count(), size)
+
+    def test_roll_call_small_group(self):
+        self.roll_call(5)
+
+    def test_roll_call_full_group(self):
+        self.roll_call(30)
+
+    def test_batch_marks_classes_with_constant_queries(self):
+        trainer, first, clients = self.trainer_with_roster(30)
+        second = make_schedule(max_participants=30, days=-1, start_time=time(21, 0), end_time=time(22, 0))
+        Booking.objects.bulk_create(
+            Booking(client=client, schedule=second, class_date=second.date) for client in clients
+        )
+        trainer.get(f'/roll-call/{first.id}/{first.date:%Y-%m-%d}/')
+
+        with self.assertNumQueries(self.BATCH_QUERIES):
+            response = trainer.post('/mark-classes/', {
+                'status': 'attended', 'schedule_ids': [first.id, second.id],
+                'class_dates': [f'{first.date:%Y-%m-%d}', f'{second.date:%Y-%m-%d}'],
+            })
+
+        self.assertEqual(response.json()['message'], 'Отмечено занятий: 2. Обновлено записей: 60')
+
+
+class ConflictTests(TransactionTestCase):
+    def setUp(self):
+        self.room = Room.objects.create(name='Большой зал', capacity=20)
+        self.booked = make_schedule(room=self.room)
+
+    def other_trainer(self):
+        user = User.objects.create(
+            username='trainer2', email='trainer2@test.invalid', phone='+79000000002',
+            first_name='Преподаватель', last_name='Второй', role='trainer',
+        )
+        return Trainer.objects.create(user=user, bio='')
+
+    def new_schedule(self, start, end, **fields):
+        fields = {
+            'trainer': self.booked.trainer, 'dance_style': self.booked.dance_style, 'max_participants': 10, **fields,
+        }
+        return Schedule(date=self.booked.date, start_time=start, end_time=end, **fields)
+
+    def test_trainer_overlap(self):
+        schedule = self.new_schedule(time(19, 30), time(20, 30))
+        self.assertIn('преподавателя', conflicts.find_conflicts([schedule])[id(schedule)])
+
+    def test_room_overlap_with_other_trainer(self):
+        schedule = self.new_schedule(time(19, 30), time(20, 30), trainer=self.other_trainer(), room=self.room)
+        self.assertIn('Зал', conflicts.find_conflicts([schedule])[id(schedule)])
+
+    def test_adjacent_classes_do_not_overlap(self):
+        before = self.new_schedule(time(18, 0), time(19, 0), room=self.room)
+        after = self.new_schedule(time(20, 0), time(21, 0), room=self.room)
+        self.assertEqual(conflicts.find_conflicts([before, after]), {})
+
+    def test_overlap_inside_batch(self):
+        first = self.new_schedule(time(21, 0), time(22, 0))
+        second = self.new_schedule(time(21, 30), time(22, 30))
+        self.assertEqual(list(conflicts.find_conflicts([first, second])), [id(second)])
+
+    def test_clean_rejects_more_participants_than_room_holds(self):
+        schedule = self.new_schedule(time(21, 0), time(22, 0), room=self.room, max_participants=21)
+        with self.assertRaises(ValidationError) as raised:
+            schedule.clean()
+        self.assertIn('max_participants', raised.exception.message_dict)
+
+        schedule.max_participants = 20
+        schedule.clean()
+
+
+class CsvRows(list):
+    fieldnames = ('username', 'first_name', 'last_name', 'email', 'phone', 'password')
+
+
+def import_rows(count, start=0):
+    return CsvRows(
+        {
+            'username': f'imported{i}', 'first_name': 'Импорт', 'last_name': f'Клиент{i}',
+            'email': f'imported{i}@test.invalid', 'phone': f'+7902{i:07d}', 'password': f'secret-{i}',
+        }
+        for i in range(start, start + count)
+    )
+
+
+@override_settings(PASSWORD_PBKDF2_ITERATIONS=1000)
+class UserImportTests(TransactionTestCase):
+    def test_passwords_hashed_in_process_pool(self):
+        result = UserImporter(hash_workers=2).run(import_rows(40))
+
+        self.assertTrue(result.ok)
+        self.assertEqual(result.committed, [(2, 41)])
+        self.assertTrue(User.objects.get(username='imported7').check_password('secret-7'))
+
+    def test_failed_chunk_stops_import_and_reports_committed_rows(self):
+        importer = UserImporter(chunk_size=5)
+        save_chunk = importer.save_chunk
+        calls = []
+
+        def failing_second_chunk(valid):
+            calls.append(valid)
+            if len(calls) == 2:
+                raise IntegrityError('UNIQUE constraint failed: main_user.username')
+            save_chunk(valid)
+
+        importer.save_chunk = failing_second_chunk
+        result = importer.run(import_rows(15))
+
+        self.assertTrue(result.stopped)
+        self.assertEqual(result.committed, [(2, 6)])
+        self.assertEqual(result.errors[0][0], 7)
+        self.assertEqual(User.objects.filter(username__startswith='imported').count(), 5)
+
+    def test_legacy_phone_format_is_a_duplicate(self):
+        legacy = make_client(1)
+        User.objects.filter(id=legacy.id).update(phone='8 (902) 000-00-03')
+        User.objects.get(id=legacy.id).save()  # save() заполняет phone_digits
+
+        result = UserImporter().run(import_rows(5))
+
+        self.assertEqual(result.created, 4)
+        self.assertEqual([line for line, _ in result.errors], [5])
+        self.assertIn('Телефон +79020000003', result.errors[0][1])
+
+    def test_import_waits_for_search_keys_backfill(self):
+        legacy = make_client(1)
+        User.objects.filter(id=legacy.id).update(phone_digits='')
+
+        result = UserImporter().run(import_rows(2))
+
+        self.assertFalse(result.ok)
+        self.assertFalse(User.objects.filter(username__startswith='imported').exists())
+
+
+class BackfillTests(TransactionTestCase):
+    def test_interrupted_backfill_resumes_from_checkpoint(self):
+        clients = [make_client(number) for number in range(10)]
+        User.objects.filter(id__in=[c.id for c in clients]).update(phone_digits='', name_key='')
+        backfill = backfills.BACKFILLS['user_search_keys']
+
+        def interrupt(checkpoint, fraction, eta):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            backfills.run(backfill, chunk_size=4, pause=0, progress=interrupt)
+        checkpoint = BackfillCheckpoint.objects.get(name='user_search_keys')
+        self.assertIsNone(checkpoint.finished_at)
+        self.assertEqual(checkpoint.processed, 4)
+
+        seen = []
+        checkpoint = backfills.run(backfill, chunk_size=4, pause=0,
+                                   progress=lambda checkpoint, *_: seen.append(checkpoint.position))
+        self.assertIsNotNone(checkpoint.finished_at)
+        self.assertEqual(checkpoint.processed, 10)
+        self.assertEqual(checkpoint.changed, 10)
+        self.assertEqual(seen[0], checkpoint.lower + 8)
+        self.assertFalse(User.objects.filter(phone_digits='').exists())
+
+    def test_interrupt_before_checkpoint_is_reported(self):
+        out = io.StringIO()
+        with mock.patch.object(backfills, 'run', side_effect=KeyboardInterrupt):
+            call_command('backfill', 'user_search_keys', stdout=out)
+        self.assertIn('Прервано до начала', out.getvalue())
+
+
+class CheckinTokenTests(TransactionTestCase):
+    def test_token_finds_client(self):
+        client = make_client(1)
+        clients, client_id = checkin.find_clients(checkin.client_token(client))
+        self.assertEqual(client_id, client.id)
+        self.assertEqual(clients, [client])
+
+    def test_expired_or_forged_token_is_rejected(self):
+        client = make_client(1)
+        token = checkin.client_token(client)
+        with override_settings(CHECKIN_TOKEN_MAX_AGE=-1):
+            self.assertIsNone(checkin.read_token(token))
+
+        forged = f'{client.id + 1}:{token.split(":", 1)[1]}'
+        self.assertIsNone(checkin.read_token(forged))
+
+    def test_scanned_code_checks_in_only_on_post(self):
+        client = make_client(1)
+        schedule = make_schedule(days=0, start_time=time(23, 0), end_time=time(23, 59))
+        booking = Booking.objects.create(client=client, schedule=schedule, class_date=schedule.date)
+        desk = Client()
+        desk.force_login(User.objects.create(username='desk', email='desk@test.invalid', phone='+79020000000',
+                                             role='admin'))
+
+        response = desk.get('/checkin/', {'q': checkin.client_token(client)})
+        booking.refresh_from_db()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['confirm_id'], booking.id)
+        self.assertEqual(booking.status, 'booked')
+
+        desk.post('/checkin/', {'q': '', 'booking_id': booking.id})
+        booking.refresh_from_db()
+        self.assertEqual(booking.status, 'attended')
+
+
+@override_settings(THROTTLE_RATES=NO_THROTTLE)
+class IdempotencyTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_repeated_key_replays_first_response(self):
+        schedule = make_schedule()
+        client = Client()
+        client.force_login(make_client(1))
+
+        first = client.post(f'/book/{schedule.id}/', HTTP_IDEMPOTENCY_KEY='retry-1')
+        cache.clear()  # повтор пришел к воркеру с другим кэшем - ответ берется из базы
+        second = client.post(f'/book/{schedule.id}/', HTTP_IDEMPOTENCY_KEY='retry-1')
+
+        self.assertTrue(first.json()['success'])
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Booking.objects.filter(schedule=schedule).count(), 1)
+
+        other = client.post(f'/book/{make_schedule(days=8).id}/', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(other.status_code, 422)
+
+    def test_concurrent_retries_book_once(self):
+        schedule = make_schedule()
+        user = make_client(1)
+
+        def book(_):
+            client = Client()
+            client.force_login(user)
+            return client.post(f'/book/{schedule.id}/', HTTP_IDEMPOTENCY_KEY='retry-2')
+
+        responses = run_parallel(book, range(5), threads=5)
+
+        self.assertEqual(Booking.objects.filter(schedule=schedule).count(), 1)
+        self.assertTrue(all(response.json()['success'] for response in responses))
+
+
+class RecordingConsumer(outbox.Consumer):
+    name = 'test_recorder'
+    topics = ('booking',)
+
+    def __init__(self):
+        self.seen = []
+
+    def handle(self, events):
+        self.seen.extend(event.id for event in events)
+
+
+@override_settings(OUTBOX_SETTLE_SECONDS=0)
+class OutboxTests(TransactionTestCase):
+    def test_consumer_sees_each_committed_event_once(self):
+        schedule = make_schedule()
+        for number in range(5):
+            Booking.objects.create(client=make_client(number), schedule=schedule, class_date=schedule.date)
+        # Откаченное изменение не оставляет события
+        with self.assertRaises(ZeroDivisionError), transaction.atomic():
+            Booking.objects.create(client=make_client(9), schedule=schedule, class_date=schedule.date)
+            1 / 0
+
+        consumer = RecordingConsumer()
+        outbox.drain(consumer, batch_size=2)
+
+        expected = list(OutboxEvent.objects.filter(topic='booking').order_by('id').values_list('id', flat=True))
+        self.assertEqual(len(expected), 5)
+        self.assertEqual(consumer.seen, expected)
+        self.assertEqual(ConsumerOffset.objects.get(name=consumer.name).position,
+                         OutboxEvent.objects.order_by('-id').values_list('id', flat=True).first())
+        self.assertEqual(outbox.drain(consumer), 0)
+
+    def test_young_events_wait_for_settle_delay(self):
+        schedule = make_schedule()
+        Booking.objects.create(client=make_client(1), schedule=schedule, class_date=schedule.date)
+
+        consumer = RecordingConsumer()
+        with override_settings(OUTBOX_SETTLE_SECONDS=60):
+            self.assertEqual(outbox.consume(consumer), 0)
+        self.assertEqual(outbox.consume(consumer), 2)
+        self.assertEqual(len(consumer.seen), 1)
+
+
+class ArchiveTests(TransactionTestCase):
+    def test_archiving_is_not_deletion(self):
+        room = Room.objects.create(name='Большой зал', capacity=20)
+        schedule = make_schedule(days=-40, room=room)
+        clients = [make_client(number) for number in range(3)]
+        class_pass = passes.issue(clients[0], 5)
+        bookings = [
+            Booking.objects.create(client=client, schedule=schedule, class_date=schedule.date, status='attended')
+            for client in clients
+        ]
+        Booking.objects.filter(id=bookings[0].id).update(class_pass=class_pass)
+        BookingReminder.objects.create(booking=bookings[0])
+        OutboxEvent.objects.all().delete()
+        StatsDirtyDate.objects.all().delete()
+
+        archived = archive.archive_before(timezone.localdate(), chunk_size=10)
+
+        self.assertEqual(archived, (1, 3))
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertFalse(StatsDirtyDate.objects.exists())
+        self.assertFalse(Schedule.objects.exists())
+        self.assertFalse(Booking.objects.exists())
+        self.assertFalse(BookingReminder.objects.exists())
+
+        archived_schedule = ArchivedSchedule.objects.get(id=schedule.id)
+        for field in archive.SCHEDULE_FIELDS:
+            self.assertEqual(getattr(archived_schedule, field), getattr(schedule, field), field)
+        self.assertEqual(ArchivedBooking.objects.filter(schedule=archived_schedule).count(), 3)
+        self.assertEqual(ArchivedBooking.objects.get(id=bookings[0].id).class_pass_id, class_pass.id)
+
+
+class ProfilerTriggerTests(TransactionTestCase):
+    def test_only_exact_flag_enables_profiling(self):
+        factory = RequestFactory()
+        cases = [
+            (factory.get('/', HTTP_X_PROFILE='1'), True),
+            (factory.get('/', {'__profile': '1'}), True),
+            (factory.get('/', HTTP_X_PROFILE='0'), False),
+            (factory.get('/', {'__profile': '0'}), False),
+            (factory.get('/', {'x__profile': '1'}), False),
+            (factory.get('/'), False),
+        ]
+        for request, expected in cases:
+            self.assertEqual(ProfilerMiddleware.requested(request), expected, request.get_full_path())
+
+
+class SignupFormTests(TransactionTestCase):
+    def signup_data(self, **fields):
+        return {
+            'username': 'Ivan', 'first_name': 'Иван', 'last_name': 'Петров', 'email': 'ivan@test.invalid',
+            'phone': '+79031234567', 'birth_date': '1990-01-01', 'password1': 'Secret-pass-1',
+            'password2': 'Secret-pass-1', **fields,
+        }
+
+    def test_username_taken_in_other_case(self):
+        make_client(1)
+        User.objects.filter(username='client1').update(username='ivan')
+
+        form = CustomUserCreationForm(self.signup_data())
+
+        self.assertFalse(form.is_valid())
+        self.assertIn('username', form.errors)
+
+    def test_uniqueness_checked_in_one_query(self):
+        form = CustomUserCreationForm(self.signup_data())
+        with self.assertNumQueries(1):
+            self.assertTrue(form.is_valid())
+
+
+class CatalogPageCacheTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def add_trainers(self, count, start=0):
+        style = DanceStyle.objects.first() or DanceStyle.objects.create(name='Сальса', description='')
+        for number in range(start, start + count):
+            user = User.objects.create(
+                username=f'trainer{number}', email=f'trainer{number}@test.invalid', phone=f'+7900100{number:04d}',
+                first_name='Преподаватель', last_name=f'Тестовый{number}', role='trainer',
+            )
+            Trainer.objects.create(user=user, bio='').styles.add(style)
+
+    def test_trainers_page_queries_do_not_grow_with_trainers(self):
+        self.add_trainers(2)
+        with CaptureQueriesContext(connection) as few:
+            Client().get('/trainers/')
+        self.add_trainers(6, start=2)
+        with CaptureQueriesContext(connection) as many:
+            response = Client().get('/trainers/')
+
+        self.assertContains(response, 'Тестовый7')
+        self.assertEqual(len(many), len(few))
+
+    def test_anonymous_page_served_from_cache_until_catalog_changes(self):
+        self.add_trainers(1)
+        Client().get('/trainers/')
+        with self.assertNumQueries(0):
+            cached = Client().get('/trainers/')
+        self.assertContains(cached, 'Тестовый0')
+
+        user = User.objects.get(username='trainer0')
+        user.last_name = 'Переименованный'
+        user.save()
+
+        self.assertContains(Client().get('/trainers/'), 'Переименованный')
+
+    def test_conditional_get_returns_not_modified(self):
+        visitor = Client()
+        etag = visitor.get('/styles/')['ETag']
+        response = visitor.get('/styles/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_authenticated_user_bypasses_page_cache(self):
+        self.add_trainers(1)
+        client = make_client(1)
+        member = Client()
+        member.force_login(client)
+        member.get('/trainers/')
+        Trainer.objects.filter(user__username='trainer0').update(bio='Новая биография')
+
+        self.assertContains(member.get('/trainers/'), 'Новая биография')
+
+
+class CachedAuthTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client_user = make_client(1)
+        self.member = Client()
+        self.member.force_login(self.client_user)
+
+    def test_warm_request_does_not_query_session_or_user(self):
+        self.member.get('/profile/')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.member.get('/profile/').status_code, 200)
+
+        tables = ' '.join(query['sql'] for query in queries)
+        self.assertNotIn('django_session', tables)
+        self.assertNotIn('FROM "main_user"', tables)
+
+    def test_trainer_profile_cached_with_user(self):
+        schedule = make_schedule()
+        backend = CachedModelBackend()
+        backend.get_user(schedule.trainer.user_id)
+        with self.assertNumQueries(0):
+            user = backend.get_user(schedule.trainer.user_id)
+            self.assertEqual(user.trainer_profile.pk, schedule.trainer.pk)
+
+    def test_user_save_invalidates_cache(self):
+        backend = CachedModelBackend()
+        backend.get_user(self.client_user.pk)
+        self.client_user.last_name = 'Переименованный'
+        self.client_user.save()
+        self.assertEqual(backend.get_user(self.client_user.pk).last_name, 'Переименованный')
+
+    def test_logout_invalidates_cache(self):
+        self.member.get('/profile/')
+        self.assertIsNotNone(cache.get(cached_user_key(self.client_user.pk)))
+        self.member.get('/logout/')
+        self.assertIsNone(cache.get(cached_user_key(self.client_user.pk)))
+
+    def test_clear_expired_sessions_in_batches(self):
+        expired = timezone.now() - timedelta(days=1)
+        Session.objects.bulk_create(
+            Session(session_key=f'expired{number:032d}', session_data='', expire_date=expired)
+            for number in range(5)
+        )
+
+        call_command('clear_expired_sessions', batch_size=2, sleep=0, stdout=io.StringIO())
+
+        self.assertFalse(Session.objects.filter(expire_date__lt=timezone.now()).exists())
+        self.assertTrue(Session.objects.exists())
+
+
+class CountingMailBackend(locmem.EmailBackend):
+    """locmem-бэкенд, который считает открытия соединения и пачки писем"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.opened = 0
+        self.batches = []
+
+    def open(self):
+        self.opened += 1
+        return super().open()
+
+    def send_messages(self, messages):
+        self.batches.append(len(messages))
+        return super().send_messages(messages)
+
+
+class ReminderTests(TransactionTestCase):
+    def setUp(self):
+        self.schedule = make_schedule(days=1)
+        self.bookings = [
+            Booking.objects.create(client=make_client(number), schedule=self.schedule, class_date=self.schedule.date)
+            for number in range(5)
+        ]
+
+    def test_rerun_sends_each_reminder_once(self):
+        Booking.objects.filter(pk=self.bookings[0].pk).update(status='cancelled')
+
+        call_command('send_reminders', stdout=io.StringIO())
+        call_command('send_reminders', stdout=io.StringIO())
+
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), [
+            f'client{number}@test.invalid' for number in range(1, 5)
+        ])
+        self.assertEqual(BookingReminder.objects.count(), 4)
+
+    def test_messages_sent_in_chunks_over_one_connection(self):
+        connection = CountingMailBackend()
+
+        sent = reminders.send_reminders(self.schedule.date, chunk_size=2, connection=connection)
+
+        self.assertEqual(sent, 5)
+        self.assertEqual(connection.opened, 1)
+        self.assertEqual(connection.batches, [2, 2, 1])
+        self.assertIn(self.schedule.dance_style.name, mail.outbox[0].body)
+
+
+class SearchTests(TransactionTestCase):
+    def setUp(self):
+        self.evening = make_schedule(start_time=time(19, 0), end_time=time(20, 0))
+        self.morning = make_schedule(start_time=time(10, 0), end_time=time(11, 0))
+        self.tango = make_schedule(start_time=time(21, 0), end_time=time(22, 0))
+        self.tango.dance_style = DanceStyle.objects.create(name='Танго', description='Аргентинское танго')
+        self.tango.save()
+
+    def test_parse_query_splits_words_into_terms_and_filters(self):
+        terms, periods, weekdays = search.parse_query('Сальсой вечером в субботу')
+        self.assertEqual(terms, ['сальс'])
+        self.assertEqual(periods, [(time(17, 0), time(23, 59, 59))])
+        self.assertEqual(weekdays, [5])
+
+    def test_fts_index_follows_style_changes(self):
+        self.assertTrue(search.fts_available())
+        style = self.tango.dance_style
+
+        style.name, style.description = 'Бачата', 'Парный танец'
+        style.save()
+        self.assertIn(('style', style.pk), search.match_term('бачат'))
+        self.assertNotIn(('style', style.pk), search.match_term('танг'))
+
+        Schedule.objects.filter(dance_style=style).delete()
+        style.delete()
+        self.assertEqual(search.match_term('бачат'), {})
+
+    def test_like_fallback_matches_fts(self):
+        fts = search.match_term('сальс').keys()
+        with mock.patch.object(search, 'fts_available', return_value=False):
+            self.assertEqual(search.match_term('сальс').keys(), fts)
+            self.assertEqual(search.matching_ids('trainer', 'тестов'), {self.evening.trainer_id})
+
+    def test_search_classes_filters_by_time_of_day(self):
+        found = [schedule for _, schedule in search.search_classes('сальса вечером')]
+        self.assertEqual(found, [self.evening])
+
+        found = [schedule for _, schedule in search.search_classes('аргентинское')]
+        self.assertEqual(found, [self.tango])
+
+
+def synthetic_trainers(count, styles):
+    """Преподаватель i ведет два направления и доступен в будни или в выходные"""
+    weekdays = [(day, time(9, 0), time(21, 30)) for day in range(5)]
+    weekend = [(day, time(9, 0), time(21, 30)) for day in (5, 6)]
+    return {
+        number: ({number % styles, (number + 1) % styles}, weekend if number % 3 == 0 else weekdays)
+        for number in range(count)
+    }
+
+
+class TimetableTests(TransactionTestCase):
+    def test_solution_respects_hard_constraints(self):
+        trainers = synthetic_trainers(12, 6)
+        demand = {style: 6 for style in range(6)}
+
+        result = timetable.solve(trainers, demand, rooms=2, max_per_trainer=4)
+
+        self.assertEqual(timetable.check(result, trainers, rooms=2), [])
+        self.assertLessEqual(max(Counter(trainer for _, _, trainer in result.assignments).values()), 4)
+        self.assertEqual(len(result.assignments) + sum(result.unplaced.values()), 36)
+
+    def test_classes_without_room_counted_as_unplaced(self):
+        slots = timetable.weekly_slots(time_slots=timetable.TIME_SLOTS[:2], days=[0])
+        trainers = {1: ({10}, None), 2: ({10}, None)}
+
+        result = timetable.solve(trainers, {10: 5}, slots=slots)
+        self.assertEqual(len(result.assignments), 2)
+        self.assertEqual(result.unplaced, Counter({10: 3}))
+
+        result = timetable.solve(trainers, {10: 5}, slots=slots, rooms=2, max_per_trainer=1)
+        self.assertEqual(timetable.check(result, trainers, rooms=2), [])
+        self.assertEqual(result.unplaced, Counter({10: 3}))
+
+    def test_write_gives_each_class_a_free_room(self):
+        schedule = make_schedule()
+        Schedule.objects.all().delete()
+        Room.objects.create(name='Большой зал', capacity=20)
+        Room.objects.create(name='Малый зал', capacity=6)
+        trainer_ids = [schedule.trainer_id] + [
+            Trainer.objects.create(user=make_client(number), bio='').id for number in range(2)
+        ]
+        start_date = timezone.localdate() + timedelta(days=7)
+        plan = timetable.Timetable(
+            slots=[timetable.Slot(start_date.weekday(), time(18, 0), time(19, 30))],
+            assignments=[(0, schedule.dance_style_id, trainer_id) for trainer_id in trainer_ids],
+        )
+
+        self.assertEqual(timetable.write(plan, start_date, weeks=2), (4, 2))
+        self.assertEqual(
+            sorted(Schedule.objects.filter(date=start_date).values_list('room__name', 'max_participants')),
+            [('Большой зал', 10), ('Малый зал', 6)],
+        )
+        self.assertEqual(timetable.write(plan, start_date, weeks=2), (0, 6))
+
+
+class EffectiveStatusTests(TransactionTestCase):
+    def setUp(self):
+        self.client_user = make_client(1)
+        self.past = Booking.objects.create(client=self.client_user, schedule=make_schedule(days=-2))
+        self.upcoming = Booking.objects.create(client=self.client_user, schedule=make_schedule(days=3))
+
+    def effective(self):
+        return dict(Booking.objects.with_effective_status().values_list('id', 'effective_status'))
+
+    def test_past_booking_read_as_missed_without_write(self):
+        self.past.save()
+        self.past.refresh_from_db()
+
+        self.assertEqual(self.past.status, 'booked')
+        self.assertEqual(self.effective(), {self.past.id: 'missed', self.upcoming.id: 'booked'})
+
+    def test_legacy_booking_without_class_date_uses_schedule_date(self):
+        Booking.objects.filter(pk=self.past.pk).update(class_date=None)
+        self.assertEqual(self.effective()[self.past.id], 'missed')
+
+    def test_profile_counts_missed_before_compaction(self):
+        member = Client()
+        member.force_login(self.client_user)
+        response = member.get('/profile/?tab=history')
+        self.assertEqual(response.context['stats']['missed'], 1)
+
+    def test_compaction_stores_missed_for_past_bookings_only(self):
+        call_command('update_booking_statuses', stdout=io.StringIO())
+
+        self.assertEqual(
+            dict(Booking.objects.values_list('id', 'status')),
+            {self.past.id: 'missed', self.upcoming.id: 'booked'},
+        )
+        self.assertTrue(OutboxEvent.objects.filter(object_id=self.past.id, action='updated', status='missed').exists())
@@ -0,0 +1,110 @@
+"""Ограничение частоты запросов к записи, отмене, входу и регистрации.
+
+Каждая пара (endpoint, пользователь) - или (endpoint, IP) для анонимных
+запросов - получает ведро на ``limit`` запросов за ``period`` секунд,
+которое пополняется равномерно. Лимиты задаются только в
+settings.THROTTLE_RATES; endpoint без лимита там не ограничивается.
+
+Ведро хранится в общем кэше двумя счетчиками окон и обновляется только
+атомарными incr/decr, так что разные воркеры не перетирают друг друга;
+отклоненный запрос возвращает свой токен. Пользователь берется из кэша
+CachedModelBackend, так что решение принимается до запросов к БД и
+хэширования паролей.
+"""
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'10/m' -> (10, 60)"""
+    limit, period = rate.split('/')
+    return int(limit), PERIODS[period[0]]
+
+
+def get_rate(scope):
+    rate = getattr(settings, 'THROTTLE_RATES', {}).get(scope)
+    return parse_rate(rate) if rate else None
+
+
+def client_ident(request):
+    """Авторизованный пользователь или IP адрес"""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'u{user.pk}'
+    return 'ip' + request.META.get('REMOTE_ADDR', '')
+
+
+def _incr(key, timeout):
+    cache.add(key, 0, timeout)
+    try:
+        return cache.incr(key)
+    except ValueError:  # ключ успел истечь между add и incr
+        cache.set(key, 1, timeout)
+        return 1
+
+
+def consume(scope, ident, limit, period, now=None):
+    """
+    Пытается взять токен из ведра. Возвращает (разрешено, секунд до повтора).
+
+    Расход считается в окнах длиной period: текущее окно учитывается целиком,
+    предыдущее - пропорционально оставшейся в нем доле. Это равносильно
+    ведру емкостью limit, которое пополняется на limit токенов за period.
+    Отклоненный запрос возвращает токен, поэтому повторы после 429 не
+    отодвигают момент, когда клиент снова сможет пройти.
+    """
+    now = time.time() if now is None else now
+    window = int(now // period)
+    elapsed = (now % period) / period
+
+    prefix = f'throttle:{scope}:{ident}:'
+    previous = cache.get(f'{prefix}{window - 1}', 0)
+    used = _incr(f'{prefix}{window}', period * 2)
+
+    if previous * (1 - elapsed) + used <= limit:
+        return True, 0
+    try:
+        cache.decr(f'{prefix}{window}')
+    except ValueError:  # окно уже истекло
+        pass
+
+    # Сколько ждать, пока вклад предыдущего окна уменьшится на один токен
+    if previous:
+        retry_after = period / previous
+    else:
+        retry_after = period * (1 - elapsed)
+    return False, max(1, math.ceil(retry_after))
+
+
+def throttle(scope, methods=None, json=False):
+    """
+    Декоратор view: при превышении лимита сразу отвечает 429 с Retry-After.
+
+    Должен стоять первым (над login_required), чтобы отсекать запросы до
+    любой работы. methods - ограничивать только эти HTTP методы.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            rate = get_rate(scope)
+            if rate and (methods is None or request.method in methods):
+                allowed, retry_after = consume(scope, client_ident(request), *rate)
+                if not allowed:
+                    message = 'Слишком много запросов, попробуйте позже'
+                    if json:
+                        response = JsonResponse({'success': False, 'error': message}, status=429)
+                    else:
+                        response = HttpResponse(message, status=429, content_type='text/plain; charset=utf-8')
+                    response['Retry-After'] = str(retry_after)
+                    return response
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,122 @@
+"""Уменьшенные копии фотографий преподавателей и картинок направлений.
+
+Для каждого исходного файла создаются варианты фиксированной ширины в WebP и
+JPEG. Имена вариантов строятся из хэша содержимого, поэтому при замене
+картинки браузер сразу получает новую копию, а старые можно кэшировать вечно.
+Варианты создаются при сохранении модели (см. signals) или при первом показе.
+"""
+import hashlib
+from io import BytesIO
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow нужен и самому ImageField, но не ломаем импорт
+    Image = None
+
+
+THUMBNAIL_WIDTHS = (320, 640, 960)
+THUMBNAIL_DIR = 'thumbs'
+FORMATS = (
+    ('webp', 'WEBP', {'quality': 80, 'method': 4}),
+    ('jpg', 'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+)
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def _cache_key(name):
+    return 'thumbs:' + hashlib.md5(name.encode()).hexdigest()
+
+
+def _content_hash(storage, name):
+    digest = hashlib.sha1()
+    with storage.open(name, 'rb') as f:
+        for block in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def build_variants(name, storage=default_storage):
+    """
+    Создает недостающие варианты для файла name.
+
+    Возвращает {'webp': [(ширина, имя), ...], 'jpg': [...]} или None,
+    если файл не найден или не является картинкой.
+    """
+    if Image is None or not name or not storage.exists(name):
+        return None
+
+    content_hash = _content_hash(storage, name)
+    try:
+        with storage.open(name, 'rb') as f:
+            image = ImageOps.exif_transpose(Image.open(f))
+            image.load()
+    except (OSError, Image.DecompressionBombError):
+        return None
+
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+
+    # Не увеличиваем маленькие картинки: берем подходящие ширины или исходную
+    widths = [w for w in THUMBNAIL_WIDTHS if w < image.width] or [image.width]
+    if image.width not in widths and image.width <= THUMBNAIL_WIDTHS[-1]:
+        widths.append(image.width)
+
+    variants = {ext: [] for ext, _, _ in FORMATS}
+    for width in widths:
+        resized = None
+        for ext, pil_format, options in FORMATS:
+            variant_name = f'{THUMBNAIL_DIR}/{content_hash}_{width}.{ext}'
+            if not storage.exists(variant_name):
+                if resized is None:
+                    height = max(1, round(image.height * width / image.width))
+                    resized = image.resize((width, height), Image.LANCZOS) if width != image.width else image
+                buffer = BytesIO()
+                resized.save(buffer, pil_format, **options)
+                storage.save(variant_name, ContentFile(buffer.getvalue()))
+            variants[ext].append((width, variant_name))
+
+    cache.set(_cache_key(name), variants, CACHE_TIMEOUT)
+    return variants
+
+
+def get_variants(field_file):
+    """Варианты для FieldFile; при первом обращении создает их"""
+    if not field_file:
+        return None
+    variants = cache.get(_cache_key(field_file.name))
+    if variants is None:
+        variants = build_variants(field_file.name, field_file.storage)
+        if variants is None:
+            # Файла нет или он битый - не проверяем его на каждом показе
+            cache.set(_cache_key(field_file.name), {}, 60 * 5)
+    return variants
+
+
+def build_variants_for_path(name):
+    """Точка входа для пула процессов в build_thumbnails"""
+    try:
+        variants = build_variants(name)
+    except Exception as e:
+        return name, False, str(e)
+    return name, variants is not None, ''
+
+
+def srcset(variants, ext, storage=default_storage):
+    return ', '.join(f'{storage.url(variant)} {width}w' for width, variant in variants[ext])
+
+
+def largest(variants, ext, storage=default_storage):
+    return storage.url(variants[ext][-1][1])
+
+
+def source_names():
+    """Имена всех загруженных картинок, для которых нужны варианты"""
+    from .models import DanceStyle, Trainer
+
+    names = set(DanceStyle.objects.exclude(image='').values_list('image', flat=True))
+    names.update(Trainer.objects.exclude(photo='').values_list('photo', flat=True))
+    return sorted(names)
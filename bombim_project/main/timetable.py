@@ -0,0 +1,288 @@
+"""Автоматическое составление расписания сезона.
+
+Входные данные: фиксированные слоты времени (TIME_SLOTS на каждый день
+недели), направления преподавателей (Trainer.styles), окна доступности
+(TrainerAvailability) и желаемое число занятий в неделю по направлениям
+(DanceStyle.weekly_classes). Жесткие ограничения: преподаватель ведет
+только свои направления, только в свои окна и не больше одного занятия в
+слот; в слоте не больше ``rooms`` занятий одновременно.
+
+Решатель жадный с починкой: занятия ставятся начиная с направлений с
+наименьшим числом вариантов, каждое - в допустимый вариант с наименьшей
+стоимостью (нагрузка преподавателя, то же направление в этот день,
+заполненность слота). Если вариантов нет, одно мешающее занятие
+переносится в другое допустимое место. Получается недельный шаблон,
+который повторяется на нужное число недель и сохраняется через bulk_create.
+"""
+from collections import Counter, defaultdict, namedtuple
+from dataclasses import dataclass, field
+from datetime import time as dtime, timedelta
+
+from django.db import transaction
+
+from . import outbox
+from .conflicts import find_conflicts
+from .models import DanceStyle, Trainer, TrainerAvailability, Room, Schedule
+
+
+TIME_SLOTS = (
+    (dtime(9, 0), dtime(10, 30)),
+    (dtime(11, 0), dtime(12, 30)),
+    (dtime(14, 0), dtime(15, 30)),
+    (dtime(16, 0), dtime(17, 30)),
+    (dtime(18, 0), dtime(19, 30)),
+    (dtime(20, 0), dtime(21, 30)),
+)
+
+# Веса стоимости варианта: меньше - лучше
+STYLE_SAME_DAY = 10
+TRAINER_LOAD = 2
+SLOT_FILL = 1
+
+# Сколько самых дешевых заблокированных вариантов пробовать при починке
+REPAIR_CANDIDATES = 20
+
+Slot = namedtuple('Slot', 'day start_time end_time')
+
+
+def weekly_slots(time_slots=TIME_SLOTS, days=range(7)):
+    return [Slot(day, start, end) for day in days for start, end in time_slots]
+
+
+@dataclass
+class Timetable:
+    slots: list
+    assignments: list = field(default_factory=list)  # [(индекс слота, style_id, trainer_id)]
+    unplaced: Counter = field(default_factory=Counter)  # style_id -> сколько занятий не поставлено
+
+    def dated(self, start_date, weeks):
+        """Недельный шаблон на weeks недель: [(дата, слот, style_id, trainer_id)]"""
+        by_day = defaultdict(list)
+        for slot_index, style_id, trainer_id in self.assignments:
+            by_day[self.slots[slot_index].day].append((self.slots[slot_index], style_id, trainer_id))
+        classes = []
+        for offset in range(weeks * 7):
+            date = start_date + timedelta(days=offset)
+            for slot, style_id, trainer_id in by_day[date.weekday()]:
+                classes.append((date, slot, style_id, trainer_id))
+        return classes
+
+
+def _fits(slot, windows):
+    if windows is None:
+        return True
+    return any(day == slot.day and start <= slot.start_time and slot.end_time <= end for day, start, end in windows)
+
+
+class _State:
+    def __init__(self, slots, options, rooms, max_per_trainer):
+        self.slots = slots
+        self.options = options            # направление -> [(слот, преподаватель)]
+        self.rooms = rooms
+        self.max_per_trainer = max_per_trainer
+        self.placed = {}                  # (слот, преподаватель) -> направление
+        self.by_slot = defaultdict(set)   # слот -> преподаватели
+        self.load = Counter()             # преподаватель -> занятий в неделю
+        self.style_day = Counter()        # (направление, день) -> занятий
+
+    def feasible(self, slot, trainer):
+        return (
+            (slot, trainer) not in self.placed
+            and len(self.by_slot[slot]) < self.rooms
+            and (self.max_per_trainer is None or self.load[trainer] < self.max_per_trainer)
+        )
+
+    def cost(self, slot, trainer, style):
+        return (
+            STYLE_SAME_DAY * self.style_day[(style, self.slots[slot].day)]
+            + TRAINER_LOAD * self.load[trainer]
+            + SLOT_FILL * len(self.by_slot[slot])
+        )
+
+    def best(self, style, options, exclude=None):
+        candidates = [
+            (self.cost(slot, trainer, style), slot, trainer)
+            for slot, trainer in options
+            if (slot, trainer) != exclude and self.feasible(slot, trainer)
+        ]
+        if not candidates:
+            return None
+        _, slot, trainer = min(candidates)
+        return slot, trainer
+
+    def place(self, slot, trainer, style):
+        self.placed[(slot, trainer)] = style
+        self.by_slot[slot].add(trainer)
+        self.load[trainer] += 1
+        self.style_day[(style, self.slots[slot].day)] += 1
+
+    def remove(self, slot, trainer):
+        style = self.placed.pop((slot, trainer))
+        self.by_slot[slot].discard(trainer)
+        self.load[trainer] -= 1
+        self.style_day[(style, self.slots[slot].day)] -= 1
+        return style
+
+    def repair(self, style):
+        """Переносит одно мешающее занятие, чтобы поставить style. True - получилось"""
+        blocked = sorted(self.options[style], key=lambda option: (self.cost(*option, style), option))[:REPAIR_CANDIDATES]
+        for slot, trainer in blocked:
+            if (slot, trainer) in self.placed:
+                blockers = [trainer]
+            else:
+                blockers = sorted(self.by_slot[slot])
+            for blocker in blockers:
+                blocker_style = self.remove(slot, blocker)
+                if self.feasible(slot, trainer):
+                    self.place(slot, trainer, style)
+                    alternative = self.best(blocker_style, self.options[blocker_style], exclude=(slot, blocker))
+                    if alternative is not None:
+                        self.place(*alternative, blocker_style)
+                        return True
+                    self.remove(slot, trainer)
+                self.place(slot, blocker, blocker_style)
+        return False
+
+
+def solve(trainers, demand, slots=None, rooms=1, max_per_trainer=None):
+    """
+    Составляет недельный шаблон расписания.
+
+    trainers - {trainer_id: (множество style_id, окна [(день, начало, конец)] или None)},
+    demand - {style_id: занятий в неделю}. Возвращает Timetable.
+    """
+    slots = weekly_slots() if slots is None else slots
+
+    options = {}
+    for style_id in demand:
+        options[style_id] = [
+            (slot_index, trainer_id)
+            for trainer_id, (styles, windows) in sorted(trainers.items())
+            if style_id in styles
+            for slot_index, slot in enumerate(slots)
+            if _fits(slot, windows)
+        ]
+    state = _State(slots, options, rooms, max_per_trainer)
+
+    # Сначала самые ограниченные направления; номер занятия чередует направления
+    units = sorted(
+        (len(options[style_id]), number, style_id)
+        for style_id, count in demand.items()
+        for number in range(count)
+    )
+
+    timetable = Timetable(slots=slots)
+    for _, _, style_id in units:
+        choice = state.best(style_id, options[style_id])
+        if choice is not None:
+            state.place(*choice, style_id)
+        elif not state.repair(style_id):
+            timetable.unplaced[style_id] += 1
+
+    timetable.assignments = sorted(
+        (slot, style_id, trainer_id) for (slot, trainer_id), style_id in state.placed.items()
+    )
+    return timetable
+
+
+def check(timetable, trainers, rooms=1):
+    """Нарушения жестких ограничений (пустой список - расписание корректно)"""
+    problems = []
+    seen = set()
+    per_slot = Counter()
+    for slot_index, style_id, trainer_id in timetable.assignments:
+        slot = timetable.slots[slot_index]
+        styles, windows = trainers[trainer_id]
+        if (slot_index, trainer_id) in seen:
+            problems.append(f'Преподаватель {trainer_id} дважды в слоте {slot}')
+        if style_id not in styles:
+            problems.append(f'Преподаватель {trainer_id} не ведет направление {style_id}')
+        if not _fits(slot, windows):
+            problems.append(f'Преподаватель {trainer_id} недоступен в слоте {slot}')
+        seen.add((slot_index, trainer_id))
+        per_slot[slot_index] += 1
+    problems.extend(f'В слоте {timetable.slots[s]} занятий больше {rooms}' for s, n in per_slot.items() if n > rooms)
+    return problems
+
+
+def load_inputs():
+    """Преподаватели и спрос из базы в формате solve()"""
+    windows = defaultdict(list)
+    for item in TrainerAvailability.objects.all():
+        windows[item.trainer_id].append((item.day_of_week, item.start_time, item.end_time))
+    styles = defaultdict(set)
+    for trainer_id, style_id in Trainer.styles.through.objects.values_list('trainer_id', 'dancestyle_id'):
+        styles[trainer_id].add(style_id)
+
+    trainers = {
+        trainer_id: (styles[trainer_id], windows.get(trainer_id))
+        for trainer_id in Trainer.objects.values_list('id', flat=True)
+    }
+    demand = dict(DanceStyle.objects.filter(weekly_classes__gt=0).values_list('id', 'weekly_classes'))
+    return trainers, demand
+
+
+def write(timetable, start_date, weeks, max_participants=10, rooms=1, dry_run=False):
+    """
+    Сохраняет шаблон на weeks недель начиная с start_date.
+
+    Если в базе есть залы, каждое занятие получает свободный зал (сначала
+    самые вместительные), а количество мест ограничивается его вместимостью;
+    тогда одновременно идет не больше занятий, чем залов, иначе - не больше
+    ``rooms``. Занятия, пересекающиеся с уже существующими у того же
+    преподавателя или в том же зале или в слоте без свободного зала,
+    пропускаются. Возвращает (создано, пропущено).
+    """
+    new = [
+        Schedule(
+            date=date,
+            day_of_week=date.weekday(),  # bulk_create не вызывает save()
+            start_time=slot.start_time,
+            end_time=slot.end_time,
+            dance_style_id=style_id,
+            trainer_id=trainer_id,
+            max_participants=max_participants,
+            is_active=True,
+        )
+        for date, slot, style_id, trainer_id in timetable.dated(start_date, weeks)
+    ]
+    if not new:
+        return 0, 0
+
+    halls = list(Room.objects.order_by('-capacity', 'name'))
+    per_slot = len(halls) or rooms
+    rejected = find_conflicts(new)
+    occupied = Counter()
+    busy_halls = set()
+    for date, start_time, room_id in Schedule.objects.filter(
+        date__range=(start_date, start_date + timedelta(weeks=weeks, days=-1)),
+        is_active=True,
+    ).values_list('date', 'start_time', 'room_id'):
+        occupied[(date, start_time)] += 1
+        busy_halls.add((date, start_time, room_id))
+
+    keep = []
+    for schedule in new:
+        key = (schedule.date, schedule.start_time)
+        if id(schedule) in rejected or occupied[key] >= per_slot:
+            continue
+        if halls:
+            hall = next((h for h in halls if (*key, h.id) not in busy_halls), None)
+            if hall is None:
+                continue
+            schedule.room = hall
+            schedule.max_participants = min(max_participants, hall.capacity)
+            busy_halls.add((*key, hall.id))
+        occupied[key] += 1
+        keep.append(schedule)
+
+    if halls:
+        # Залы могут быть заняты занятиями, не совпадающими со слотами
+        rejected = find_conflicts(keep)
+        keep = [schedule for schedule in keep if id(schedule) not in rejected]
+
+    if not dry_run:
+        with transaction.atomic():
+            Schedule.objects.bulk_create(keep, batch_size=500)
+            outbox.record_schedules('created', keep)
+    return len(keep), len(new) - len(keep)
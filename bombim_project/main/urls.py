@@ -6,17 +6,26 @@ urlpatterns = [
     path('styles/', views.styles_view, name='styles'),
     path('trainers/', views.trainers_view, name='trainers'),
     path('schedule/', views.schedule_view, name='schedule'),
+    path('search/', views.search_view, name='search'),
     path('signup/', views.signup_view, name='signup'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('profiles/<str:profile_id>/<str:kind>/', views.profile_download, name='profile_download'),
     
     # Клиент
     path('profile/', views.profile_view, name='profile'),
     path('book/<int:schedule_id>/', views.book_class, name='book_class'),
+    path('book/ticket/<str:ticket>/', views.booking_ticket_status, name='booking_ticket_status'),
     path('cancel-booking/<int:booking_id>/', views.cancel_booking, name='cancel_booking'),
     
     # Хореограф
     path('trainer-profile/', views.trainer_profile_view, name='trainer_profile'),
     path('mark-class-attended/<int:schedule_id>/<str:class_date>/', views.mark_class_attended, name='mark_class_attended'),
-path('mark-class-cancelled/<int:schedule_id>/<str:class_date>/', views.mark_class_cancelled, name='mark_class_cancelled'),
+    path('mark-class-cancelled/<int:schedule_id>/<str:class_date>/', views.mark_class_cancelled, name='mark_class_cancelled'),
+    path('mark-classes/', views.mark_classes_batch, name='mark_classes_batch'),
+    path('roll-call/<int:schedule_id>/<str:class_date>/', views.roll_call, name='roll_call'),
+
+    # Ресепшен
+    path('checkin/', views.checkin_view, name='checkin'),
 ]
\ No newline at end of file
@@ -1,81 +1,124 @@
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, FileResponse, Http404
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from urllib.parse import urlencode
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.http import HttpResponseForbidden
 from django.views.decorators.csrf import csrf_exempt
+import json
+import logging
+import os
 import traceback
 from .models import Schedule, Booking, DanceStyle, Trainer
 from .forms import CustomUserCreationForm
+from .caching import cache_anonymous_page
+from .throttling import throttle
+from . import admission, checkin, metrics, outbox, passes, search
+from .idempotency import idempotent
+from .archive import archived_counts, archived_history
+from .stats import refresh_dates
+from .profiler import profile_path
+from django.db import transaction
+from django.db.models import Count, Q
 from django.utils import timezone
 from datetime import datetime, timedelta
 
 
+logger = logging.getLogger(__name__)
+
+
+@idempotent
+@throttle('book', json=True)
 @csrf_exempt
 @login_required
 def book_class(request, schedule_id):
-    if not request.user.is_client():
-        return JsonResponse({'success': False, 'error': 'Только клиенты могут записываться на занятия'})
-    print("=== BOOKING DEBUG ===")
-    print(f"Method: {request.method}")
-    print(f"User: {request.user} (id: {request.user.id})")
-    print(f"User role: {request.user.role}")
-    print(f"Schedule ID: {schedule_id}")
-    print(f"Authenticated: {request.user.is_authenticated}")
-
     try:
         # Проверяем роль пользователя - ЗАПРЕЩАЕМ админам и преподавателям записываться
         if request.user.role != 'client':
-            print("❌ User is not a client")
             return JsonResponse({'success': False, 'error': 'Только клиенты могут записываться на занятия'})
 
         # Получаем расписание
         schedule = Schedule.objects.get(id=schedule_id)
-        print(f"✅ Schedule found: {schedule}")
-
-        # Проверяем нет ли уже записи
-        existing_booking = Booking.objects.filter(client=request.user, schedule=schedule).first()
-        if existing_booking:
-            print(f"❌ Already booked: {existing_booking}")
-            return JsonResponse({'success': False, 'error': 'Вы уже записаны на это занятие'})
-
-        # Проверяем доступность мест
-        current_participants = schedule.bookings.filter(status='booked').count()
-        if current_participants >= schedule.max_participants:
-            print(f"❌ No available slots: {current_participants}/{schedule.max_participants}")
-            return JsonResponse({'success': False, 'error': 'Нет свободных мест на это занятие'})
-
-        # Проверяем что занятие еще не прошло
-        class_datetime = datetime.combine(schedule.date, schedule.start_time)
-        class_datetime = timezone.make_aware(class_datetime)
-        if class_datetime <= timezone.now():
-            print(f"❌ Class already passed: {class_datetime}")
-            return JsonResponse({'success': False, 'error': 'Невозможно записаться на прошедшее занятие'})
-
-        # Создаем запись
-        print("Creating booking...")
-        booking = Booking.objects.create(
-            client=request.user,
-            schedule=schedule,
-            status='booked',
-            class_date=schedule.date  # Используем дату из расписания
-        )
-        print(f"✅ Booking created successfully: {booking.id}")
-        print(f"✅ Class date: {schedule.date}")
 
+        # В режиме открытия записи заявку обрабатывает очередь - отвечаем билетом
+        # (без общего кэша очередь выключена и запись идет напрямую)
+        if schedule.opening_mode and admission.enabled():
+            ticket = admission.enqueue(schedule.id, request.user.id)
+            metrics.inc('bombim_booking_outcomes_total', outcome='queued')
+            return JsonResponse({'success': True, 'queued': True, 'ticket': ticket,
+                                 'message': 'Заявка принята, ожидайте подтверждения'})
+
+        # Проверки и запись - в одной транзакции под блокировкой строки занятия:
+        # одновременные запросы проходят проверку мест по очереди
+        with transaction.atomic():
+            schedule = Schedule.objects.select_for_update().get(id=schedule_id)
+
+            # Проверяем нет ли уже записи
+            if Booking.objects.filter(client=request.user, schedule=schedule).exists():
+                metrics.inc('bombim_booking_outcomes_total', outcome='duplicate')
+                return JsonResponse({'success': False, 'error': 'Вы уже записаны на это занятие'})
+
+            # Проверяем доступность мест
+            current_participants = schedule.bookings.filter(status='booked').count()
+            if current_participants >= schedule.max_participants:
+                metrics.inc('bombim_booking_outcomes_total', outcome='full')
+                return JsonResponse({'success': False, 'error': 'Нет свободных мест на это занятие'})
+
+            # Проверяем что занятие еще не прошло
+            class_datetime = datetime.combine(schedule.date, schedule.start_time)
+            class_datetime = timezone.make_aware(class_datetime)
+            if class_datetime <= timezone.now():
+                metrics.inc('bombim_booking_outcomes_total', outcome='past')
+                return JsonResponse({'success': False, 'error': 'Невозможно записаться на прошедшее занятие'})
+
+            # Списываем занятие с абонемента в той же транзакции
+            pass_id = passes.charge(request.user.id)
+            if pass_id is None and passes.required():
+                metrics.inc('bombim_booking_outcomes_total', outcome='no_pass')
+                return JsonResponse({'success': False, 'error': 'Нет абонемента с оставшимися занятиями'})
+            booking = Booking.objects.create(
+                client=request.user,
+                schedule=schedule,
+                status='booked',
+                class_date=schedule.date,  # Используем дату из расписания
+                class_pass_id=pass_id,
+            )
+            passes.record_charges([booking])
+        logger.debug('Booking %s created for schedule %s on %s', booking.id, schedule.id, schedule.date)
+
+        metrics.inc('bombim_booking_outcomes_total', outcome='success')
         return JsonResponse({'success': True, 'message': 'Запись успешно оформлена'})
 
     except Schedule.DoesNotExist:
-        print("❌ Schedule does not exist")
+        metrics.inc('bombim_booking_outcomes_total', outcome='not_found')
         return JsonResponse({'success': False, 'error': 'Занятие не найдено'})
     except Exception as e:
-        print(f"❌ Unexpected error: {str(e)}")
-        print("Traceback:")
-        print(traceback.format_exc())
-        return JsonResponse({'success': False, 'error': f'Внутренняя ошибка сервера: {str(e)}'})
+        logger.exception('Booking schedule %s failed', schedule_id)
+        metrics.inc('bombim_booking_outcomes_total', outcome='error')
+        return JsonResponse({'success': False, 'error': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
+
+
+# Результат заявки из очереди записи
+@login_required
+def booking_ticket_status(request, ticket):
+    result = admission.get_result(ticket, request.user.id)
+    if result is None:
+        return JsonResponse({'success': False, 'error': 'Заявка не найдена или устарела'}, status=404)
+    if result['status'] == admission.PENDING:
+        return JsonResponse({'pending': True})
+    return JsonResponse({
+        'pending': False,
+        'expired': result['status'] == admission.EXPIRED,
+        'success': result['success'],
+        'message': result.get('message', ''),
+        'error': result.get('error', ''),
+    })
 
 
 # Главная страница
+@cache_anonymous_page()
 def home_view(request):
     if request.user.is_authenticated:
         if request.user.is_client():
@@ -88,17 +131,43 @@ def home_view(request):
 
 
 # Страница направлений
+@cache_anonymous_page()
 def styles_view(request):
     styles = DanceStyle.objects.all()
     return render(request, 'main/styles.html', {'styles': styles})
 
 
 # Страница преподавателей
+@cache_anonymous_page()
 def trainers_view(request):
-    trainers = Trainer.objects.all()
+    trainers = Trainer.objects.select_related('user').prefetch_related('styles')
     return render(request, 'main/trainers.html', {'trainers': trainers})
 
 
+# Поиск ближайших занятий по направлению, преподавателю, времени суток и дню
+def search_view(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        weeks = min(max(int(request.GET.get('weeks', search.DEFAULT_WEEKS)), 1), search.MAX_WEEKS)
+    except ValueError:
+        weeks = search.DEFAULT_WEEKS
+
+    results = []
+    for score, schedule in search.search_classes(query, weeks=weeks):
+        results.append({
+            'id': schedule.id,
+            'date': schedule.date.isoformat(),
+            'day_of_week': schedule.get_day_of_week_display(),
+            'start_time': schedule.start_time.strftime('%H:%M'),
+            'end_time': schedule.end_time.strftime('%H:%M'),
+            'dance_style': schedule.dance_style.name,
+            'trainer': f"{schedule.trainer.user.first_name} {schedule.trainer.user.last_name}",
+            'available_slots': schedule.max_participants - schedule.booked,
+            'score': round(score, 3),
+        })
+    return JsonResponse({'query': query, 'weeks': weeks, 'results': results})
+
+
 # Расписание
 def schedule_view(request):
     # Определяем текущую дату и время
@@ -201,7 +270,8 @@ def schedule_view(request):
 
 
 # Регистрация
-@csrf_exempt 
+@throttle('signup', methods=('POST',))
+@csrf_exempt
 def signup_view(request):
     print("=== SIGNUP DEBUG ===")
     print(f"Method: {request.method}")
@@ -232,6 +302,7 @@ def signup_view(request):
 
 
 # Вход
+@throttle('login', methods=('POST',))
 def login_view(request):
     if request.method == 'POST':
         username = request.POST['username']
@@ -274,16 +345,31 @@ def profile_view(request):
         'schedule__date', 'schedule__start_time')
 
     # История - ВСЕ прошедшие записи с разными статусами
+    # (effective_status: незакрытая запись на прошедшее занятие считается пропуском)
     history_bookings = Booking.objects.filter(
         client=request.user,
         schedule__date__lt=today  # Только прошедшие даты
-    ).select_related('schedule', 'schedule__dance_style', 'schedule__trainer', 'schedule__trainer__user').order_by('-schedule__date')
-
-    # РАСЧЕТ СТАТИСТИКИ
-    total_history = history_bookings.count()
-    attended_count = history_bookings.filter(status='attended').count()
-    missed_count = history_bookings.filter(status='missed').count()
-    cancelled_count = history_bookings.filter(status='cancelled').count()
+    ).with_effective_status(today).select_related(
+        'schedule', 'schedule__dance_style', 'schedule__trainer', 'schedule__trainer__user'
+    ).order_by('-schedule__date')
+
+    # РАСЧЕТ СТАТИСТИКИ (вместе с занятиями, перенесенными в архив) - одним запросом по горячей таблице
+    archived = archived_counts(request.user)
+    counts = history_bookings.aggregate(
+        total=Count('id'),
+        attended=Count('id', filter=Q(effective_status='attended')),
+        missed=Count('id', filter=Q(effective_status='missed')),
+        cancelled=Count('id', filter=Q(effective_status='cancelled')),
+    )
+    total_history = counts['total'] + archived['total']
+    attended_count = counts['attended'] + archived['attended']
+    missed_count = counts['missed'] + archived['missed']
+    cancelled_count = counts['cancelled'] + archived['cancelled']
+
+    # Архивные занятия показываем только по запросу
+    show_archive = request.GET.get('archive') == '1'
+    if show_archive and tab == 'history':
+        history_bookings = list(history_bookings) + list(archived_history(request.user))
 
     # Процент посещений
     attendance_rate = (attended_count / total_history * 100) if total_history > 0 else 0
@@ -307,8 +393,11 @@ def profile_view(request):
 
     context = {
         'tab': tab,
+        'checkin_code': checkin.client_token(request.user),
         'active_bookings': active_bookings,
         'history_bookings': history_bookings,
+        'show_archive': show_archive,
+        'has_archive': archived['total'] > 0,
         'stats': {
             'total': total_history,
             'attended': attended_count,
@@ -321,6 +410,8 @@ def profile_view(request):
     return render(request, 'main/profile.html', context)
 
 # Отмена записи
+@idempotent
+@throttle('cancel', json=True)
 @csrf_exempt
 @login_required
 def cancel_booking(request, booking_id):
@@ -342,10 +433,13 @@ def cancel_booking(request, booking_id):
         print(f"✅ Booking found: {booking}")
         print(f"Booking details - Client: {booking.client}, Schedule: {booking.schedule}")
 
-        # Удаляем запись
+        # Удаляем запись, занятие возвращается на абонемент
         print("Deleting booking...")
-        booking.delete()
+        with transaction.atomic():
+            passes.refund(Booking.objects.filter(id=booking.id))
+            booking.delete()
         print(f"✅ Booking deleted successfully: {booking_id}")
+        metrics.inc('bombim_booking_cancellations_total')
 
         return JsonResponse({'success': True, 'message': 'Запись успешно отменена'})
 
@@ -356,7 +450,45 @@ def cancel_booking(request, booking_id):
         print(f"❌ Unexpected error in cancel: {str(e)}")
         print("Traceback:")
         print(traceback.format_exc())
-        return JsonResponse({'success': False, 'error': f'Внутренняя ошибка сервера: {str(e)}'})
+        return JsonResponse({'success': False, 'error': f'Внутренняя ошибка сервера: {str(e)}'}, status=500)
+
+
+# Ресепшен: поиск клиента по телефону, фамилии или коду из профиля и отметка прихода
+@login_required
+def checkin_view(request):
+    if not request.user.is_admin():
+        return HttpResponseForbidden()
+
+    if request.method == 'POST':
+        query = request.POST.get('q', '')
+        try:
+            booking_id = int(request.POST.get('booking_id', ''))
+        except ValueError:
+            return HttpResponse('Некорректная запись', status=400)
+        done = 'checked' if checkin.check_in(booking_id) else 'skipped'
+        return redirect(f"{reverse('checkin')}?{urlencode({'q': query, done: booking_id})}")
+
+    query = request.GET.get('q', '').strip()
+    clients, scanned_id = checkin.find_clients(query) if query else ([], None)
+    bookings = checkin.todays_bookings([client.id for client in clients])
+
+    # Код из профиля: если на сегодня ровно одна незакрытая запись - кнопка отметки
+    # получает фокус (отметка только через POST, GET ничего не меняет)
+    checked_id = request.GET.get('checked')
+    confirm_id = None
+    if scanned_id is not None:
+        booked = [booking for booking in bookings.get(scanned_id, []) if booking.status == 'booked']
+        if len(booked) == 1:
+            confirm_id = booked[0].id
+
+    return render(request, 'main/checkin.html', {
+        'query': query,
+        'results': [(client, bookings[client.id]) for client in clients],
+        'checked_id': int(checked_id) if checked_id and checked_id.isdigit() else None,
+        'confirm_id': confirm_id,
+        'skipped': 'skipped' in request.GET,
+        'today': timezone.localdate(),
+    })
 
 
 # Личный кабинет хореографа
@@ -406,21 +538,20 @@ def trainer_profile_view(request):
 
     # Занятия для отметки (последние 7 дней)
     week_ago = today - timedelta(days=7)
-    classes_to_mark = Schedule.objects.filter(
+    classes_to_mark = list(Schedule.objects.filter(
         trainer=trainer_profile,
         date__gte=week_ago,
         date__lte=today
-    ).order_by('-date', 'start_time')
+    ).select_related('dance_style').order_by('-date', 'start_time'))
 
-    # Добавляем информацию о записях к каждому занятию
+    # Статусы и количество записей всех занятий - одним запросом
+    summaries = class_summaries([schedule.id for schedule in classes_to_mark])
     classes_with_bookings = []
     for schedule in classes_to_mark:
-        bookings = Booking.objects.filter(schedule=schedule)
-        status = get_class_status(bookings) if bookings.exists() else 'not_held'
         classes_with_bookings.append({
             'schedule': schedule,
-            'bookings': bookings,
-            'status': status
+            'date': schedule.date,
+            **summaries[schedule.id],
         })
 
     context = {
@@ -436,12 +567,9 @@ def trainer_profile_view(request):
 
 
 # Вспомогательная функция для определения статуса занятия
-def get_class_status(bookings):
-    if not bookings.exists():
+def class_status(statuses):
+    if not statuses:
         return 'not_held'
-    
-    statuses = set(booking.status for booking in bookings)
-    
     if 'attended' in statuses:
         return 'attended'
     elif 'cancelled' in statuses:
@@ -452,50 +580,263 @@ def get_class_status(bookings):
         return 'scheduled'
 
 
+def class_summaries(schedule_ids):
+    """{schedule_id: {'status', 'booked_count', 'counts'}} одним запросом с группировкой"""
+    summaries = {schedule_id: {'counts': {}} for schedule_id in schedule_ids}
+    rows = (
+        Booking.objects.filter(schedule_id__in=schedule_ids)
+        .with_effective_status()
+        .values_list('schedule_id', 'effective_status')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    for schedule_id, status, total in rows:
+        summaries[schedule_id]['counts'][status] = total
+    for summary in summaries.values():
+        summary['status'] = class_status(set(summary['counts']))
+        summary['booked_count'] = sum(summary['counts'].values())
+    return summaries
+
+
+def occurrence_bookings(class_date):
+    """Записи на занятие в дату class_date (у старых записей class_date может быть не заполнена)"""
+    return Booking.objects.filter(Q(class_date=class_date) | Q(class_date__isnull=True, schedule__date=class_date))
+
+
+def parse_class_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def mark_classes(trainer_profile, schedule_ids, status, class_date=None):
+    """
+    Меняет статус всех записей на занятиях преподавателя в одной транзакции.
+
+    class_date - менять только записи на эту дату. Возвращает (обновлено
+    записей, {schedule_id: сводка}, id чужих или несуществующих занятий).
+    Отмена возвращает занятия на абонементы, выход из отмены списывает их
+    снова (passes.NoClassPass, если абонемент обязателен, а его нет).
+    """
+    with transaction.atomic():
+        own_ids = set(
+            Schedule.objects.filter(id__in=schedule_ids, trainer=trainer_profile).values_list('id', flat=True)
+        )
+        bookings = Booking.objects.all() if class_date is None else occurrence_bookings(class_date)
+        if status == 'cancelled':
+            passes.refund(bookings.filter(schedule_id__in=own_ids))
+        else:
+            passes.recharge(bookings.filter(schedule_id__in=own_ids))
+        updated_count = outbox.update_bookings(
+            bookings.filter(schedule_id__in=own_ids), status=status, updated_at=timezone.now()
+        )
+        summaries = class_summaries(own_ids)
+    return updated_count, summaries, [schedule_id for schedule_id in schedule_ids if schedule_id not in own_ids]
+
+
+NO_PASS_ERROR = 'У клиента нет абонемента с оставшимися занятиями, запись нельзя вернуть из отмены'
+
+MARK_MESSAGES = {
+    'attended': 'Занятие отмечено как проведенное',
+    'cancelled': 'Занятие отмечено как отмененное',
+}
+
+
+def _mark_class(request, schedule_id, class_date, status):
+    if not request.user.is_trainer():
+        return JsonResponse({'success': False, 'error': 'Доступ запрещен'})
+
+    class_date = parse_class_date(class_date)
+    if class_date is None:
+        return JsonResponse({'success': False, 'error': 'Некорректная дата занятия'})
+
+    try:
+        trainer_profile = request.user.trainer_profile
+    except Trainer.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Занятие не найдено'})
+
+    try:
+        updated_count, summaries, not_found = mark_classes(trainer_profile, [schedule_id], status, class_date)
+    except passes.NoClassPass:
+        return JsonResponse({'success': False, 'error': NO_PASS_ERROR})
+    if not_found:
+        return JsonResponse({'success': False, 'error': 'Занятие не найдено'})
+
+    # Страница обновляет только карточку этого занятия
+    return JsonResponse({
+        'success': True,
+        'message': f'{MARK_MESSAGES[status]}. Обновлено записей: {updated_count}',
+        'class': {'schedule_id': schedule_id, **summaries[schedule_id]},
+    })
+
+
 # Отметить занятие как проведенное
 @csrf_exempt
 @login_required
 def mark_class_attended(request, schedule_id, class_date):
+    return _mark_class(request, schedule_id, class_date, 'attended')
+
+
+# Отметить занятие как отмененное
+@csrf_exempt
+@login_required
+def mark_class_cancelled(request, schedule_id, class_date):
+    return _mark_class(request, schedule_id, class_date, 'cancelled')
+
+
+# Отметить несколько занятий одним запросом: schedule_ids и class_dates (по дате на каждое занятие) и status
+@csrf_exempt
+@login_required
+def mark_classes_batch(request):
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Метод не поддерживается'}, status=405)
     if not request.user.is_trainer():
         return JsonResponse({'success': False, 'error': 'Доступ запрещен'})
-    
+
+    status = request.POST.get('status')
+    if status not in MARK_MESSAGES:
+        return JsonResponse({'success': False, 'error': 'Неизвестный статус'})
+    try:
+        schedule_ids = [int(value) for value in request.POST.getlist('schedule_ids')]
+    except ValueError:
+        return JsonResponse({'success': False, 'error': 'Некорректный список занятий'})
+    if not schedule_ids:
+        return JsonResponse({'success': False, 'error': 'Не выбрано ни одного занятия'})
+    class_dates = [parse_class_date(value) for value in request.POST.getlist('class_dates')]
+    if len(class_dates) != len(schedule_ids) or None in class_dates:
+        return JsonResponse({'success': False, 'error': 'Некорректная дата занятия'})
+
     try:
         trainer_profile = request.user.trainer_profile
-        schedule = Schedule.objects.get(id=schedule_id, trainer=trainer_profile)
-        
-        # Находим все записи на это занятие
-        bookings = Booking.objects.filter(schedule=schedule)
-        
-        # Меняем статус на 'attended'
-        updated_count = bookings.update(status='attended')
-        
-        return JsonResponse({
-            'success': True, 
-            'message': f'Занятие отмечено как проведенное. Обновлено записей: {updated_count}'
-        })
-        
-    except (Schedule.DoesNotExist, Trainer.DoesNotExist):
+    except Trainer.DoesNotExist:
         return JsonResponse({'success': False, 'error': 'Занятие не найдено'})
 
+    by_date = {}
+    for schedule_id, class_date in zip(schedule_ids, class_dates):
+        by_date.setdefault(class_date, []).append(schedule_id)
 
-# Отметить занятие как отмененное
+    updated_count, summaries, not_found = 0, {}, []
+    try:
+        with transaction.atomic():
+            for class_date, ids in by_date.items():
+                updated, date_summaries, date_not_found = mark_classes(trainer_profile, ids, status, class_date)
+                updated_count += updated
+                summaries.update(date_summaries)
+                not_found.extend(date_not_found)
+    except passes.NoClassPass:
+        return JsonResponse({'success': False, 'error': NO_PASS_ERROR})
+    return JsonResponse({
+        'success': True,
+        'message': f'Отмечено занятий: {len(summaries)}. Обновлено записей: {updated_count}',
+        'classes': [{'schedule_id': schedule_id, **summary} for schedule_id, summary in summaries.items()],
+        'not_found': not_found,
+    })
+
+
+ROLL_CALL_STATUSES = {'attended', 'missed', 'cancelled'}
+
+
+# Перекличка: статус каждого записавшегося на одно занятие.
+# GET - список записавшихся, POST - {"statuses": {"<client_id>": "attended" | "missed" | "cancelled"}}
 @csrf_exempt
 @login_required
-def mark_class_cancelled(request, schedule_id, class_date):
+def roll_call(request, schedule_id, class_date):
     if not request.user.is_trainer():
         return JsonResponse({'success': False, 'error': 'Доступ запрещен'})
-    
+
+    class_date = parse_class_date(class_date)
+    if class_date is None:
+        return JsonResponse({'success': False, 'error': 'Некорректная дата занятия'})
+
     try:
-        trainer_profile = request.user.trainer_profile
-        schedule = Schedule.objects.get(id=schedule_id, trainer=trainer_profile)
-        
-        bookings = Booking.objects.filter(schedule=schedule)
-        updated_count = bookings.update(status='cancelled')
-        
-        return JsonResponse({
-            'success': True, 
-            'message': f'Занятие отмечено как отмененное. Обновлено записей: {updated_count}'
-        })
-        
+        schedule = Schedule.objects.get(id=schedule_id, trainer=request.user.trainer_profile)
     except (Schedule.DoesNotExist, Trainer.DoesNotExist):
-        return JsonResponse({'success': False, 'error': 'Занятие не найдено'})
\ No newline at end of file
+        return JsonResponse({'success': False, 'error': 'Занятие не найдено'})
+
+    roster = occurrence_bookings(class_date).filter(schedule=schedule)
+
+    if request.method != 'POST':
+        clients = roster.with_effective_status().select_related('client').order_by('client__last_name', 'client__first_name')
+        return JsonResponse({'success': True, 'roster': [
+            {
+                'client_id': booking.client_id,
+                'name': f"{booking.client.first_name} {booking.client.last_name}",
+                'status': booking.effective_status,
+            }
+            for booking in clients
+        ]})
+
+    try:
+        statuses = {int(client_id): status for client_id, status in json.loads(request.body)['statuses'].items()}
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return JsonResponse({'success': False, 'error': 'Некорректные данные переклички'}, status=400)
+    if not statuses:
+        return JsonResponse({'success': False, 'error': 'Не отмечен ни один участник'}, status=400)
+    if not set(statuses.values()) <= ROLL_CALL_STATUSES:
+        return JsonResponse({'success': False, 'error': 'Неизвестный статус'}, status=400)
+
+    with transaction.atomic():
+        # Проверка по списку записавшихся одним запросом; schedule_id и class_date нужны событиям outbox
+        bookings = list(roster.filter(client_id__in=statuses).select_for_update().only(
+            'id', 'schedule_id', 'client_id', 'class_date', 'status',
+        ))
+        unknown = set(statuses) - {booking.client_id for booking in bookings}
+        if unknown:
+            return JsonResponse({
+                'success': False,
+                'error': 'Эти клиенты не записаны на занятие',
+                'unknown_clients': sorted(unknown),
+            }, status=400)
+
+        # Вышедшие из отмены записи оплачиваются заново, до смены статуса
+        try:
+            passes.recharge(Booking.objects.filter(id__in=[
+                booking.id for booking in bookings
+                if booking.status == 'cancelled' and statuses[booking.client_id] != 'cancelled'
+            ]))
+        except passes.NoClassPass:
+            return JsonResponse({'success': False, 'error': NO_PASS_ERROR}, status=400)
+
+        now = timezone.now()
+        changed = []
+        for booking in bookings:
+            if booking.status != statuses[booking.client_id]:
+                booking.status = statuses[booking.client_id]
+                booking.updated_at = now
+                changed.append(booking)
+        Booking.objects.bulk_update(changed, ['status', 'updated_at'])
+        outbox.record_bookings('updated', changed)
+        passes.refund(Booking.objects.filter(id__in=[booking.id for booking in changed if booking.status == 'cancelled']))
+
+        # Агрегат посещаемости за эту дату - в том же проходе, а не ждать refresh_stats
+        if changed:
+            refresh_dates([class_date])
+        summary = class_summaries([schedule.id])[schedule.id]
+
+    return JsonResponse({
+        'success': True,
+        'message': f'Перекличка сохранена. Изменено записей: {len(changed)}',
+        'class': {'schedule_id': schedule.id, **summary},
+    })
+
+
+# Метрики для Prometheus: персонал или scrape по токену METRICS_TOKEN
+def metrics_view(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    authorized = token and request.META.get('HTTP_AUTHORIZATION') == f'Bearer {token}'
+    if not authorized and not (request.user.is_authenticated and request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+# Файлы профиля запроса (см. main.profiler) - только для персонала
+@login_required
+def profile_download(request, profile_id, kind):
+    if not request.user.is_staff:
+        return HttpResponseForbidden()
+    suffixes = {'pstats': '.pstats', 'collapsed': '.collapsed', 'sql': '.sql.txt'}
+    path = profile_path(profile_id, suffixes.get(kind, ''))
+    if kind not in suffixes or path is None or not os.path.exists(path):
+        raise Http404('Профиль не найден')
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=os.path.basename(path))
@@ -0,0 +1,117 @@
+// Функция для отмены записи
+function cancelBooking(bookingId, button) {
+    if (!confirm('Вы уверены, что хотите отменить запись?')) {
+        return;
+    }
+
+    const originalText = button.innerHTML;
+    button.disabled = true;
+    button.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Отменяем...';
+
+    const csrfToken = getCSRFToken();
+
+    if (!csrfToken) {
+        alert('Ошибка безопасности. Пожалуйста, обновите страницу.');
+        button.disabled = false;
+        button.innerHTML = originalText;
+        return;
+    }
+
+    const formData = new FormData();
+    formData.append('csrfmiddlewaretoken', csrfToken);
+
+    fetch(`/cancel-booking/${bookingId}/`, {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': csrfToken,
+            'Idempotency-Key': attemptIdempotencyKey(button),
+        },
+        body: formData
+    })
+    .then(response => finishAttempt(button, response))
+    .then(data => {
+        if (data.success) {
+            // Удаляем элемент с анимацией
+            const bookingElement = button.closest('.booking-item');
+            if (bookingElement) {
+                bookingElement.style.transition = 'all 0.3s ease';
+                bookingElement.style.opacity = '0';
+                bookingElement.style.height = '0';
+                bookingElement.style.margin = '0';
+                bookingElement.style.padding = '0';
+                bookingElement.style.overflow = 'hidden';
+
+                setTimeout(() => {
+                    bookingElement.remove();
+                    checkEmptyBookings();
+                }, 300);
+            }
+            alert('✅ ' + data.message);
+        } else {
+            alert('❌ ' + data.error);
+            button.disabled = false;
+            button.innerHTML = originalText;
+        }
+    })
+    .catch(error => {
+        console.error('Cancel error:', error);
+        alert('❌ Ошибка сети: ' + error.message);
+        button.disabled = false;
+        button.innerHTML = originalText;
+    });
+}
+
+function checkEmptyBookings() {
+    const items = document.querySelectorAll('.booking-item');
+    const container = document.querySelector('.bookings-table');
+
+    if (items.length === 0 && container) {
+        container.innerHTML = `
+            <div class="text-center" style="padding: 3rem;">
+                <i class="fas fa-calendar-plus fa-4x" style="color: var(--accent-primary); margin-bottom: 1rem;"></i>
+                <h4>Нет активных записей</h4>
+                <p style="color: var(--text-secondary); margin-bottom: 1.5rem;">
+                    У вас нет предстоящих занятий. Запишитесь на занятие в расписании!
+                </p>
+                <a href="/schedule/" class="btn btn-primary">
+                    <i class="fas fa-calendar-alt"></i> Перейти к расписанию
+                </a>
+            </div>
+        `;
+    }
+}
+
+// Функция для получения CSRF токена
+function getCSRFToken() {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let i = 0; i < cookies.length; i++) {
+            const cookie = cookies[i].trim();
+            if (cookie.substring(0, 'csrftoken'.length + 1) === ('csrftoken' + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring('csrftoken'.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}
+
+// Ключ идемпотентности: один на попытку (хранится на кнопке), поэтому повтор
+// после сбоя сети или двойной клик получат первый ответ сервера
+function attemptIdempotencyKey(button) {
+    if (!button.dataset.idempotencyKey) {
+        button.dataset.idempotencyKey = (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID()
+            : Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+    }
+    return button.dataset.idempotencyKey;
+}
+
+// Окончательный ответ (не сбой и не 409 "уже выполняется") - следующая попытка будет новой
+function finishAttempt(button, response) {
+    if (response.status < 500 && response.status !== 409) {
+        delete button.dataset.idempotencyKey;
+    }
+    return response.json();
+}
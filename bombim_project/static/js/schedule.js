@@ -0,0 +1,132 @@
+// Функция для получения CSRF токена
+function getCSRFToken() {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let i = 0; i < cookies.length; i++) {
+            const cookie = cookies[i].trim();
+            if (cookie.substring(0, 'csrftoken'.length + 1) === ('csrftoken' + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring('csrftoken'.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}
+
+// Ключ идемпотентности: один на попытку (хранится на кнопке), поэтому повтор
+// после сбоя сети или двойной клик получат первый ответ сервера
+function attemptIdempotencyKey(button) {
+    if (!button.dataset.idempotencyKey) {
+        button.dataset.idempotencyKey = (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID()
+            : Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+    }
+    return button.dataset.idempotencyKey;
+}
+
+// Окончательный ответ (не сбой и не 409 "уже выполняется") - следующая попытка будет новой
+function finishAttempt(button, response) {
+    if (response.status < 500 && response.status !== 409) {
+        delete button.dataset.idempotencyKey;
+    }
+    return response.json();
+}
+
+// Функция для записи на занятие
+function bookClass(scheduleId, button) {
+    if (!confirm('Записаться на это занятие?')) {
+        return;
+    }
+
+    const originalText = button.innerHTML;
+    button.disabled = true;
+    button.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Записываем...';
+
+    const csrfToken = getCSRFToken();
+
+    if (!csrfToken) {
+        alert('Ошибка безопасности. Пожалуйста, обновите страницу.');
+        button.disabled = false;
+        button.innerHTML = originalText;
+        return;
+    }
+
+    const formData = new FormData();
+    formData.append('csrfmiddlewaretoken', csrfToken);
+
+    fetch(`/book/${scheduleId}/`, {
+        method: 'POST',
+        headers: {
+            'X-CSRFToken': csrfToken,
+            'Idempotency-Key': attemptIdempotencyKey(button),
+        },
+        body: formData
+    })
+    .then(response => finishAttempt(button, response))
+    .then(data => {
+        if (data.success && data.queued) {
+            // Запись в режиме открытия - ждем результата по билету
+            button.innerHTML = '<i class="fas fa-spinner fa-spin"></i> В очереди...';
+            pollBookingTicket(data.ticket, scheduleId, button, originalText);
+        } else if (data.success) {
+            // Обновляем интерфейс
+            updateBookingUI(scheduleId, true);
+            alert('✅ ' + data.message);
+        } else {
+            alert('❌ ' + data.error);
+            button.disabled = false;
+            button.innerHTML = originalText;
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        alert('Произошла ошибка при записи');
+        button.disabled = false;
+        button.innerHTML = originalText;
+    });
+}
+
+// Сколько ждать результата заявки из очереди, мс
+const TICKET_POLL_LIMIT = 2 * 60 * 1000;
+
+// Опрашиваем результат заявки из очереди записи
+function pollBookingTicket(ticket, scheduleId, button, originalText, startedAt = Date.now()) {
+    if (Date.now() - startedAt > TICKET_POLL_LIMIT) {
+        alert('❌ Не удалось дождаться результата заявки. Обновите страницу и проверьте запись');
+        button.disabled = false;
+        button.innerHTML = originalText;
+        return;
+    }
+    fetch(`/book/ticket/${ticket}/`)
+    .then(response => response.json())
+    .then(data => {
+        if (data.pending) {
+            setTimeout(() => pollBookingTicket(ticket, scheduleId, button, originalText, startedAt), 1000);
+        } else if (data.success) {
+            updateBookingUI(scheduleId, true);
+            alert('✅ ' + data.message);
+        } else {
+            alert('❌ ' + data.error);
+            button.disabled = false;
+            button.innerHTML = originalText;
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        setTimeout(() => pollBookingTicket(ticket, scheduleId, button, originalText, startedAt), 2000);
+    });
+}
+
+// Обновляем интерфейс после записи
+function updateBookingUI(scheduleId, isBooked) {
+    const buttons = document.querySelectorAll(`[data-schedule-id="${scheduleId}"]`);
+    buttons.forEach(button => {
+        if (isBooked) {
+            button.disabled = true;
+            button.innerHTML = '<i class="fas fa-check"></i> Вы записаны';
+            button.className = 'btn btn-success';
+            button.onclick = null;
+        }
+    });
+}
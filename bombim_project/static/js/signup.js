@@ -0,0 +1,50 @@
+document.addEventListener('DOMContentLoaded', function() {
+    const form = document.getElementById('signup-form');
+    const submitBtn = document.getElementById('submit-btn');
+
+
+    // Валидация пароля в реальном времени
+    const passwordInput = document.querySelector('input[name="password1"]');
+    if (passwordInput) {
+        passwordInput.addEventListener('input', function(e) {
+            checkPasswordStrength(e.target.value);
+        });
+    }
+
+    function checkPasswordStrength(password) {
+        let strength = 0;
+
+        if (password.length >= 8) strength++;
+        if (password.match(/[a-z]/) && password.match(/[A-Z]/)) strength++;
+        if (password.match(/\d/)) strength++;
+        if (password.match(/[^a-zA-Z\d]/)) strength++;
+
+        // Убираем старые индикаторы
+        const oldIndicator = document.querySelector('.password-strength');
+        if (oldIndicator) oldIndicator.remove();
+
+        // Создаем новый индикатор
+        if (password.length > 0) {
+            const indicator = document.createElement('div');
+            indicator.className = 'password-strength';
+
+            if (strength < 2) {
+                indicator.classList.add('strength-weak');
+            } else if (strength < 3) {
+                indicator.classList.add('strength-medium');
+            } else if (strength < 4) {
+                indicator.classList.add('strength-strong');
+            } else {
+                indicator.classList.add('strength-very-strong');
+            }
+
+            passwordInput.parentNode.appendChild(indicator);
+        }
+    }
+
+    // Предотвращение двойной отправки формы
+    form.addEventListener('submit', function() {
+        submitBtn.disabled = true;
+        submitBtn.innerHTML = '<i class="fas fa-spinner fa-spin"></i> Регистрируем...';
+    });
+});
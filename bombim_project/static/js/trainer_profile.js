@@ -0,0 +1,197 @@
+const CLASS_STATUS_BADGES = {
+    attended: ['attended', 'Проведено'],
+    cancelled: ['cancelled', 'Отменено'],
+    missed: ['missed', 'Пропущено'],
+};
+
+// Обновляет карточку занятия по сводке из ответа сервера (без перезагрузки страницы)
+function renderClassSummary(summary) {
+    const item = document.querySelector(`.class-item[data-schedule-id="${summary.schedule_id}"]`);
+    if (!item) return;
+
+    const [badgeClass, badgeText] = CLASS_STATUS_BADGES[summary.status] || ['scheduled', 'Запланировано'];
+    const badge = item.querySelector('.status-badge');
+    badge.className = 'status-badge ' + badgeClass;
+    badge.textContent = badgeText;
+
+    item.querySelector('.booked-count').textContent = summary.booked_count;
+    item.querySelector('.mark-attended').hidden = summary.status === 'attended';
+    item.querySelector('.mark-cancelled').hidden = summary.status === 'cancelled';
+    item.querySelector('.class-checkbox').checked = false;
+}
+
+function markClass(url, confirmText, button) {
+    if (!confirm(confirmText)) return;
+
+    const originalText = button.innerHTML;
+    button.disabled = true;
+    button.innerHTML = '<i class="fas fa-spinner fa-spin"></i>';
+
+    fetch(url, {
+        method: 'POST',
+        headers: {'X-CSRFToken': getCSRFToken()},
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            renderClassSummary(data.class);
+        } else {
+            alert('❌ ' + data.error);
+        }
+    })
+    .catch(() => alert('❌ Ошибка соединения'))
+    .finally(() => {
+        button.disabled = false;
+        button.innerHTML = originalText;
+    });
+}
+
+function markClassAttended(scheduleId, classDate, button) {
+    markClass(`/mark-class-attended/${scheduleId}/${classDate}/`, 'Отметить занятие как проведенное?', button);
+}
+
+function markClassCancelled(scheduleId, classDate, button) {
+    markClass(`/mark-class-cancelled/${scheduleId}/${classDate}/`, 'Отметить занятие как отмененное?', button);
+}
+
+const ROLL_CALL_CHOICES = [
+    ['attended', 'Пришел'],
+    ['missed', 'Не пришел'],
+    ['cancelled', 'Отменено'],
+];
+
+// Перекличка: загружает список записавшихся и показывает его под карточкой занятия
+function toggleRollCall(scheduleId, classDate, button) {
+    const item = button.closest('.class-item');
+    const panel = item.querySelector('.roll-call');
+    if (!panel.hidden) {
+        panel.hidden = true;
+        return;
+    }
+
+    button.disabled = true;
+    fetch(`/roll-call/${scheduleId}/${classDate}/`)
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            alert('❌ ' + data.error);
+            return;
+        }
+        panel.innerHTML = '';
+        data.roster.forEach(entry => {
+            const row = document.createElement('div');
+            row.className = 'roll-call-row';
+            const name = document.createElement('span');
+            name.textContent = entry.name;
+            const select = document.createElement('select');
+            select.dataset.clientId = entry.client_id;
+            ROLL_CALL_CHOICES.forEach(([value, label]) => {
+                select.add(new Option(label, value, false, value === entry.status || (entry.status === 'booked' && value === 'attended')));
+            });
+            row.append(name, select);
+            panel.appendChild(row);
+        });
+
+        const save = document.createElement('button');
+        save.className = 'btn btn-success btn-sm';
+        save.innerHTML = '<i class="fas fa-save"></i> Сохранить перекличку';
+        save.onclick = () => saveRollCall(scheduleId, classDate, panel, save);
+        panel.appendChild(save);
+        panel.hidden = false;
+    })
+    .catch(() => alert('❌ Ошибка соединения'))
+    .finally(() => { button.disabled = false; });
+}
+
+function saveRollCall(scheduleId, classDate, panel, button) {
+    const statuses = {};
+    panel.querySelectorAll('select[data-client-id]').forEach(select => {
+        statuses[select.dataset.clientId] = select.value;
+    });
+
+    const originalText = button.innerHTML;
+    button.disabled = true;
+    button.innerHTML = '<i class="fas fa-spinner fa-spin"></i>';
+
+    fetch(`/roll-call/${scheduleId}/${classDate}/`, {
+        method: 'POST',
+        headers: {'X-CSRFToken': getCSRFToken(), 'Content-Type': 'application/json'},
+        body: JSON.stringify({statuses: statuses}),
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            renderClassSummary(data.class);
+            panel.hidden = true;
+        } else {
+            alert('❌ ' + data.error);
+        }
+    })
+    .catch(() => alert('❌ Ошибка соединения'))
+    .finally(() => {
+        button.disabled = false;
+        button.innerHTML = originalText;
+    });
+}
+
+function toggleAllClasses(checkbox) {
+    document.querySelectorAll('.class-checkbox').forEach(box => { box.checked = checkbox.checked; });
+}
+
+// Отмечает все выбранные занятия одним запросом и одной транзакцией
+function markSelectedClasses(status, button) {
+    const selected = Array.from(document.querySelectorAll('.class-checkbox:checked'));
+    if (!selected.length) {
+        alert('Выберите занятия');
+        return;
+    }
+    const question = status === 'attended' ? 'Отметить выбранные занятия как проведенные?'
+                                            : 'Отметить выбранные занятия как отмененные?';
+    if (!confirm(question)) return;
+
+    const body = new URLSearchParams({status: status});
+    selected.forEach(box => {
+        body.append('schedule_ids', box.value);
+        body.append('class_dates', box.dataset.classDate);
+    });
+
+    const originalText = button.innerHTML;
+    button.disabled = true;
+    button.innerHTML = '<i class="fas fa-spinner fa-spin"></i>';
+
+    fetch('/mark-classes/', {
+        method: 'POST',
+        headers: {'X-CSRFToken': getCSRFToken()},
+        body: body,
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (data.success) {
+            data.classes.forEach(renderClassSummary);
+            document.getElementById('select-all-classes').checked = false;
+        } else {
+            alert('❌ ' + data.error);
+        }
+    })
+    .catch(() => alert('❌ Ошибка соединения'))
+    .finally(() => {
+        button.disabled = false;
+        button.innerHTML = originalText;
+    });
+}
+
+// Функция для получения CSRF токена
+function getCSRFToken() {
+    let cookieValue = null;
+    if (document.cookie && document.cookie !== '') {
+        const cookies = document.cookie.split(';');
+        for (let i = 0; i < cookies.length; i++) {
+            const cookie = cookies[i].trim();
+            if (cookie.substring(0, 'csrftoken'.length + 1) === ('csrftoken' + '=')) {
+                cookieValue = decodeURIComponent(cookie.substring('csrftoken'.length + 1));
+                break;
+            }
+        }
+    }
+    return cookieValue;
+}